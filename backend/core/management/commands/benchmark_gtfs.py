@@ -0,0 +1,440 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.utils.gtfs_utils import (
+    SNAPSHOT_DIR, build_spatial_index, calculate_path, get_departure_board, load_gtfs_data, response_cache,
+    search_routes_by_name, search_stops,
+)
+from core.utils.snapshot import current_version
+from core.utils.travel_matrix import MATRIX_PARALLEL_MIN_ORIGINS, MatrixPool
+
+
+# Run in a fresh interpreter so each load path starts from a cold process.
+STARTUP_PROBE = """
+import json, os, time
+import django
+django.setup()
+
+def memory_kb():
+    fields = {}
+    for name in ("/proc/self/status", "/proc/self/smaps_rollup"):
+        if os.path.exists(name):
+            with open(name) as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if value.strip().endswith("kB"):
+                        fields[key] = int(value.split()[0])
+    return fields.get("VmRSS", 0), fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+
+from core.utils import gtfs_utils
+rss_before, private_before = memory_kb()
+started = time.perf_counter()
+gtfs_data = gtfs_utils.load_gtfs_data()
+gtfs_utils.build_spatial_index(gtfs_data)
+gtfs_data.footpaths
+elapsed = time.perf_counter() - started
+rss_after, private_after = memory_kb()
+print(json.dumps({
+    "load_ms": elapsed * 1000,
+    "rss_mib": (rss_after - rss_before) / 1024,
+    "private_mib": (private_after - private_before) / 1024,
+}))
+"""
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def _timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark GTFS query paths against their alternatives'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', choices=['frequencies', 'routing', 'spatial', 'startup', 'cache', 'search', 'backends', 'calendar', 'matrix'], default='frequencies')
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.gtfs_data = load_gtfs_data()
+        getattr(self, f"bench_{options['suite']}")(options['queries'])
+
+    def report(self, label, value, unit):
+        self.stdout.write(f'  {label:<40} {value:>10.3f} {unit}')
+
+    # --- frequencies.txt expansion ---
+    def eager_expand(self):
+        """Materialise every vehicle of every frequency trip as per-stop sorted arrays."""
+        g = self.gtfs_data
+        freq = g.frequencies
+        stops, departures, rows = [], [], []
+        for trip_idx in np.flatnonzero(freq.trip_is_frequency):
+            trip_rows = np.arange(g.trip_offsets[trip_idx], g.trip_offsets[trip_idx + 1])
+            offsets = g.st_departure[trip_rows] - freq.trip_base[trip_idx]
+            for vehicle in freq.trip_starts(trip_idx, 0, 2 * 24 * 3600):
+                stops.append(g.st_stop[trip_rows])
+                departures.append(vehicle + offsets)
+                rows.append(trip_rows)
+        stops, departures, rows = np.concatenate(stops), np.concatenate(departures), np.concatenate(rows)
+        order = np.lexsort((departures, stops))
+        offsets = np.searchsorted(stops[order], np.arange(len(g.stop_ids) + 1))
+        return departures[order], rows[order], offsets
+
+    def bench_frequencies(self, queries):
+        g = self.gtfs_data
+        stop_idxs = [random.randrange(len(g.stop_ids)) for _ in range(queries)]
+        windows = [random.randrange(5 * 3600, 22 * 3600) for _ in range(queries)]
+
+        tracemalloc.start()
+        departures, rows, offsets = self.eager_expand()
+        eager_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        def eager():
+            for stop_idx, start in zip(stop_idxs, windows):
+                lo, hi = offsets[stop_idx], offsets[stop_idx + 1]
+                first = lo + np.searchsorted(departures[lo:hi], start)
+                rows[first:min(hi, first + 10)].tolist()
+
+        def lazy():
+            for stop_idx, start in zip(stop_idxs, windows):
+                list(islice(g.frequencies.departures(stop_idx, start, start + 1800), 10))
+
+        freq = g.frequencies
+        lazy_bytes = sum(a.nbytes for a in (
+            freq.prog_row, freq.prog_first, freq.prog_last, freq.prog_headway, freq.stop_prog_offsets,
+        ))
+        self.stdout.write(self.style.NOTICE(f'frequencies.txt expansion ({queries} boards of 10)'))
+        self.report('eager expanded stop times', len(departures), 'rows')
+        self.report('eager memory', eager_bytes / 2**20, 'MiB')
+        self.report('lazy progression memory', lazy_bytes / 2**20, 'MiB')
+        self.report('eager board latency', _timed(eager, 1) / queries * 1000, 'us/query')
+        self.report('lazy board latency', _timed(lazy, 1) / queries * 1000, 'us/query')
+
+    # --- journey planning ---
+    def bench_routing(self, queries):
+        g = self.gtfs_data
+        g.network
+        stop_ids = g.stop_ids.tolist()
+        samples, found = [], 0
+        for _ in range(queries):
+            start, end = random.choice(stop_ids), random.choice(stop_ids)
+            depart_at = datetime(2020, 1, 1, random.randrange(6, 20), random.randrange(60))
+            began = time.perf_counter()
+            found += bool(calculate_path.__wrapped__(g, start, end, depart_at=depart_at, max_transfers=3))
+            samples.append((time.perf_counter() - began) * 1000)
+
+        self.stdout.write(self.style.NOTICE(f'RAPTOR calculate_path ({queries} random stop pairs)'))
+        self.report('pairs with an itinerary', found, 'pairs')
+        self.report('p50 latency', _percentile(samples, 50), 'ms')
+        self.report('p95 latency', _percentile(samples, 95), 'ms')
+        self.report('max latency', max(samples), 'ms')
+
+    # --- service calendar ---
+    def bench_calendar(self, queries):
+        g = self.gtfs_data
+        g.network
+        calendar = g.calendar
+        stop_ids = g.stop_ids.tolist()
+        pairs = [(random.choice(stop_ids), random.choice(stop_ids), random.randrange(6, 20)) for _ in range(queries)]
+        # a day inside the feed period is filtered, one past its end with strict_calendar=False is not
+        inside = calendar.start or datetime.now().date()
+        outside = calendar.end + timedelta(days=365) if calendar.end else inside
+        n_paths = max(1, queries // 10)
+
+        def boards(day):
+            for stop_id, _, hour in pairs:
+                at = datetime.combine(day, datetime.min.time()).replace(hour=hour)
+                get_departure_board.__wrapped__(g, stop_id, time_window=60, at=at, limit=10)
+
+        def paths(day):
+            for start, end, hour in pairs[:n_paths]:
+                at = datetime.combine(day, datetime.min.time()).replace(hour=hour)
+                calculate_path.__wrapped__(g, start, end, depart_at=at, max_transfers=3)
+
+        self.stdout.write(self.style.NOTICE(f'Service calendar filter ({queries} boards, {n_paths} paths)'))
+        self.report('services', len(calendar), '')
+        self.report('calendar days', int(calendar.period[1]), 'days')
+        self.report('bitset memory', calendar.bits.nbytes / 2**10, 'KiB')
+        self.report('active services lookup', _timed(lambda: calendar.services_on(inside), queries) * 1000, 'us')
+        self.report('board latency, unfiltered', _timed(lambda: boards(outside), 1) / queries * 1000, 'us/query')
+        self.report('board latency, filtered by date', _timed(lambda: boards(inside), 1) / queries * 1000, 'us/query')
+        paths(inside)  # builds the day's per-pattern trip lists
+        self.report('path latency, unfiltered', _timed(lambda: paths(outside), 1) / n_paths, 'ms/query')
+        self.report('path latency, filtered by date', _timed(lambda: paths(inside), 1) / n_paths, 'ms/query')
+
+    # --- travel-time matrix ---
+    def bench_matrix(self, queries):
+        g = self.gtfs_data
+        g.network
+        n = min(queries, len(g.stop_ids))
+        stops = random.sample(range(len(g.stop_ids)), n)
+        depart_secs, day = 8 * 3600, g.calendar.start or datetime.now().date()
+        args = (stops, stops, depart_secs, depart_secs + 3 * 3600, 2, day, False)
+        counts = sorted({1, *(2 ** i for i in range(8) if 2 ** i <= (os.cpu_count() or 1)), os.cpu_count() or 1})
+
+        self.stdout.write(self.style.NOTICE(f'Travel-time matrix ({n}x{n} stops, 180 min)'))
+        baseline = None
+        for workers in counts:
+            pool = MatrixPool(workers=workers)
+            try:
+                # start the workers and load their feed before timing
+                pool.rows(g, stops[:MATRIX_PARALLEL_MIN_ORIGINS], *args[1:])
+                elapsed = _timed(lambda: pool.rows(g, *args), 1) / 1000
+            finally:
+                pool.shutdown()
+            baseline = baseline or elapsed
+            self.report(f'{workers} worker(s)', n / elapsed, f'origins/s ({baseline / elapsed:.2f}x)')
+
+    # --- nearest stops ---
+    def bench_spatial(self, queries):
+        import geopandas as gpd
+        import pandas as pd
+        from rtree import index as rtree_index
+        from shapely.geometry import Point
+
+        g = self.gtfs_data
+        points = [
+            (random.uniform(g.stop_lat.min(), g.stop_lat.max()), random.uniform(g.stop_lon.min(), g.stop_lon.max()))
+            for _ in range(queries)
+        ]
+
+        def rtree_build():
+            stops_df = pd.DataFrame({'stop_lat': g.stop_lat, 'stop_lon': g.stop_lon})
+            stops_df['geometry'] = stops_df.apply(lambda row: Point(row['stop_lon'], row['stop_lat']), axis=1)
+            gdf = gpd.GeoDataFrame(stops_df, geometry='geometry', crs='EPSG:4326')
+            idx = rtree_index.Index()
+            for i, row in gdf.iterrows():
+                idx.insert(i, row.geometry.bounds)
+            return gdf, idx
+
+        started = time.perf_counter()
+        gdf, rtree_idx = rtree_build()
+        rtree_build_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        grid = build_spatial_index(g)
+        grid_build_ms = (time.perf_counter() - started) * 1000
+
+        def rtree_queries():
+            for lat, lon in points:
+                buffer = Point(lon, lat).buffer(1.0 / 111)
+                matches = gdf.iloc[list(rtree_idx.intersection(buffer.bounds))]
+                matches[matches['geometry'].within(buffer)]
+
+        def grid_radius():
+            for lat, lon in points:
+                grid.within(lat, lon, 1000)
+
+        def grid_knn():
+            for lat, lon in points:
+                grid.nearest(lat, lon, 10)
+
+        self.stdout.write(self.style.NOTICE(f'Nearest stops ({len(g.stop_ids)} stops, {queries} queries, 1km)'))
+        self.report('rtree + GeoDataFrame build', rtree_build_ms, 'ms')
+        self.report('grid build', grid_build_ms, 'ms')
+        self.report('rtree radius query', _timed(rtree_queries, 1) / queries * 1000, 'us/query')
+        self.report('grid radius query (haversine, sorted)', _timed(grid_radius, 1) / queries * 1000, 'us/query')
+        self.report('grid k=10 nearest query', _timed(grid_knn, 1) / queries * 1000, 'us/query')
+
+    # --- worker start-up ---
+    def probe_startup(self, use_snapshot):
+        env = dict(os.environ, GTFS_USE_SNAPSHOT='1' if use_snapshot else '0')
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'transit_backend.settings')
+        result = subprocess.run(
+            [sys.executable, '-c', STARTUP_PROBE], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def bench_startup(self, queries):
+        if current_version(SNAPSHOT_DIR) is None:
+            self.stdout.write(self.style.WARNING('No current snapshot in use; run compile_gtfs first.'))
+        runs = 3
+        csv = [self.probe_startup(False) for _ in range(runs)]
+        snapshot = [self.probe_startup(True) for _ in range(runs)]
+
+        self.stdout.write(self.style.NOTICE(f'Feed load in a fresh process (best of {runs})'))
+        for label, samples in (('CSV load_gtfs_data', csv), ('mmap snapshot', snapshot)):
+            self.report(f'{label} time', min(s['load_ms'] for s in samples), 'ms')
+            self.report(f'{label} RSS growth', min(s['rss_mib'] for s in samples), 'MiB')
+            self.report(f'{label} private memory growth', min(s['private_mib'] for s in samples), 'MiB')
+
+    # --- result cache ---
+    def bench_cache(self, queries):
+        from concurrent.futures import ThreadPoolExecutor
+
+        g = self.gtfs_data
+        # bursty, skewed traffic: a few busy stops take most departure-board requests
+        weights = 1.0 / np.arange(1, len(g.stop_ids) + 1)
+        stop_ids = np.random.default_rng(0).choice(g.stop_ids, size=queries, p=weights / weights.sum()).tolist()
+        at = datetime(2020, 1, 1, 8, 0)
+
+        def run(fn):
+            samples = []
+            for stop_id in stop_ids:
+                began = time.perf_counter()
+                fn(g, stop_id, time_window=60, at=at, limit=10)
+                samples.append((time.perf_counter() - began) * 1000)
+            return samples
+
+        uncached = run(get_departure_board.__wrapped__)
+        response_cache.local.clear()
+        cached = run(get_departure_board)
+
+        # a burst of identical cold requests should compute once
+        busiest = stop_ids[0]
+        late = datetime(2020, 1, 1, 21, 0)
+        before = response_cache.stats_by_name['departure_board'].misses
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(lambda _: get_departure_board(g, busiest, time_window=60, at=late), range(64)))
+        computed = response_cache.stats_by_name['departure_board'].misses - before
+
+        self.stdout.write(self.style.NOTICE(f'Departure board result cache ({queries} Zipf-distributed requests)'))
+        self.report('uncached p50', _percentile(uncached, 50), 'ms')
+        self.report('uncached p95', _percentile(uncached, 95), 'ms')
+        self.report('cached p50', _percentile(cached, 50), 'ms')
+        self.report('cached p95', _percentile(cached, 95), 'ms')
+        self.report('hit rate', response_cache.stats_by_name['departure_board'].as_dict()['hit_rate'], '')
+        self.report('computations for 64 concurrent cold requests', computed, '')
+
+    # --- typeahead search ---
+    def typeahead(self, names, queries):
+        """One request per keystroke while typing randomly chosen names."""
+        typed = []
+        while len(typed) < queries:
+            name = random.choice(names)
+            typed.extend(name[:n] for n in range(1, len(name) + 1))
+        return typed[:queries]
+
+    def bench_search(self, queries):
+        import pandas as pd
+
+        g = self.gtfs_data
+        names = g.route_short_names.tolist() + g.route_long_names.tolist()
+        keystrokes = self.typeahead(names, queries)
+        routes = list(g.routes.values())
+
+        def dataframe_search(query):
+            # the original implementation: a DataFrame per request, substring on long names
+            df = pd.DataFrame(routes)
+            return df[df['route_long_name'].str.contains(query, case=False, na=False, regex=False)]
+
+        started = time.perf_counter()
+        g.__dict__.pop('route_search_index', None)
+        g.route_search_index
+        build_ms = (time.perf_counter() - started) * 1000
+
+        def run(fn):
+            samples = []
+            for query in keystrokes:
+                began = time.perf_counter()
+                fn(query)
+                samples.append((time.perf_counter() - began) * 1000)
+            return samples
+
+        baseline = run(dataframe_search)
+        indexed = run(lambda query: search_routes_by_name.__wrapped__(g, query, limit=10))
+
+        self.stdout.write(self.style.NOTICE(f'Route search typeahead ({len(keystrokes)} keystrokes, {len(routes)} routes)'))
+        self.report('index build', build_ms, 'ms')
+        self.report('DataFrame str.contains p50', _percentile(baseline, 50), 'ms')
+        self.report('DataFrame str.contains p95', _percentile(baseline, 95), 'ms')
+        self.report('search index p50', _percentile(indexed, 50), 'ms')
+        self.report('search index p95', _percentile(indexed, 95), 'ms')
+
+        stop_keystrokes = self.typeahead(sorted(set(g.stop_names.tolist())), queries)
+        started = time.perf_counter()
+        g.__dict__.pop('stop_search_index', None)
+        g.stop_search_index
+        stop_build_ms = (time.perf_counter() - started) * 1000
+        near = (float(np.median(g.stop_lat)), float(np.median(g.stop_lon)))
+        by_name, by_distance = [], []
+        for query in stop_keystrokes:
+            began = time.perf_counter()
+            search_stops(g, query, limit=10)
+            by_name.append((time.perf_counter() - began) * 1000)
+            began = time.perf_counter()
+            search_stops(g, query, near=near, limit=10)
+            by_distance.append((time.perf_counter() - began) * 1000)
+
+        self.stdout.write(self.style.NOTICE(
+            f'Stop search typeahead ({len(stop_keystrokes)} keystrokes, {len(g.stop_ids)} stops)'
+        ))
+        self.report('index build', stop_build_ms, 'ms')
+        self.report('by name p50', _percentile(by_name, 50), 'ms')
+        self.report('by name p95', _percentile(by_name, 95), 'ms')
+        self.report('by name max', max(by_name), 'ms')
+        self.report('by name and distance p50', _percentile(by_distance, 50), 'ms')
+        self.report('by name and distance p95', _percentile(by_distance, 95), 'ms')
+        self.report('by name and distance max', max(by_distance), 'ms')
+
+    # --- in-memory dataset vs database tables ---
+    def bench_backends(self, queries):
+        from core.utils import db_queries, gtfs_utils
+
+        g = self.gtfs_data
+        g.network
+        spatial_idx = build_spatial_index(g)
+        db_feed = db_queries.DatabaseFeed()
+        stop_ids = g.stop_ids.tolist()
+        trip_ids = g.trip_ids.tolist()
+        cases = {
+            'nearest_stops': lambda m, feed: m.find_nearest_stops(
+                (random.uniform(g.stop_lat.min(), g.stop_lat.max()), random.uniform(g.stop_lon.min(), g.stop_lon.max())),
+                feed, spatial_idx, radius_km=1.0,
+            ),
+            'routes_by_stop': lambda m, feed: m.get_routes_by_stops(feed, random.sample(stop_ids, 5)),
+            'departure_board': lambda m, feed: m.get_departure_board.__wrapped__(
+                feed, random.choice(stop_ids), time_window=60,
+                at=datetime(2020, 1, 1, random.randrange(5, 23), random.randrange(60)), limit=10,
+            ),
+            'trip_stops': lambda m, feed: m.get_trips_stops(feed, random.sample(trip_ids, 5)),
+            'calculate_path': lambda m, feed: m.calculate_path.__wrapped__(
+                feed, random.choice(stop_ids), random.choice(stop_ids),
+                depart_at=datetime(2020, 1, 1, random.randrange(6, 20), random.randrange(60)), max_transfers=1,
+            ),
+        }
+
+        self.stdout.write(self.style.NOTICE(f'In-memory dataset vs database tables ({queries} queries per endpoint)'))
+        for name, case in cases.items():
+            seed = random.random()
+            results, samples = {}, {}
+            for label, module, feed in (('memory', gtfs_utils, g), ('db', db_queries, db_feed)):
+                random.seed(seed)  # both backends answer the same queries
+                results[label], samples[label] = [], []
+                for _ in range(queries):
+                    began = time.perf_counter()
+                    results[label].append(case(module, feed))
+                    samples[label].append((time.perf_counter() - began) * 1000)
+            for label in ('memory', 'db'):
+                self.report(f'{name} {label} p50', _percentile(samples[label], 50), 'ms')
+                self.report(f'{name} {label} p95', _percentile(samples[label], 95), 'ms')
+            if name == 'calculate_path':
+                # the database backend changes at most once, so compare the earliest arrival only
+                same = sum(
+                    (m[-1]['arrival_time'] if m else None) == (d[-1]['arrival_time'] if d else None)
+                    for m, d in zip(results['memory'], results['db'])
+                )
+            else:
+                same = sum(m == d for m, d in zip(results['memory'], results['db']))
+            self.report(f'{name} identical results', same / queries * 100, '%')
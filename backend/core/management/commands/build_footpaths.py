@@ -0,0 +1,28 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.utils.footpaths import TRANSFER_RADIUS_M, WALK_SPEED_MPS, compute_footpaths
+from core.utils.gtfs_utils import FOOTPATHS_PATH, load_gtfs_data
+
+
+class Command(BaseCommand):
+    help = 'Precompute walking transfers between nearby stops'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--radius', type=float, default=TRANSFER_RADIUS_M, help='Max walk in metres')
+        parser.add_argument('--walk-speed', type=float, default=WALK_SPEED_MPS, help='Metres per second')
+        parser.add_argument('--output', default=FOOTPATHS_PATH)
+
+    def handle(self, *args, **options):
+        gtfs_data = load_gtfs_data()
+        started = time.perf_counter()
+        footpaths = compute_footpaths(gtfs_data, options['radius'], options['walk_speed'])
+        elapsed = time.perf_counter() - started
+        footpaths.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✔ {len(footpaths)} footpaths between {len(gtfs_data.stop_ids)} stops '
+            f'in {elapsed:.2f}s → {os.path.relpath(options["output"])}'
+        ))
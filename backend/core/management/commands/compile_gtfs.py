@@ -0,0 +1,52 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.utils.gtfs_utils import (
+    GTFSDataset, SNAPSHOT_DIR, compile_gtfs_snapshot, feed_store, publish_feed,
+    read_gtfs_tables,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compile the GTFS feed into a versioned, memory-mappable snapshot'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=3, help='Snapshot versions to keep on disk')
+        parser.add_argument('--publish', action='store_true',
+                            help='Also publish the feed to Redis and make it the current version')
+        parser.add_argument('--retire-ttl', type=int, default=3600,
+                            help='Seconds the previous Redis feed version is kept after --publish')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        tables, version = read_gtfs_tables(use_cache=False)
+        gtfs_data = GTFSDataset(tables)
+        gtfs_data.spatial_index
+        gtfs_data.footpaths
+        built = time.perf_counter()
+
+        gtfs_data.version = version
+        path = compile_gtfs_snapshot(gtfs_data, version, keep=options['keep'])
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✔ Compiled GTFS snapshot {version} ({size / 2**20:.1f} MiB) → {os.path.relpath(path)}'
+        ))
+        self.stdout.write(
+            f'  build {built - started:.2f}s, write {time.perf_counter() - built:.2f}s; '
+            f'current snapshot in {os.path.relpath(SNAPSHOT_DIR)}'
+        )
+
+        if options['publish']:
+            previous = feed_store.current_version()
+            if publish_feed(gtfs_data, tables):
+                if previous and previous != version:
+                    feed_store.retire(previous, ttl=options['retire_ttl'])
+                self.stdout.write(self.style.SUCCESS(f'✔ Published feed {version} to Redis'))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f'Feed {version} not published (Redis unavailable or version already present)'
+                ))
@@ -0,0 +1,51 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from core.models import Stop
+from core.utils import db_queries, gtfs_utils
+from core.utils.gtfs_utils import TILE_DIR, tile_cache
+from core.utils.tiles import MAX_TILE_ZOOM, SHAPES_MIN_ZOOM, tiles_covering
+
+
+class Command(BaseCommand):
+    help = 'Pre-render the low-zoom vector tiles of the current feed into the tile cache'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-zoom', type=int, default=SHAPES_MIN_ZOOM)
+        parser.add_argument('--max-zoom', type=int, default=13,
+                            help='Higher zooms have many tiles and are rendered on demand')
+        parser.add_argument('--local-only', action='store_true',
+                            help='Write tiles to the local tile directory only, not to Redis')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['min_zoom'] <= options['max_zoom'] <= MAX_TILE_ZOOM:
+            raise CommandError(f'Zooms must satisfy 0 <= --min-zoom <= --max-zoom <= {MAX_TILE_ZOOM}')
+        queries, feed, bounds = self.load_feed()
+        self.stdout.write(f'Rendering tiles of feed {feed.version} into {os.path.relpath(TILE_DIR)}')
+        for z in range(options['min_zoom'], options['max_zoom'] + 1):
+            started = time.perf_counter()
+            tiles = size = 0
+            for x, y in tiles_covering(*bounds, z):
+                data = queries.render_vector_tile(feed, z, x, y)
+                tile_cache.put(feed.version, z, x, y, data, shared=not options['local_only'])
+                tiles += 1
+                size += len(data)
+            self.stdout.write(
+                f'  z{z:<3} {tiles:>6} tiles {size / 2**10:>9.1f} KiB in {time.perf_counter() - started:.2f}s'
+            )
+        self.stdout.write(self.style.SUCCESS(f'✔ Rendered zooms {options["min_zoom"]}-{options["max_zoom"]}'))
+
+    def load_feed(self):
+        """(query module, feed, (west, south, east, north) of its stops) for the configured GTFS_BACKEND."""
+        if os.getenv("GTFS_BACKEND", "memory") == "db":
+            extent = Stop.objects.aggregate(west=Min('lon'), south=Min('lat'), east=Max('lon'), north=Max('lat'))
+            if extent['west'] is None:
+                raise CommandError('The feed tables are empty; run import_gtfs first')
+            return db_queries, db_queries.DatabaseFeed(), tuple(extent[k] for k in ('west', 'south', 'east', 'north'))
+        feed = gtfs_utils.load_gtfs_data()
+        extent = (feed.stop_lon.min(), feed.stop_lat.min(), feed.stop_lon.max(), feed.stop_lat.max())
+        return gtfs_utils, feed, tuple(float(v) for v in extent)
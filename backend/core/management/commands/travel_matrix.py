@@ -0,0 +1,97 @@
+import os
+import random
+import time
+from datetime import datetime
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.gtfs_utils import load_gtfs_data
+from core.utils.travel_matrix import MATRIX_MAX_MINUTES, MATRIX_WORKERS, UNREACHABLE, MatrixPool
+
+
+def read_stop_ids(value):
+    """Comma-separated stop ids, or @path to a file with one id per line."""
+    if value.startswith('@'):
+        with open(value[1:], encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    return [stop_id.strip() for stop_id in value.split(',') if stop_id.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Compute a stop-to-stop travel-time matrix on a process pool, for offline bulk runs'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--origins', help='Comma-separated stop ids or @file (default: --sample stops)')
+        parser.add_argument('--destinations', help='Comma-separated stop ids or @file (default: the origins)')
+        parser.add_argument('--sample', type=int, default=100, help='Random stops to use when --origins is omitted')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--depart-at', help='ISO datetime or HH:MM[:SS] (default: now)')
+        parser.add_argument('--date', help='Service date YYYY-MM-DD for a bare --depart-at time')
+        parser.add_argument('--max-minutes', type=int, default=MATRIX_MAX_MINUTES)
+        parser.add_argument('--max-transfers', type=int, default=2)
+        parser.add_argument('--workers', type=int, default=MATRIX_WORKERS)
+        parser.add_argument('--output', help='Write the matrix as .npy (seconds, -1 unreachable) or .csv')
+
+    def handle(self, *args, **options):
+        gtfs_data = load_gtfs_data()
+        if options['origins']:
+            origins = read_stop_ids(options['origins'])
+        else:
+            origins = random.Random(options['seed']).sample(gtfs_data.stop_ids.tolist(), options['sample'])
+        destinations = read_stop_ids(options['destinations']) if options['destinations'] else origins
+        unknown = [stop_id for stop_id in origins + destinations if stop_id not in gtfs_data.stop_index]
+        if unknown:
+            raise CommandError(f'Unknown stops: {", ".join(unknown[:10])}')
+
+        depart_at = self.depart_at(options['depart_at'], options['date'])
+        depart_secs = depart_at.hour * 3600 + depart_at.minute * 60 + depart_at.second
+        strict_calendar = bool(options['date']) or '-' in (options['depart_at'] or '')
+
+        pool = MatrixPool(workers=options['workers'])
+        self.stdout.write(
+            f'{len(origins)}x{len(destinations)} matrix of feed {gtfs_data.version} at {depart_at.isoformat()} '
+            f'on {options["workers"]} worker(s)'
+        )
+        started = time.perf_counter()
+        try:
+            rows = pool.rows(
+                gtfs_data,
+                [gtfs_data.stop_index[stop_id] for stop_id in origins],
+                [gtfs_data.stop_index[stop_id] for stop_id in destinations],
+                depart_secs, depart_secs + options['max_minutes'] * 60, options['max_transfers'],
+                depart_at.date(), strict_calendar,
+            )
+        finally:
+            pool.shutdown()
+        elapsed = time.perf_counter() - started
+
+        reached = rows != UNREACHABLE
+        self.stdout.write(
+            f'  {elapsed:.2f}s, {len(origins) / elapsed:.1f} origins/s; '
+            f'{reached.mean() * 100:.1f}% of pairs within {options["max_minutes"]} min'
+        )
+        if reached.any():
+            self.stdout.write(f'  median travel time {np.median(rows[reached]) / 60:.1f} min')
+
+        if options['output']:
+            path = options['output']
+            if path.endswith('.npy'):
+                np.save(path, rows)
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(','.join(['origin'] + destinations) + '\n')
+                    for stop_id, row in zip(origins, rows.tolist()):
+                        f.write(','.join([stop_id] + ['' if v == UNREACHABLE else str(v) for v in row]) + '\n')
+            self.stdout.write(f'  wrote {os.path.relpath(path)}')
+        self.stdout.write(self.style.SUCCESS(f'✔ Computed {rows.size} travel times'))
+
+    def depart_at(self, value, date_str):
+        now = datetime.now().replace(microsecond=0)
+        if value and ('T' in value or '-' in value):
+            return datetime.fromisoformat(value)
+        try:
+            return datetime.fromisoformat(f'{date_str or now.date().isoformat()}T{value or now.time().isoformat()}')
+        except ValueError as e:
+            raise CommandError(f'Bad --depart-at/--date: {e}')
@@ -0,0 +1,126 @@
+# Generated by Django 5.2.2 on 2026-10-17 21:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_savedroute_triphistory_user_userpreference_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Agency',
+            fields=[
+                ('agency_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('url', models.URLField()),
+                ('timezone', models.CharField(max_length=64)),
+                ('lang', models.CharField(blank=True, max_length=10, null=True)),
+                ('phone', models.CharField(blank=True, max_length=64, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Calendar',
+            fields=[
+                ('service_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('monday', models.BooleanField()),
+                ('tuesday', models.BooleanField()),
+                ('wednesday', models.BooleanField()),
+                ('thursday', models.BooleanField()),
+                ('friday', models.BooleanField()),
+                ('saturday', models.BooleanField()),
+                ('sunday', models.BooleanField()),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Stop',
+            fields=[
+                ('stop_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('code', models.CharField(blank=True, max_length=64, null=True)),
+                ('location_type', models.IntegerField(default=0)),
+                ('parent_station', models.CharField(blank=True, max_length=64, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CalendarDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_id', models.CharField(max_length=64)),
+                ('date', models.DateField()),
+                ('exception_type', models.IntegerField()),
+            ],
+            options={
+                'unique_together': {('service_id', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Route',
+            fields=[
+                ('route_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('short_name', models.CharField(blank=True, max_length=64, null=True)),
+                ('long_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('route_type', models.IntegerField()),
+                ('color', models.CharField(blank=True, max_length=6, null=True)),
+                ('text_color', models.CharField(blank=True, max_length=6, null=True)),
+                ('agency', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.agency')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Shape',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shape_id', models.CharField(max_length=64)),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('sequence', models.IntegerField()),
+            ],
+            options={
+                'unique_together': {('shape_id', 'sequence')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Trip',
+            fields=[
+                ('trip_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('service_id', models.CharField(max_length=64)),
+                ('headsign', models.CharField(blank=True, max_length=255, null=True)),
+                ('direction_id', models.IntegerField(blank=True, null=True)),
+                ('shape_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.route')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Frequency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_secs', models.IntegerField()),
+                ('end_secs', models.IntegerField()),
+                ('headway_secs', models.IntegerField()),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.trip')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StopTime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arrival_secs', models.IntegerField()),
+                ('departure_secs', models.IntegerField()),
+                ('stop_sequence', models.IntegerField()),
+                ('stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.stop')),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.trip')),
+            ],
+            options={
+                'ordering': ['trip', 'stop_sequence'],
+                'unique_together': {('trip', 'stop_sequence')},
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.2 on 2026-10-17 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_gtfs_feed_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=12)),
+                ('file_hashes', models.JSONField(default=dict)),
+                ('changes', models.JSONField(default=dict)),
+                ('incremental', models.BooleanField(default=False)),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-imported_at', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='agency',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='calendar',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='calendardate',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='frequency',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='shape',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='stop',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='stoptime',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='row_hash',
+            field=models.CharField(default='', editable=False, max_length=16),
+        ),
+        migrations.AlterUniqueTogether(
+            name='frequency',
+            unique_together={('trip', 'start_secs')},
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.2 on 2026-10-17 21:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_feed_versions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stop',
+            index=models.Index(fields=['lat', 'lon'], name='stop_lat_lon'),
+        ),
+        migrations.AddIndex(
+            model_name='stoptime',
+            index=models.Index(fields=['stop', 'departure_secs'], name='stoptime_stop_departure'),
+        ),
+    ]
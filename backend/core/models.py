@@ -25,3 +25,115 @@ class TripHistory(models.Model):
     trip_id = models.CharField(max_length=20)
     stop_id = models.CharField(max_length=20)
     datetime = models.DateTimeField(auto_now_add=True)
+
+
+# --- GTFS feed tables (loaded by the import_gtfs command) ---
+# Times are stored as seconds since service-day midnight: GTFS times run past
+# 24:00:00 for trips that continue after midnight, which TimeField cannot hold.
+
+class FeedRow(models.Model):
+    """Base for feed tables; row_hash lets incremental imports skip unchanged rows."""
+    row_hash = models.CharField(max_length=16, default='', editable=False)
+
+    class Meta:
+        abstract = True
+
+class Agency(FeedRow):
+    agency_id = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    url = models.URLField()
+    timezone = models.CharField(max_length=64)
+    lang = models.CharField(max_length=10, null=True, blank=True)
+    phone = models.CharField(max_length=64, null=True, blank=True)
+    email = models.EmailField(null=True, blank=True)
+
+class Stop(FeedRow):
+    stop_id = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    lat = models.FloatField()
+    lon = models.FloatField()
+    code = models.CharField(max_length=64, null=True, blank=True)
+    location_type = models.IntegerField(default=0)
+    parent_station = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['lat', 'lon'], name='stop_lat_lon')]
+
+class Route(FeedRow):
+    route_id = models.CharField(max_length=64, primary_key=True)
+    agency = models.ForeignKey(Agency, on_delete=models.CASCADE, null=True, blank=True)
+    short_name = models.CharField(max_length=64, null=True, blank=True)
+    long_name = models.CharField(max_length=255, null=True, blank=True)
+    route_type = models.IntegerField()
+    color = models.CharField(max_length=6, null=True, blank=True)
+    text_color = models.CharField(max_length=6, null=True, blank=True)
+
+class Trip(FeedRow):
+    trip_id = models.CharField(max_length=64, primary_key=True)
+    route = models.ForeignKey(Route, on_delete=models.CASCADE)
+    service_id = models.CharField(max_length=64)
+    headsign = models.CharField(max_length=255, null=True, blank=True)
+    direction_id = models.IntegerField(null=True, blank=True)
+    shape_id = models.CharField(max_length=64, null=True, blank=True)
+
+class StopTime(FeedRow):
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE)
+    stop = models.ForeignKey(Stop, on_delete=models.CASCADE)
+    arrival_secs = models.IntegerField()
+    departure_secs = models.IntegerField()
+    stop_sequence = models.IntegerField()
+
+    class Meta:
+        unique_together = ('trip', 'stop_sequence')
+        ordering = ['trip', 'stop_sequence']
+        # departure boards: a stop's departures in time order
+        indexes = [models.Index(fields=['stop', 'departure_secs'], name='stoptime_stop_departure')]
+
+class Calendar(FeedRow):
+    service_id = models.CharField(max_length=64, primary_key=True)
+    monday = models.BooleanField()
+    tuesday = models.BooleanField()
+    wednesday = models.BooleanField()
+    thursday = models.BooleanField()
+    friday = models.BooleanField()
+    saturday = models.BooleanField()
+    sunday = models.BooleanField()
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+class CalendarDate(FeedRow):
+    service_id = models.CharField(max_length=64)
+    date = models.DateField()
+    exception_type = models.IntegerField()
+
+    class Meta:
+        unique_together = ('service_id', 'date')
+
+class Frequency(FeedRow):
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE)
+    start_secs = models.IntegerField()
+    end_secs = models.IntegerField()
+    headway_secs = models.IntegerField()
+
+    class Meta:
+        unique_together = ('trip', 'start_secs')
+
+class Shape(FeedRow):
+    shape_id = models.CharField(max_length=64)
+    lat = models.FloatField()
+    lon = models.FloatField()
+    sequence = models.IntegerField()
+
+    class Meta:
+        unique_together = ('shape_id', 'sequence')
+
+class FeedVersion(models.Model):
+    """One row per import_gtfs run that changed the feed tables."""
+    version = models.CharField(max_length=12)
+    file_hashes = models.JSONField(default=dict)
+    changes = models.JSONField(default=dict)
+    incremental = models.BooleanField(default=False)
+    imported_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-imported_at', '-id']
@@ -1,3 +1,716 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from core import views
+from core.models import Agency, Calendar, CalendarDate, FeedVersion, Frequency, Route, Shape, Stop, StopTime, Trip
+from core.utils.cache import TwoTierCache
+from core.utils.footpaths import WALK_DETOUR_FACTOR, Footpaths, compute_footpaths, load_footpaths
+from core.utils.gtfs_utils import (
+    GTFSDataset, format_gtfs_time, get_departure_board, get_stop_transfers, parse_gtfs_time, parse_gtfs_times,
+    render_vector_tile,
+)
+from core.utils.routing import TransitNetwork
+from core.utils.service_calendar import ServiceCalendar, parse_gtfs_date
+from core.utils.spatial import haversine_m
+from core.utils.tiles import TileEncoderUnavailable, encode_tile, project
+
+WEEKDAYS_ONLY = [True] * 5 + [False] * 2
+
+
+def table(columns, rows):
+    return pd.DataFrame(rows, columns=columns, dtype=str)
+
+
+def small_feed():
+    """Six stops in a row along 50.08N, with E north of B and D a short walk from C.
+
+    Bus 1 runs A-B-C, bus 2 runs B-E, and tram 3 runs D-F every 10 minutes.
+    """
+    return GTFSDataset({
+        "stops": table(["stop_id", "stop_name", "stop_lat", "stop_lon"], [
+            ["A", "Alpha", "50.0800", "14.4000"],
+            ["B", "Bravo", "50.0800", "14.4100"],
+            ["C", "Charlie", "50.0800", "14.4200"],
+            ["D", "Delta", "50.0802", "14.4203"],
+            ["E", "Echo", "50.0900", "14.4100"],
+            ["F", "Foxtrot", "50.0800", "14.4400"],
+        ]),
+        "routes": table(["route_id", "route_short_name", "route_type"], [
+            ["R1", "1", "3"], ["R2", "2", "3"], ["R3", "3", "0"],
+        ]),
+        "trips": table(["route_id", "service_id", "trip_id", "shape_id"], [
+            ["R1", "WEEK", "T1", "S1"], ["R2", "WEEK", "T2", ""], ["R3", "WEEK", "F3", ""],
+        ]),
+        "stop_times": table(["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"], [
+            ["T1", "08:00:00", "08:00:00", "A", "1"],
+            ["T1", "08:05:00", "08:05:00", "B", "2"],
+            ["T1", "08:10:00", "08:10:00", "C", "3"],
+            ["T2", "08:08:00", "08:08:00", "B", "1"],
+            ["T2", "08:15:00", "08:15:00", "E", "2"],
+            ["F3", "08:00:00", "08:00:00", "D", "1"],
+            ["F3", "08:06:00", "08:06:00", "F", "2"],
+        ]),
+        "frequencies": table(["trip_id", "start_time", "end_time", "headway_secs"], [
+            ["F3", "08:00:00", "09:00:00", "600"],
+        ]),
+        "shapes": table(["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"], [
+            ["S1", "50.0800", "14.4000", "1"], ["S1", "50.0800", "14.4100", "2"], ["S1", "50.0800", "14.4200", "3"],
+        ]),
+    })
+
+
+class ServiceCalendarTests(SimpleTestCase):
+    """calendar.txt weekly ranges with calendar_dates.txt exceptions."""
+
+    def setUp(self):
+        # WEEK runs Monday to Friday through June 2024, except Wed 12 June; Sat 15 June is added.
+        # EXTRA only runs on the days calendar_dates.txt adds.
+        self.calendar = ServiceCalendar(
+            ["WEEK", "EXTRA", "UNLISTED"],
+            ["WEEK"],
+            [WEEKDAYS_ONLY],
+            [parse_gtfs_date("20240601")],
+            [parse_gtfs_date("20240630")],
+            ["WEEK", "WEEK", "EXTRA"],
+            [parse_gtfs_date("20240612"), parse_gtfs_date("20240615"), parse_gtfs_date("20240704")],
+            [2, 1, 1],
+        )
+
+    def running(self, day, strict=True):
+        services = self.calendar.services_on(day, strict=strict)
+        return None if services is None else set(self.calendar.service_ids[services].tolist())
+
+    def test_period_spans_ranges_and_exceptions(self):
+        self.assertEqual(self.calendar.start, date(2024, 6, 1))
+        self.assertEqual(self.calendar.end, date(2024, 7, 4))
+
+    def test_weekly_pattern(self):
+        self.assertEqual(self.running(date(2024, 6, 10)), {"WEEK"})  # Monday
+        self.assertEqual(self.running(date(2024, 6, 16)), set())  # Sunday
+
+    def test_removed_day(self):
+        self.assertEqual(self.running(date(2024, 6, 11)), {"WEEK"})
+        self.assertEqual(self.running(date(2024, 6, 12)), set())
+
+    def test_added_days(self):
+        self.assertEqual(self.running(date(2024, 6, 15)), {"WEEK"})  # Saturday
+        self.assertEqual(self.running(date(2024, 7, 4)), {"EXTRA"})  # after WEEK's end_date
+
+    def test_unlisted_service_never_runs(self):
+        for day in (date(2024, 6, 3), date(2024, 6, 15), date(2024, 7, 4)):
+            self.assertNotIn("UNLISTED", self.running(day))
+
+    def test_out_of_range_dates(self):
+        for day in (date(2024, 5, 31), date(2024, 7, 5)):
+            self.assertEqual(self.running(day), set())
+            with self.assertLogs("core.utils.service_calendar", "WARNING"):
+                self.assertIsNone(self.running(day, strict=False))
+        # inside the period a non-strict query is filtered as usual
+        self.assertEqual(self.running(date(2024, 6, 12), strict=False), set())
+
+    def test_without_calendar_nothing_is_filtered(self):
+        calendar = ServiceCalendar(["A"], [], np.zeros((0, 7), dtype=bool), [], [], [], [], [])
+        self.assertIsNone(calendar.services_on(date(2024, 6, 10)))
+        self.assertIsNone(calendar.start)
+
+    def test_round_trips_through_arrays(self):
+        restored = ServiceCalendar.from_arrays(self.calendar.to_arrays())
+        for offset in range(-2, 40):
+            day = date.fromordinal(date(2024, 6, 1).toordinal() + offset)
+            np.testing.assert_array_equal(restored.services_on(day), self.calendar.services_on(day))
+
+
+def board_feed():
+    """One stop, S, with unpadded and past-midnight times, a frequency trip and weekday/weekend services."""
+    week = ["1", "1", "1", "1", "1", "0", "0"]
+    gtfs_data = GTFSDataset({
+        "stops": table(["stop_id", "stop_name", "stop_lat", "stop_lon"], [
+            ["S", "Square", "50.08", "14.40"], ["N", "North", "50.09", "14.40"],
+        ]),
+        "routes": table(["route_id", "route_short_name", "route_type"], [["R1", "1", "3"]]),
+        "trips": table(["route_id", "service_id", "trip_id"], [
+            ["R1", "WEEK", "EARLY"], ["R1", "WEEK", "LATE"], ["R1", "WEEK", "EVE"], ["R1", "WEEK", "NIGHT"],
+            ["R1", "WEEK", "FREQ"], ["R1", "WKND", "SAT"],
+        ]),
+        "stop_times": table(["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"], [
+            ["EARLY", "6:00:20", "6:00:20", "S", "1"], ["EARLY", "6:05:00", "6:05:00", "N", "2"],
+            ["LATE", "10:00:00", "10:00:00", "S", "1"], ["LATE", "10:05:00", "10:05:00", "N", "2"],
+            ["EVE", "23:50:00", "23:50:00", "S", "1"], ["EVE", "23:55:00", "23:55:00", "N", "2"],
+            ["NIGHT", "24:10:00", "24:10:00", "S", "1"], ["NIGHT", "25:30:00", "25:30:00", "N", "2"],
+            ["FREQ", "7:00:00", "7:00:00", "S", "1"], ["FREQ", "7:05:00", "7:05:00", "N", "2"],
+            ["SAT", "9:00:00", "9:00:00", "S", "1"], ["SAT", "9:05:00", "9:05:00", "N", "2"],
+        ]),
+        "frequencies": table(["trip_id", "start_time", "end_time", "headway_secs"], [
+            ["FREQ", "7:00:00", "8:00:00", "1200"],
+        ]),
+        "calendar": table(["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+                           "sunday", "start_date", "end_date"], [
+            ["WEEK", *week, "20240601", "20240630"],
+            ["WKND", *(["0"] * 5), "1", "1", "20240601", "20240630"],
+        ]),
+    })
+    gtfs_data.version = "board-test"
+    return gtfs_data
+
+
+class DepartureBoardTests(SimpleTestCase):
+    """Integer-second times and boards over service days, from board_feed()."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gtfs_data = board_feed()
+
+    def board(self, at, **kwargs):
+        return [
+            (entry["trip_id"], entry["departure_time"], entry["service_date"])
+            for entry in get_departure_board.__wrapped__(self.gtfs_data, "S", at=at, **kwargs)
+        ]
+
+    def test_parse_unpadded_and_overnight_times(self):
+        np.testing.assert_array_equal(
+            parse_gtfs_times(["6:00:20", "10:00:00", " 24:10:00", "25:30:00", "00:00:00"]),
+            [6 * 3600 + 20, 10 * 3600, 24 * 3600 + 600, 25 * 3600 + 1800, 0],
+        )
+        self.assertEqual(parse_gtfs_time("6:00:20"), 6 * 3600 + 20)
+        self.assertLess(parse_gtfs_time("6:00:20"), parse_gtfs_time("10:00:00"))
+        self.assertEqual(format_gtfs_time(parse_gtfs_time("25:30:00")), "25:30:00")
+        self.assertEqual(format_gtfs_time(parse_gtfs_time("6:00:20")), "06:00:20")
+
+    def test_board_is_in_time_order(self):
+        # Monday 10 June; "6:00:20" sorts after "10:00:00" as a string
+        self.assertEqual(self.board(datetime(2024, 6, 10, 5, 0), time_window=24 * 60, limit=20), [
+            ("EARLY", "06:00:20", "2024-06-10"),
+            ("FREQ", "07:00:00", "2024-06-10"),
+            ("FREQ", "07:20:00", "2024-06-10"),
+            ("FREQ", "07:40:00", "2024-06-10"),
+            ("LATE", "10:00:00", "2024-06-10"),
+            ("EVE", "23:50:00", "2024-06-10"),
+            ("NIGHT", "24:10:00", "2024-06-10"),
+        ])
+
+    def test_window_and_limit(self):
+        at = datetime(2024, 6, 10, 7, 10)
+        self.assertEqual(
+            [trip for trip, _, _ in self.board(at, time_window=60)], ["FREQ", "FREQ"],  # 07:20, 07:40; 08:00 ends
+        )
+        self.assertEqual(self.board(at, time_window=24 * 60, limit=1), [("FREQ", "07:20:00", "2024-06-10")])
+        self.assertEqual(self.board(datetime(2024, 6, 10, 6, 0, 21), time_window=30), [])
+
+    def test_after_midnight_from_previous_service_day(self):
+        # Tuesday 00:05: Monday's 24:10:00 trip
+        self.assertEqual(
+            self.board(datetime(2024, 6, 11, 0, 5), time_window=30, strict_calendar=True),
+            [("NIGHT", "24:10:00", "2024-06-10")],
+        )
+        # Sunday 00:05: Saturday runs no WEEK trips
+        self.assertEqual(self.board(datetime(2024, 6, 16, 0, 5), time_window=30, strict_calendar=True), [])
+
+    def test_window_past_midnight_reaches_next_service_day(self):
+        # Friday 23:45 for 7 hours: Friday's late trips, then Saturday's own timetable
+        self.assertEqual(self.board(datetime(2024, 6, 14, 23, 45), time_window=7 * 60, strict_calendar=True), [
+            ("EVE", "23:50:00", "2024-06-14"),
+            ("NIGHT", "24:10:00", "2024-06-14"),
+        ])
+        self.assertEqual(
+            self.board(datetime(2024, 6, 14, 23, 45), time_window=10 * 60, strict_calendar=True)[-1],
+            ("SAT", "09:00:00", "2024-06-15"),
+        )
+
+    def test_endpoint_params(self):
+        factory = RequestFactory()
+
+        def get(**params):
+            with mock.patch.object(views, "get_gtfs_data", return_value=self.gtfs_data):
+                response = views.stop_board(factory.get("/api/departure_board/", {"stop_id": "S", **params}))
+            return response.status_code, json.loads(response.content)
+
+        status, body = get(date="2024-06-10", time="06:00", window="120", limit="2")
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            [(d["trip_id"], d["departure_time"]) for d in body["departures"]],
+            [("EARLY", "06:00:20"), ("FREQ", "07:00:00")],
+        )
+        status, body = get(date="2024-06-11", time="00:05:00")
+        self.assertEqual([d["trip_id"] for d in body["departures"]], ["NIGHT"])
+        self.assertEqual(get(date="2024-06-16", time="00:05")[1], {"departures": []})
+        for bad in ({"limit": "0"}, {"window": "-5"}, {"time": "25:00"}, {"date": "10/06/2024"}):
+            self.assertEqual(get(**bad)[0], 400, bad)
+
+
+class VectorTileTests(SimpleTestCase):
+    """Tiles rendered from a small feed, decoded back with mapbox_vector_tile."""
+
+    # z14 tile holding A, B and E, with shape S1 running off its east edge
+    TILE = (14, 8847, 5550)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gtfs_data = small_feed()
+
+    def decode(self, z, x, y):
+        import mapbox_vector_tile
+
+        return mapbox_vector_tile.decode(render_vector_tile(self.gtfs_data, z, x, y),
+                                         default_options={"y_coord_down": True})
+
+    def test_layers_and_features(self):
+        layers = self.decode(*self.TILE)
+        self.assertEqual(set(layers), {"stops", "routes"})
+        stops = {f["properties"]["stop_id"]: f for f in layers["stops"]["features"]}
+        self.assertEqual(set(stops), {"A", "B", "E"})
+        self.assertEqual(stops["E"]["properties"]["stop_name"], "Echo")
+        routes = layers["routes"]["features"]
+        self.assertEqual(len(routes), 1)
+        self.assertEqual(routes[0]["properties"]["route_id"], "R1")
+        self.assertEqual(routes[0]["properties"]["route_short_name"], "1")
+
+    def test_coordinates_are_y_down(self):
+        stops = {f["properties"]["stop_id"]: f["geometry"]["coordinates"]
+                 for f in self.decode(*self.TILE)["stops"]["features"]}
+        for stop_id, (x, y) in stops.items():
+            i = list(self.gtfs_data.stop_ids).index(stop_id)
+            tx, ty = project(self.gtfs_data.stop_lat[i], self.gtfs_data.stop_lon[i], *self.TILE)
+            self.assertEqual((x, y), (round(float(tx)), round(float(ty))))
+        # E lies north of B on the same meridian: nearer the top of the tile
+        self.assertEqual(stops["E"][0], stops["B"][0])
+        self.assertLess(stops["E"][1], stops["B"][1])
+
+    def test_empty_tile(self):
+        self.assertEqual(render_vector_tile(self.gtfs_data, 14, 0, 0), b"")
+
+    def test_missing_encoder(self):
+        with mock.patch.dict(sys.modules, {"mapbox_vector_tile": None}):
+            with self.assertRaises(TileEncoderUnavailable):
+                encode_tile({"stops": [{"geometry": "POINT (1 1)", "properties": {}}]})
+
+
+class FootpathTests(SimpleTestCase):
+    """Walking transfers between the small feed's stops."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gtfs_data = small_feed()
+        cls.stop = {stop_id: i for i, stop_id in enumerate(cls.gtfs_data.stop_ids.tolist())}
+
+    def distance(self, i, j):
+        g = self.gtfs_data
+        return float(haversine_m(g.stop_lat[i], g.stop_lon[i], g.stop_lat[j], g.stop_lon[j]))
+
+    def pairs(self, footpaths):
+        return {
+            (i, int(j)): int(secs)
+            for i in range(len(self.gtfs_data.stop_ids))
+            for j, secs, _ in zip(*footpaths.from_stop(i))
+        }
+
+    def test_pairs_within_radius(self):
+        for radius in (200, 800, 1200):
+            footpaths = compute_footpaths(self.gtfs_data, radius_m=radius, walk_speed=1.0)
+            n = len(self.gtfs_data.stop_ids)
+            expected = {(i, j) for i in range(n) for j in range(n) if i != j and self.distance(i, j) <= radius}
+            self.assertEqual(set(self.pairs(footpaths)), expected, radius)
+        # C and D are about 30 m apart; B is over 700 m from both
+        self.assertEqual(
+            set(self.pairs(compute_footpaths(self.gtfs_data, radius_m=200))),
+            {(self.stop["C"], self.stop["D"]), (self.stop["D"], self.stop["C"])},
+        )
+
+    def test_walk_secs(self):
+        footpaths = compute_footpaths(self.gtfs_data, radius_m=800, walk_speed=1.2)
+        for (i, j), secs in self.pairs(footpaths).items():
+            self.assertEqual(secs, int(np.ceil(self.distance(i, j) * WALK_DETOUR_FACTOR / 1.2)))
+        for i in range(len(self.gtfs_data.stop_ids)):
+            walk_secs = footpaths.from_stop(i)[1]
+            self.assertTrue(np.all(np.diff(walk_secs) >= 0))  # nearest first
+
+    def test_csr_round_trip(self):
+        footpaths = compute_footpaths(self.gtfs_data, radius_m=800)
+        self.assertEqual(len(footpaths.offsets), len(self.gtfs_data.stop_ids) + 1)
+        self.assertEqual(footpaths.offsets[-1], len(footpaths))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "footpaths.npz")
+            footpaths.save(path)
+            loaded = Footpaths.load(path)
+            for name in Footpaths.ARRAY_FIELDS:
+                np.testing.assert_array_equal(getattr(loaded, name), getattr(footpaths, name))
+            self.assertEqual(loaded.fingerprint, footpaths.fingerprint)
+            self.assertEqual(loaded.adjacency(), footpaths.adjacency())
+            # a stale file (other settings) is recomputed and replaced
+            recomputed = load_footpaths(self.gtfs_data, path, radius_m=200)
+            self.assertEqual(len(recomputed), 2)
+            self.assertEqual(Footpaths.load(path).fingerprint, recomputed.fingerprint)
+            self.assertEqual(load_footpaths(self.gtfs_data, path, radius_m=200).fingerprint, recomputed.fingerprint)
+
+    def test_stop_transfers(self):
+        gtfs_data = small_feed()
+        gtfs_data.__dict__["footpaths"] = compute_footpaths(gtfs_data, radius_m=200)
+        (transfer,) = get_stop_transfers(gtfs_data, "C")
+        self.assertEqual((transfer["stop_id"], transfer["stop_name"]), ("D", "Delta"))
+        self.assertEqual(transfer["distance_m"], round(self.distance(self.stop["C"], self.stop["D"]), 1))
+        self.assertEqual(get_stop_transfers(gtfs_data, "A"), [])
+        self.assertIsNone(get_stop_transfers(gtfs_data, "nowhere"))
+
+        factory = RequestFactory()
+        with mock.patch.object(views, "get_gtfs_data", return_value=gtfs_data):
+            response = views.stop_transfers(factory.get("/api/transfers/", {"stop_id": "C"}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), {"transfers": [transfer]})
+            self.assertEqual(views.stop_transfers(factory.get("/api/transfers/")).status_code, 400)
+            self.assertEqual(
+                views.stop_transfers(factory.get("/api/transfers/", {"stop_id": "nowhere"})).status_code, 404
+            )
+
+
+class RoutingTests(SimpleTestCase):
+    """RAPTOR journeys and one-to-all reach over the small feed."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gtfs_data = small_feed()
+        # only C and D are close enough to walk between
+        cls.network = TransitNetwork(cls.gtfs_data, compute_footpaths(cls.gtfs_data, radius_m=200))
+        cls.stop = {stop_id: i for i, stop_id in enumerate(cls.gtfs_data.stop_ids.tolist())}
+
+    def route(self, source, target, depart, **kwargs):
+        return self.network.route(self.stop[source], self.stop[target], parse_gtfs_time(depart), **kwargs)
+
+    def describe(self, journey):
+        """Legs as (trip_id or "walk", from stop_id, to stop_id), plus the arrival time."""
+        stop_ids = self.gtfs_data.stop_ids
+        legs, arrival = [], None
+        for leg in journey:
+            if leg[0] == "walk":
+                _, from_stop, to_stop, depart, walk_secs = leg
+                legs.append(("walk", stop_ids[from_stop], stop_ids[to_stop]))
+                arrival = depart + walk_secs
+            else:
+                _, pattern, trip, shift, board_pos, alight_pos = leg
+                stops = self.network.pattern_stops[pattern]
+                legs.append((self.gtfs_data.trip_ids[trip.trip_idx], stop_ids[stops[board_pos]],
+                             stop_ids[stops[alight_pos]]))
+                arrival = trip.start + shift + trip.arrivals[alight_pos]
+        return legs, arrival
+
+    def test_direct(self):
+        journeys = self.route("A", "C", "07:55:00")
+        self.assertEqual(len(journeys), 1)
+        self.assertEqual(self.describe(journeys[0]), ([("T1", "A", "C")], parse_gtfs_time("08:10:00")))
+
+    def test_walk_only(self):
+        journeys = self.route("C", "D", "08:00:00")
+        self.assertEqual(len(journeys), 1)
+        legs, arrival = self.describe(journeys[0])
+        self.assertEqual(legs, [("walk", "C", "D")])
+        self.assertEqual(arrival, parse_gtfs_time("08:00:00") + journeys[0][0][4])
+
+    def test_same_stop(self):
+        self.assertEqual(self.route("A", "A", "07:55:00"), [])
+
+    def test_missed_trip(self):
+        self.assertEqual(self.route("A", "C", "08:00:01"), [])
+
+    def test_transfer(self):
+        journeys = self.route("A", "E", "07:55:00")
+        self.assertEqual(len(journeys), 1)
+        self.assertEqual(
+            self.describe(journeys[0]), ([("T1", "A", "B"), ("T2", "B", "E")], parse_gtfs_time("08:15:00"))
+        )
+        self.assertEqual(self.route("A", "E", "07:55:00", max_transfers=0), [])
+
+    def test_footpath_to_frequency_trip(self):
+        journeys = self.route("A", "F", "07:55:00")
+        self.assertEqual(len(journeys), 1)
+        legs, arrival = self.describe(journeys[0])
+        self.assertEqual(legs, [("T1", "A", "C"), ("walk", "C", "D"), ("F3", "D", "F")])
+        # the walk ends just after 08:10, so the 08:20 tram is the first one to catch
+        self.assertEqual(journeys[0][2][3], 20 * 60)
+        self.assertEqual(arrival, parse_gtfs_time("08:26:00"))
+
+    def test_frequency_boarding(self):
+        for depart, vehicle in (("07:30:00", "08:00:00"), ("08:00:00", "08:00:00"), ("08:00:01", "08:10:00"),
+                                ("08:50:00", "08:50:00")):
+            (leg,), = self.route("D", "F", depart)
+            self.assertEqual(leg[2].start + leg[3], parse_gtfs_time(vehicle))
+        # the window ends at 09:00, exclusive
+        self.assertEqual(self.route("D", "F", "08:50:01"), [])
+
+    def test_reach_prunes_past_deadline(self):
+        depart = parse_gtfs_time("07:55:00")
+        reached = self.network.reach({self.stop["A"]: depart}, parse_gtfs_time("08:12:00"))
+        self.assertEqual({self.gtfs_data.stop_ids[s] for s in reached}, {"A", "B", "C", "D"})
+        self.assertEqual(reached[self.stop["A"]], (depart, 0))
+        self.assertEqual(reached[self.stop["C"]], (parse_gtfs_time("08:10:00"), 1))
+        self.assertEqual(reached[self.stop["D"]][1], 1)
+
+        reached = self.network.reach({self.stop["A"]: depart}, parse_gtfs_time("08:30:00"))
+        self.assertEqual(reached[self.stop["E"]], (parse_gtfs_time("08:15:00"), 2))
+        self.assertEqual(reached[self.stop["F"]], (parse_gtfs_time("08:26:00"), 2))
+        self.assertNotIn(self.stop["F"], self.network.reach({self.stop["A"]: depart}, parse_gtfs_time("08:25:59")))
+
+    def test_reach_ignores_late_sources(self):
+        late = {self.stop["A"]: parse_gtfs_time("09:00:00")}
+        self.assertEqual(self.network.reach(late, parse_gtfs_time("08:00:00")), {})
+
+
+# Each file of the second feed edits its first row, drops its last row and adds one
+# row; the dropped rows are not referenced by any other table.
+FEED = {
+    "agency.txt": (["agency_id", "agency_name", "agency_url", "agency_timezone"], [
+        ["AG1", "City Transit", "https://transit.example", "Europe/Prague"],
+        ["AG2", "Old Lines", "https://old.example", "Europe/Prague"],
+    ]),
+    "stops.txt": (["stop_id", "stop_name", "stop_lat", "stop_lon"], [
+        ["S1", "Alpha", "50.08", "14.40"],
+        ["S2", "Bravo", "50.08", "14.41"],
+        ["S3", "Charlie", "50.08", "14.42"],
+        ["S4", "Delta", "50.09", "14.43"],
+    ]),
+    "routes.txt": (["route_id", "agency_id", "route_short_name", "route_long_name", "route_type"], [
+        ["R1", "AG1", "1", "Alpha - Charlie", "3"],
+        ["R2", "AG1", "2", "Unused", "3"],
+    ]),
+    "trips.txt": (["route_id", "service_id", "trip_id", "trip_headsign", "shape_id"], [
+        ["R1", "WEEK", "T1", "Charlie", "SH1"],
+        ["R1", "WEEK", "T2", "Alpha", ""],
+    ]),
+    "stop_times.txt": (["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"], [
+        ["T1", "08:00:00", "08:00:00", "S1", "1"],
+        ["T1", "08:05:00", "08:05:00", "S2", "2"],
+        ["T1", "08:10:00", "08:10:00", "S3", "3"],
+    ]),
+    "calendar.txt": (["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+                      "start_date", "end_date"], [
+        ["WEEK", "1", "1", "1", "1", "1", "0", "0", "20240601", "20240630"],
+        ["WKND", "0", "0", "0", "0", "0", "1", "1", "20240601", "20240630"],
+    ]),
+    "calendar_dates.txt": (["service_id", "date", "exception_type"], [
+        ["WEEK", "20240612", "2"],
+        ["WEEK", "20240615", "1"],
+    ]),
+    "frequencies.txt": (["trip_id", "start_time", "end_time", "headway_secs"], [
+        ["T1", "08:00:00", "09:00:00", "600"],
+        ["T1", "10:00:00", "11:00:00", "900"],
+    ]),
+    "shapes.txt": (["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"], [
+        ["SH1", "50.08", "14.40", "1"],
+        ["SH1", "50.08", "14.41", "2"],
+        ["SH1", "50.08", "14.42", "3"],
+    ]),
+}
+
+CHANGED_FEED = {
+    "agency.txt": (FEED["agency.txt"][0], [
+        ["AG1", "City Transit Authority", "https://transit.example", "Europe/Prague"],
+        ["AG3", "New Lines", "https://new.example", "Europe/Prague"],
+    ]),
+    "stops.txt": (FEED["stops.txt"][0], [
+        ["S1", "Alpha Square", "50.08", "14.40"],
+        ["S2", "Bravo", "50.08", "14.41"],
+        ["S3", "Charlie", "50.08", "14.42"],
+        ["S5", "Echo", "50.09", "14.41"],
+    ]),
+    "routes.txt": (FEED["routes.txt"][0], [
+        ["R1", "AG1", "1", "Alpha - Bravo", "3"],
+        ["R3", "AG3", "3", "Bravo - Echo", "0"],
+    ]),
+    "trips.txt": (FEED["trips.txt"][0], [
+        ["R1", "WEEK", "T1", "Bravo", "SH1"],
+        ["R3", "SUN", "T3", "Echo", ""],
+    ]),
+    "stop_times.txt": (FEED["stop_times.txt"][0], [
+        ["T1", "08:00:00", "08:01:00", "S1", "1"],
+        ["T1", "08:05:00", "08:05:00", "S2", "2"],
+        ["T3", "09:00:00", "09:00:00", "S5", "1"],
+    ]),
+    "calendar.txt": (FEED["calendar.txt"][0], [
+        ["WEEK", "1", "1", "1", "1", "1", "0", "0", "20240601", "20240731"],
+        ["SUN", "0", "0", "0", "0", "0", "0", "1", "20240601", "20240731"],
+    ]),
+    "calendar_dates.txt": (FEED["calendar_dates.txt"][0], [
+        ["WEEK", "20240612", "1"],
+        ["WEEK", "20240620", "2"],
+    ]),
+    "frequencies.txt": (FEED["frequencies.txt"][0], [
+        ["T1", "08:00:00", "09:00:00", "300"],
+        ["T3", "07:00:00", "08:00:00", "1200"],
+    ]),
+    "shapes.txt": (FEED["shapes.txt"][0], [
+        ["SH1", "50.0801", "14.40", "1"],
+        ["SH1", "50.08", "14.41", "2"],
+        ["SH2", "50.08", "14.41", "1"],
+    ]),
+}
+
+FEED_MODELS = {
+    "agency.txt": Agency, "stops.txt": Stop, "routes.txt": Route, "trips.txt": Trip, "stop_times.txt": StopTime,
+    "calendar.txt": Calendar, "calendar_dates.txt": CalendarDate, "frequencies.txt": Frequency, "shapes.txt": Shape,
+}
+
+
+class ImportGTFSTests(TestCase):
+    """import_gtfs --method bulk: a full import, then an incremental one of a changed feed."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write_feed(self, feed):
+        gtfs_dir = tempfile.mkdtemp(dir=self.tmp.name)
+        for filename, (header, rows) in feed.items():
+            with open(os.path.join(gtfs_dir, filename), "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows([header, *rows])
+        return gtfs_dir
+
+    def import_feed(self, feed, incremental=False):
+        call_command("import_gtfs", dir=self.write_feed(feed), method="bulk", workers=1,
+                     incremental=incremental, stdout=StringIO())
+
+    def row_counts(self):
+        return {filename: model.objects.count() for filename, model in FEED_MODELS.items()}
+
+    def test_full_import(self):
+        self.import_feed(FEED)
+        self.assertEqual(self.row_counts(), {filename: len(rows) for filename, (_, rows) in FEED.items()})
+        feed_version = FeedVersion.objects.get()
+        self.assertFalse(feed_version.incremental)
+        self.assertEqual(
+            feed_version.changes, {filename: {"inserted": len(rows)} for filename, (_, rows) in FEED.items()}
+        )
+        self.assertEqual(set(feed_version.file_hashes), set(FEED))
+        stop_time = StopTime.objects.get(trip_id="T1", stop_sequence=2)
+        self.assertEqual((stop_time.stop_id, stop_time.departure_secs), ("S2", 8 * 3600 + 5 * 60))
+        self.assertEqual(str(Calendar.objects.get(service_id="WEEK").end_date), "2024-06-30")
+
+    def test_incremental_import(self):
+        self.import_feed(FEED)
+        self.import_feed(CHANGED_FEED, incremental=True)
+        self.assertEqual(self.row_counts(), {filename: len(rows) for filename, (_, rows) in CHANGED_FEED.items()})
+        self.assertEqual(FeedVersion.objects.count(), 2)
+        feed_version = FeedVersion.objects.first()
+        self.assertTrue(feed_version.incremental)
+        self.assertEqual(feed_version.changes, dict.fromkeys(FEED, {"inserted": 1, "updated": 1, "deleted": 1}))
+
+        # edited rows
+        self.assertEqual(Agency.objects.get(agency_id="AG1").name, "City Transit Authority")
+        self.assertEqual(Stop.objects.get(stop_id="S1").name, "Alpha Square")
+        self.assertEqual(Route.objects.get(route_id="R1").long_name, "Alpha - Bravo")
+        self.assertEqual(Trip.objects.get(trip_id="T1").headsign, "Bravo")
+        self.assertEqual(StopTime.objects.get(trip_id="T1", stop_sequence=1).departure_secs, 8 * 3600 + 60)
+        self.assertEqual(str(Calendar.objects.get(service_id="WEEK").end_date), "2024-07-31")
+        self.assertEqual(CalendarDate.objects.get(service_id="WEEK", date="2024-06-12").exception_type, 1)
+        self.assertEqual(Frequency.objects.get(trip_id="T1", start_secs=8 * 3600).headway_secs, 300)
+        self.assertEqual(Shape.objects.get(shape_id="SH1", sequence=1).lat, 50.0801)
+        # rows referencing edited parents survive the in-place updates
+        self.assertEqual(list(StopTime.objects.filter(trip_id="T1").values_list("stop_id", flat=True)), ["S1", "S2"])
+        self.assertEqual(Route.objects.get(route_id="R3").agency_id, "AG3")
+        # removed rows
+        self.assertFalse(Agency.objects.filter(agency_id="AG2").exists())
+        self.assertFalse(Trip.objects.filter(trip_id="T2").exists())
+        self.assertFalse(Shape.objects.filter(shape_id="SH1", sequence=3).exists())
+
+    def test_unchanged_feed_is_skipped(self):
+        self.import_feed(FEED)
+        self.import_feed(FEED, incremental=True)
+        self.assertEqual(FeedVersion.objects.count(), 1)
+        self.assertEqual(self.row_counts(), {filename: len(rows) for filename, (_, rows) in FEED.items()})
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    """L1 lookups and miss coalescing, without Redis."""
+
+    def setUp(self):
+        self.cache = TwoTierCache(get_client=lambda: None)
+        self.calls = 0
+
+    def compute(self, value="value", delay=0.0):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def fail(self):
+        self.calls += 1
+        raise ValueError("boom")
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.cache.get_or_compute("t", "k", 60, self.compute()), "value")
+        self.assertEqual(self.cache.get_or_compute("t", "k", 60, self.compute("other")), "value")
+        self.assertEqual(self.calls, 1)
+        stats = self.cache.stats_by_name["t"]
+        self.assertEqual((stats.misses, stats.l1_hits), (1, 1))
+
+    def test_concurrent_misses_compute_once(self):
+        start = threading.Barrier(8)
+        results = []
+
+        def lookup():
+            start.wait()
+            results.append(self.cache.get_or_compute("t", "k", 60, self.compute(delay=0.2)))
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.stats_by_name["t"].coalesced, 7)
+        self.assertEqual(self.cache._inflight, {})
+
+    def test_expired_entry_is_recomputed(self):
+        self.assertEqual(self.cache.get_or_compute("t", "k", 0.05, self.compute("old")), "old")
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get_or_compute("t", "k", 0.05, self.compute("new")), "new")
+        self.assertEqual(self.calls, 2)
+
+    def test_failed_compute_is_not_stuck(self):
+        with self.assertRaises(ValueError):
+            self.cache.get_or_compute("t", "k", 60, self.fail)
+        self.assertEqual(self.cache._inflight, {})
+        self.assertEqual(self.cache.get_or_compute("t", "k", 60, self.compute()), "value")
+
+    def test_waiters_retry_after_failed_compute(self):
+        leader_started, errors, results = threading.Event(), [], []
+
+        def failing():
+            leader_started.set()
+            time.sleep(0.2)
+            self.fail()
+
+        def lead():
+            try:
+                self.cache.get_or_compute("t", "k", 60, failing)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        leader_started.wait()
+        waiter = threading.Thread(target=lambda: results.append(
+            self.cache.get_or_compute("t", "k", 60, self.compute())
+        ))
+        waiter.start()
+        leader.join()
+        waiter.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(results, ["value"])
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache._inflight, {})
@@ -6,13 +6,22 @@ from core.social_login import GoogleLogin
 urlpatterns = [
     path("nearest_stops/", views.get_nearby_stops, name="nearest_stops"),
     path("search_routes/", views.route_search, name="search_routes"),
+    path("search_stops/", views.stop_search, name="search_stops"),
     path("next_trips/", views.trip_stops, name="next_trips"),  # Assuming this is meant for trip_stops
     path("calculate_path/", views.find_path, name="calculate_path"),
+    path("isochrone/", views.isochrone, name="isochrone"),
+    path("travel_matrix/", views.travel_matrix, name="travel_matrix"),
     path("stop_coordinates/", views.stop_coordinates, name="stop_coordinates"),
     path("routes_by_stop/", views.stop_routes, name="routes_by_stop"),
     path("trip_stops/", views.trip_stops, name="trip_stops"),  # Duplicate?
     path("departure_board/", views.stop_board, name="departure_board"),
-
+    path("transfers/", views.stop_transfers, name="transfers"),
+    path("trip_shape/", views.trip_shape, name="trip_shape"),
+    path("route_shape/", views.route_shape, name="route_shape"),
+    path("route_stops/", views.route_stops, name="route_stops"),
+    path("batch/", views.batch, name="batch"),
+    path("cache_stats/", views.cache_stats, name="cache_stats"),
+    path("tiles/<int:z>/<int:x>/<int:y>.mvt", views.vector_tile, name="vector_tile"),
 
     # #authentication
     # path("auth/", include("dj_rest_auth.urls")),
@@ -0,0 +1,220 @@
+"""Two-tier result cache: a bounded in-process LRU with TTL in front of Redis.
+
+``@cache.cached("name", ttl=...)`` memoises a function of a dataset and plain
+arguments. Keys combine the cache name with the dataset's feed version and the
+arguments, so a new feed never serves stale entries. Lookups go L1 (this
+process) -> L2 (Redis, shared by all workers) -> compute; concurrent misses on
+the same key within a process are coalesced so only one caller computes it.
+
+Values must be JSON-serialisable. L1 hands out the cached object itself, so
+callers must not mutate results.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime
+from functools import wraps
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1000
+
+
+def _keyable(value):
+    """Stable key part for an argument: datasets by feed version, indexes by type."""
+    if hasattr(value, "version"):
+        return f"feed:{value.version}"
+    if value is None or isinstance(value, (str, int, float, bool, list, tuple, dict, datetime)):
+        return value
+    # derived structures (spatial index, ...) follow the dataset and carry no key information
+    return type(value).__name__
+
+
+def to_minute(param):
+    """``normalize`` keying a time argument (default now) by the minute, so callers share entries."""
+    def normalize(args, kwargs):
+        at = kwargs.get(param) or datetime.now()
+        return args, {**kwargs, param: at.replace(second=0, microsecond=0)}
+    return normalize
+
+
+class LRUCache:
+    """Thread-safe LRU of (expires_at, value) entries."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CacheStats:
+    def __init__(self):
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lookup_ms = deque(maxlen=LATENCY_SAMPLES)
+        self.compute_ms = deque(maxlen=LATENCY_SAMPLES)
+
+    def as_dict(self):
+        total = self.l1_hits + self.l2_hits + self.misses
+        return {
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.l1_hits + self.l2_hits) / total, 4) if total else None,
+            "lookup_ms": _summary(self.lookup_ms),
+            "compute_ms": _summary(self.compute_ms),
+        }
+
+
+def _summary(samples):
+    if not samples:
+        return None
+    values = np.fromiter(samples, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+    }
+
+
+class TwoTierCache:
+    def __init__(self, get_client, max_entries=10000, prefix="cache"):
+        # get_client is called per operation so a reconnected client is picked up
+        self.get_client = get_client
+        self.prefix = prefix
+        self.local = LRUCache(max_entries)
+        self.stats_by_name = defaultdict(CacheStats)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def key(self, name, args, kwargs):
+        raw = json.dumps(
+            [[_keyable(a) for a in args], {k: _keyable(v) for k, v in kwargs.items()}],
+            sort_keys=True, default=str, separators=(",", ":"),
+        )
+        return f"{self.prefix}:{name}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+    # --- L2 ---
+    def _redis_get(self, key):
+        client = self.get_client()
+        if not client:
+            return None
+        try:
+            raw = client.get(key)
+        except Exception as e:
+            logger.error(f"Redis read error for {key}: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def _redis_set(self, key, value, ttl):
+        client = self.get_client()
+        if not client:
+            return
+        try:
+            client.set(key, json.dumps(value, separators=(",", ":")), ex=max(1, int(ttl)))
+        except Exception as e:
+            logger.error(f"Failed to cache {key}: {e}")
+
+    # --- Lookup ---
+    def get_or_compute(self, name, key, ttl, compute):
+        stats = self.stats_by_name[name]
+        started = time.perf_counter()
+        entry = self.local.get(key)
+        if entry is not None:
+            stats.l1_hits += 1
+            stats.lookup_ms.append((time.perf_counter() - started) * 1000)
+            return entry[1]
+
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            # another thread is already computing this key; wait for its result
+            event.wait()
+            entry = self.local.get(key)
+            if entry is not None:
+                stats.coalesced += 1
+                stats.lookup_ms.append((time.perf_counter() - started) * 1000)
+                return entry[1]
+            return self._fill(name, key, ttl, compute, stats, started)
+
+        try:
+            return self._fill(name, key, ttl, compute, stats, started)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _fill(self, name, key, ttl, compute, stats, started):
+        value = self._redis_get(key)
+        if value is not None:
+            stats.l2_hits += 1
+            self.local.set(key, value, ttl)
+            stats.lookup_ms.append((time.perf_counter() - started) * 1000)
+            return value
+        stats.misses += 1
+        computing = time.perf_counter()
+        value = compute()
+        stats.compute_ms.append((time.perf_counter() - computing) * 1000)
+        self.local.set(key, value, ttl)
+        self._redis_set(key, value, ttl)
+        stats.lookup_ms.append((time.perf_counter() - started) * 1000)
+        return value
+
+    def cached(self, name, ttl, normalize=None):
+        """Decorate a function of a dataset and plain arguments; ``ttl`` may be a number or a callable.
+
+        ``normalize(args, kwargs) -> (args, kwargs)`` canonicalises the call
+        (e.g. truncating times to the minute) before it is keyed and computed.
+        The undecorated function stays available as ``fn.__wrapped__``.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if normalize is not None:
+                    args, kwargs = normalize(args, kwargs)
+                key = self.key(name, args, kwargs)
+                seconds = ttl() if callable(ttl) else ttl
+                return self.get_or_compute(name, key, seconds, lambda: fn(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {
+            "l1_entries": len(self.local),
+            "endpoints": {name: stats.as_dict() for name, stats in sorted(self.stats_by_name.items())},
+        }
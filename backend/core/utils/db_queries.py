@@ -0,0 +1,576 @@
+"""GTFS queries answered from the feed tables instead of an in-memory dataset.
+
+Selected with GTFS_BACKEND=db (see core/views.py). The functions mirror the
+gtfs_utils ones the views call, with the same arguments and response shapes,
+so the two backends are interchangeable and comparable with
+``benchmark_gtfs --suite backends``. Workers hold no feed: each request is a
+few indexed queries against the tables import_gtfs loads. Departure boards
+scan stoptime_stop_departure, trip lookups the (trip, stop_sequence) key, and
+nearby stops the stop_lat_lon box. Routes by stop and journeys are single
+set-based joins. Frequency-based trips are stored as templates and expanded
+in Python, exactly as gtfs_utils does.
+
+Journey planning here is limited to at most one change between vehicles at
+the same stop. Walking transfers and longer chains need the in-memory RAPTOR
+network.
+"""
+import heapq
+import math
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import islice, repeat
+
+import numpy as np
+from django.db import connection
+from django.db.models import Case, Count, Exists, IntegerField, Min, OuterRef, Q, Value, When
+from django.db.models.functions import Length
+
+from core.models import Calendar, CalendarDate, FeedVersion, Frequency, Route, Shape, Stop, StopTime, Trip
+from core.utils.footpaths import TRANSFER_RADIUS_M, WALK_DETOUR_FACTOR, WALK_SPEED_MPS
+from core.utils.cache import to_minute
+from core.utils.gtfs_utils import (
+    SECONDS_PER_DAY, STOP_SEARCH_DISTANCE_SCALE_M, cache_ttl, format_gtfs_time, response_cache, tile_cache,
+)
+from core.utils.service_calendar import WEEKDAYS, ServiceCalendar, on_service_date
+from core.utils.shapes import MAX_ZOOM, ShapeIndex, clamped_zoom, encode_polyline
+from core.utils.spatial import METRES_PER_DEG_LAT, METRES_PER_DEG_LON_EQUATOR, haversine_m
+from core.utils.tiles import (
+    BUFFER, SHAPES_MIN_ZOOM, STOPS_MIN_ZOOM, check_tile, encode_tile, line_features, stop_features, tile_bounds,
+)
+from core.utils.text_search import tokenize
+
+VERSION_TTL = 30
+# A change must board its second vehicle within this long of the first vehicle's arrival.
+MAX_TRANSFER_WAIT_SECS = int(os.getenv("GTFS_DB_MAX_TRANSFER_WAIT_SECS", 3600))
+
+
+class DatabaseFeed:
+    """Stands in for GTFSDataset in the view layer; its version keys the response cache."""
+
+    def __init__(self, version_ttl=VERSION_TTL):
+        self.version_ttl = version_ttl
+        self._version = None
+        self._expires = 0.0
+        self._calendar = None
+        self._calendar_version = None
+
+    @property
+    def version(self):
+        now = time.monotonic()
+        if now >= self._expires:
+            latest = FeedVersion.objects.values_list("version", flat=True).first()
+            self._version = f"db-{latest or 'empty'}"
+            self._expires = now + self.version_ttl
+        return self._version
+
+    @property
+    def calendar(self):
+        """ServiceCalendar of the Calendar/CalendarDate tables, rebuilt when the feed version changes."""
+        version = self.version
+        if self._calendar_version != version:
+            weekly = list(Calendar.objects.values_list("service_id", *WEEKDAYS, "start_date", "end_date"))
+            exceptions = list(CalendarDate.objects.values_list("service_id", "date", "exception_type"))
+            self._calendar = ServiceCalendar(
+                [],
+                [row[0] for row in weekly],
+                [row[1:8] for row in weekly],
+                [row[8].toordinal() for row in weekly],
+                [row[9].toordinal() for row in weekly],
+                [row[0] for row in exceptions],
+                [row[1].toordinal() for row in exceptions],
+                [row[2] for row in exceptions],
+            )
+            self._calendar_version = version
+        return self._calendar
+
+    def services_running(self, day, strict=True):
+        """service_ids running on ``day``, or None not to filter (see ServiceCalendar.services_on)."""
+        services = self.calendar.services_on(day, strict=strict)
+        return None if services is None else self.calendar.service_ids[services].tolist()
+
+
+def _route_record(route_id, agency_id, short_name, long_name, route_type):
+    return {
+        "route_id": route_id,
+        "agency_id": agency_id or "",
+        "route_short_name": short_name or "",
+        "route_long_name": long_name or "",
+        "route_type": route_type,
+    }
+
+ROUTE_COLUMNS = ("route_id", "agency_id", "short_name", "long_name", "route_type")
+
+def _stops_in_box(lat, lon, radius_m):
+    """(stop_id, name, lat, lon) rows within the bounding box of a circle, via stop_lat_lon."""
+    dlat = radius_m / METRES_PER_DEG_LAT
+    dlon = radius_m / (METRES_PER_DEG_LON_EQUATOR * max(math.cos(math.radians(lat)), 0.01))
+    return list(
+        Stop.objects.filter(lat__range=(lat - dlat, lat + dlat), lon__range=(lon - dlon, lon + dlon))
+        .values_list("stop_id", "name", "lat", "lon")
+    )
+
+def _by_distance(rows, lat, lon, radius_m):
+    """rows within radius_m, nearest first, as (row, distance)."""
+    if not rows:
+        return []
+    distance = haversine_m(lat, lon, [row[2] for row in rows], [row[3] for row in rows])
+    order = [i for i in np.argsort(distance, kind="stable").tolist() if distance[i] <= radius_m]
+    return [(rows[i], float(distance[i])) for i in order]
+
+def find_nearest_stops(user_location, gtfs_data, spatial_idx, radius_km=1.0, k=None, limit=None):
+    lat, lon = user_location
+    radius_m = radius_km * 1000
+    found = _by_distance(_stops_in_box(lat, lon, radius_m), lat, lon, radius_m)
+    cap = min(n for n in (k, limit, len(found)) if n is not None)
+    return [
+        {"stop_id": stop_id, "stop_name": name, "stop_lat": stop_lat, "stop_lon": stop_lon, "distance_m": round(d, 1)}
+        for (stop_id, name, stop_lat, stop_lon), d in found[:cap]
+    ]
+
+def _name_matches(queryset, fields, query):
+    """Filter to rows where every query token appears in one of ``fields``."""
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+    for token in tokens:
+        match = Q()
+        for field in fields:
+            match |= Q(**{f"{field}__icontains": token})
+        queryset = queryset.filter(match)
+    return queryset
+
+@response_cache.cached("route_search", ttl=lambda: cache_ttl("route_search"))
+def search_routes_by_name(gtfs_data, route_name, limit=20):
+    query = route_name.strip()
+    routes = _name_matches(Route.objects.all(), ("short_name", "long_name"), query).annotate(
+        score=Case(
+            When(short_name__iexact=query, then=Value(6)),
+            When(short_name__istartswith=query, then=Value(4)),
+            When(long_name__istartswith=query, then=Value(3)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ),
+    ).order_by("-score", Length("long_name"), "route_id")[:limit]
+    return [
+        {
+            "route_id": route.route_id,
+            "route_short_name": route.short_name or "",
+            "route_long_name": route.long_name or "",
+            "route_type": route.route_type,
+            "score": float(route.score),
+        }
+        for route in routes
+    ]
+
+def search_stops(gtfs_data, query, near=None, limit=10):
+    query = query.strip()
+    stops = _name_matches(Stop.objects.all(), ("name",), query).annotate(
+        score=Case(
+            When(name__iexact=query, then=Value(6)),
+            When(name__istartswith=query, then=Value(4)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ),
+    ).order_by("-score", Length("name"), "stop_id")
+    rows = list(stops.values_list("stop_id", "name", "lat", "lon", "score")[:None if near else limit])
+    if not rows:
+        return []
+    scores = np.array([row[4] for row in rows], dtype=np.float64)
+    distance = None
+    if near is not None:
+        distance = haversine_m(near[0], near[1], [row[2] for row in rows], [row[3] for row in rows])
+        scores = scores / (1.0 + distance / STOP_SEARCH_DISTANCE_SCALE_M)
+        order = np.argsort(-scores, kind="stable")[:limit]
+        rows, scores, distance = [rows[i] for i in order], scores[order], distance[order]
+    return [
+        {
+            "stop_id": stop_id,
+            "stop_name": name,
+            "stop_lat": lat,
+            "stop_lon": lon,
+            "score": round(float(scores[n]), 3),
+            **({"distance_m": round(float(distance[n]), 1)} if distance is not None else {}),
+        }
+        for n, (stop_id, name, lat, lon, _) in enumerate(rows)
+    ]
+
+def get_stops_coordinates(gtfs_data, stop_ids):
+    stops = Stop.objects.in_bulk(stop_ids)
+    return {
+        stop_id: {"lat": stop.lat, "lon": stop.lon, "stop_name": stop.name} if stop else {}
+        for stop_id, stop in ((stop_id, stops.get(stop_id)) for stop_id in stop_ids)
+    }
+
+def get_routes_by_stops(gtfs_data, stop_ids):
+    """stop_id -> routes through it, from one join over the stops' visits."""
+    result = {stop_id: [] for stop_id in stop_ids}
+    pairs = (
+        Route.objects.filter(trip__stoptime__stop_id__in=stop_ids)
+        .values_list("trip__stoptime__stop_id", *ROUTE_COLUMNS)
+        .distinct()
+        .order_by("trip__stoptime__stop_id", "route_id")
+    )
+    for stop_id, *route in pairs:
+        result[stop_id].append(_route_record(*route))
+    return result
+
+@response_cache.cached("route_stops", ttl=lambda: cache_ttl("route_stops"))
+def get_route_stops(gtfs_data, route_id, direction=None):
+    """The route's distinct stop patterns; trips are grouped by their stop list in Python."""
+    if not Route.objects.filter(route_id=route_id).exists():
+        return None
+    stop_times = StopTime.objects.filter(trip__route_id=route_id)
+    if direction is not None:
+        stop_times = stop_times.filter(trip__direction_id=direction)
+    stops, trips = {}, defaultdict(list)
+    rows = stop_times.order_by("trip_id", "stop_sequence").values_list(
+        "trip_id", "trip__direction_id", "stop_id", "stop__name", "stop__lat", "stop__lon",
+    )
+    for trip_id, direction_id, stop_id, name, lat, lon in rows:
+        trips[trip_id, direction_id].append(stop_id)
+        stops[stop_id] = {"stop_id": stop_id, "stop_name": name, "lat": lat, "lon": lon}
+    counts = defaultdict(int)
+    for (_, direction_id), stop_ids in trips.items():
+        counts[direction_id, tuple(stop_ids)] += 1
+    # same order as the in-memory StopPatterns: by direction, then most trips first
+    ordered = sorted(counts.items(), key=lambda item: (-1 if item[0][0] is None else item[0][0], -item[1]))
+    return {
+        "route_id": route_id,
+        "patterns": [
+            {
+                "pattern_id": n,
+                "direction_id": direction_id,
+                "trips": count,
+                "stops": [stops[stop_id] for stop_id in stop_ids],
+            }
+            for n, ((direction_id, stop_ids), count) in enumerate(ordered)
+        ],
+    }
+
+def _trip_stop(stop_time, shift=0):
+    stop = stop_time.stop
+    return {
+        "stop_id": stop.stop_id,
+        "stop_name": stop.name,
+        "lat": stop.lat,
+        "lon": stop.lon,
+        "arrival_time": format_gtfs_time(stop_time.arrival_secs + shift),
+        "departure_time": format_gtfs_time(stop_time.departure_secs + shift),
+        "sequence": stop_time.stop_sequence,
+    }
+
+def get_trips_stops(gtfs_data, trip_ids):
+    result = {trip_id: [] for trip_id in trip_ids}
+    rows = StopTime.objects.filter(trip_id__in=trip_ids).select_related("stop").order_by("trip_id", "stop_sequence")
+    for stop_time in rows:
+        result[stop_time.trip_id].append(_trip_stop(stop_time))
+    return result
+
+def get_stop_transfers(gtfs_data, stop_id):
+    stop = Stop.objects.filter(stop_id=stop_id).values_list("lat", "lon").first()
+    if stop is None:
+        return None
+    nearby = _by_distance(_stops_in_box(*stop, TRANSFER_RADIUS_M), *stop, TRANSFER_RADIUS_M)
+    transfers = [
+        {
+            "stop_id": target,
+            "stop_name": name,
+            "walk_secs": int(math.ceil(d * WALK_DETOUR_FACTOR / WALK_SPEED_MPS)),
+            "distance_m": round(d, 1),
+        }
+        for (target, name, _, _), d in nearby if target != stop_id
+    ]
+    return sorted(transfers, key=lambda transfer: transfer["walk_secs"])
+
+# --- Shapes: simplified on demand; the response cache keeps each (shape, zoom) ---
+def _shape_index(shape_ids):
+    points = list(Shape.objects.filter(shape_id__in=shape_ids).values_list("shape_id", "lat", "lon", "sequence"))
+    return ShapeIndex(*zip(*points)) if points else ShapeIndex([], [], [], [])
+
+@response_cache.cached("trip_shape", ttl=lambda: cache_ttl("trip_shape"), normalize=clamped_zoom)
+def get_trip_shape(gtfs_data, trip_id, zoom=MAX_ZOOM):
+    found = list(Trip.objects.filter(trip_id=trip_id).values_list("shape_id", flat=True)[:1])
+    if not found:
+        return None
+    shape_id = found[0]
+    shapes = _shape_index([shape_id])
+    if shape_id in shapes:
+        return {"trip_id": trip_id, "zoom": zoom, **shapes.encoded(shape_id, zoom)}
+    stops = list(
+        StopTime.objects.filter(trip_id=trip_id).order_by("stop_sequence").values_list("stop__lat", "stop__lon")
+    )
+    return {
+        "trip_id": trip_id,
+        "zoom": zoom,
+        "shape_id": None,
+        "points": len(stops),
+        "polyline": encode_polyline([lat for lat, _ in stops], [lon for _, lon in stops]),
+    }
+
+@response_cache.cached("route_shape", ttl=lambda: cache_ttl("route_shape"), normalize=clamped_zoom)
+def get_route_shapes(gtfs_data, route_id, zoom=MAX_ZOOM):
+    if not Route.objects.filter(route_id=route_id).exists():
+        return None
+    shape_ids = list(dict.fromkeys(
+        Trip.objects.filter(route_id=route_id).exclude(shape_id__isnull=True).exclude(shape_id="")
+        .order_by("trip_id").values_list("shape_id", flat=True)
+    ))
+    shapes = _shape_index(shape_ids)
+    return {
+        "route_id": route_id,
+        "zoom": zoom,
+        "shapes": [shapes.encoded(shape_id, zoom) for shape_id in shape_ids if shape_id in shapes],
+    }
+
+# --- Vector tiles ---
+def render_vector_tile(gtfs_data, z, x, y):
+    west, south, east, north = tile_bounds(z, x, y, buffer=BUFFER)
+    stops = []
+    if z >= STOPS_MIN_ZOOM:
+        stops = list(
+            Stop.objects.filter(lat__range=(south, north), lon__range=(west, east))
+            .annotate(visits=Count("stoptime")).values_list("stop_id", "name", "lat", "lon", "visits")
+        )
+    lines = []
+    if z >= SHAPES_MIN_ZOOM:
+        # shapes with a point in the tile; the Shape table has no extent per shape
+        shape_ids = list(
+            Shape.objects.filter(lat__range=(south, north), lon__range=(west, east))
+            .order_by("shape_id").values_list("shape_id", flat=True).distinct()
+        )
+        shapes = _shape_index(shape_ids)
+        routes = {}
+        for shape_id, route_id, short_name, route_type in (
+            Trip.objects.filter(shape_id__in=shape_ids).order_by("trip_id")
+            .values_list("shape_id", "route_id", "route__short_name", "route__route_type")
+        ):
+            routes.setdefault(shape_id, {
+                "route_id": route_id, "route_short_name": short_name or "", "route_type": route_type,
+            })
+        lines = [
+            (*shapes.simplified(shape_id, z), {"shape_id": shape_id, **routes.get(shape_id, {"route_id": ""})})
+            for shape_id in shape_ids
+        ]
+    return encode_tile({
+        "stops": stop_features(
+            z, x, y, [stop[2] for stop in stops], [stop[3] for stop in stops], [stop[4] for stop in stops],
+            [{"stop_id": stop[0], "stop_name": stop[1]} for stop in stops],
+        ),
+        "routes": line_features(z, x, y, lines),
+    })
+
+def get_vector_tile(gtfs_data, z, x, y):
+    check_tile(z, x, y)
+    return tile_cache.get_or_render(gtfs_data.version, z, x, y, lambda: render_vector_tile(gtfs_data, z, x, y))
+
+# --- Timetable: frequency-based trips are templates offset from their first arrival ---
+def _is_frequency_trip():
+    return Exists(Frequency.objects.filter(trip_id=OuterRef("trip_id")))
+
+def _frequency_windows(trip_ids):
+    """trip_id -> ([(start, end, headway), ...] by start, template base)."""
+    windows = defaultdict(list)
+    for trip_id, start, end, headway in (
+        Frequency.objects.filter(trip_id__in=trip_ids).order_by("trip_id", "start_secs")
+        .values_list("trip_id", "start_secs", "end_secs", "headway_secs")
+    ):
+        windows[trip_id].append((start, end, headway))
+    bases = dict(
+        StopTime.objects.filter(trip_id__in=windows).values("trip_id").annotate(base=Min("arrival_secs"))
+        .values_list("trip_id", "base")
+    )
+    return {trip_id: (trip_windows, bases[trip_id]) for trip_id, trip_windows in windows.items()}
+
+def _earliest_shift(windows, stop_time, after_secs):
+    """Shift onto the first vehicle leaving ``stop_time`` at or after ``after_secs``, or None."""
+    if stop_time.trip_id not in windows:
+        return 0 if stop_time.departure_secs >= after_secs else None
+    trip_windows, base = windows[stop_time.trip_id]
+    offset = stop_time.departure_secs - base
+    for start, end, headway in trip_windows:
+        vehicle = start + max(0, -(-(after_secs - offset - start) // headway)) * headway
+        if vehicle < end:
+            return vehicle - base
+    return None
+
+def iter_departures(stop_id, start_secs, end_secs, limit, services=None):
+    """(departure_secs, StopTime) at a stop within [start_secs, end_secs], in order.
+
+    ``services`` limits the trips to those service_ids.
+    """
+    visits = StopTime.objects.filter(stop_id=stop_id)
+    if services is not None:
+        visits = visits.filter(trip__service_id__in=services)
+    timetabled = (
+        visits.filter(departure_secs__range=(start_secs, end_secs))
+        .exclude(_is_frequency_trip()).order_by("departure_secs")[:limit]
+    )
+    templates = list(visits.filter(_is_frequency_trip()))
+    windows = _frequency_windows({stop_time.trip_id for stop_time in templates})
+    progressions = []
+    for stop_time in templates:
+        trip_windows, base = windows[stop_time.trip_id]
+        offset = stop_time.departure_secs - base
+        for start, end, headway in trip_windows:
+            first, last = start + offset, min(end + offset, end_secs + 1)
+            begin = first + max(0, -(-(start_secs - first) // headway)) * headway
+            if begin < last:
+                progressions.append(zip(range(begin, last, headway), repeat(stop_time)))
+    return heapq.merge(
+        ((stop_time.departure_secs, stop_time) for stop_time in timetabled), *progressions,
+        key=lambda item: item[0],
+    )
+
+@response_cache.cached("departure_board", ttl=lambda: cache_ttl("departure_board"), normalize=to_minute("at"))
+def get_departure_board(gtfs_data, stop_id, time_window=30, at=None, limit=10, strict_calendar=False):
+    at = at or datetime.now()
+    start_secs = at.hour * 3600 + at.minute * 60 + at.second
+    end_secs = start_secs + (time_window * 60 if time_window is not None else SECONDS_PER_DAY)
+
+    streams = []
+    for days_back in range(1, -(end_secs // SECONDS_PER_DAY) - 1, -1):
+        shift = days_back * SECONDS_PER_DAY
+        service_date = (at - timedelta(days=days_back)).date()
+        services = gtfs_data.services_running(service_date, strict=strict_calendar)
+        departures = iter_departures(stop_id, start_secs + shift, end_secs + shift, limit, services=services)
+        streams.append(on_service_date(departures, shift, service_date))
+
+    board = []
+    for _, dep, stop_time, service_date in islice(heapq.merge(*streams, key=lambda item: item[0]), limit):
+        offset = dep - stop_time.departure_secs
+        board.append({
+            "trip_id": stop_time.trip_id,
+            "arrival_time": format_gtfs_time(stop_time.arrival_secs + offset),
+            "departure_time": format_gtfs_time(dep),
+            "stop_id": stop_time.stop_id,
+            "stop_sequence": stop_time.stop_sequence,
+            "service_date": service_date.isoformat(),
+        })
+    return board
+
+def get_departure_boards(gtfs_data, stop_ids, time_window=30, at=None, limit=10, strict_calendar=False):
+    at = at or datetime.now()
+    return {
+        stop_id: get_departure_board(
+            gtfs_data, stop_id, time_window=time_window, at=at, limit=limit, strict_calendar=strict_calendar,
+        )
+        for stop_id in stop_ids
+    }
+
+# --- Journeys: direct rides and one change at a shared stop, found by self-joins ---
+DIRECT_RIDES = """
+SELECT a.id, b.id FROM {st} a
+JOIN {st} b ON b.trip_id = a.trip_id AND b.stop_sequence > a.stop_sequence
+WHERE a.stop_id = %(start)s AND b.stop_id = %(end)s
+"""
+
+# Between scheduled trips the second leg is bounded in time, a range scan of
+# stoptime_stop_departure at the change stop. Frequency-based trips store
+# template times, so changes involving one (the last two parts) are not.
+CHANGE_RIDES = """
+SELECT a.id, b.id, c.id, d.id FROM {st} a
+JOIN {st} b ON b.trip_id = a.trip_id AND b.stop_sequence > a.stop_sequence
+JOIN {st} c ON c.stop_id = b.stop_id AND c.trip_id <> a.trip_id
+    AND c.departure_secs BETWEEN b.arrival_secs AND b.arrival_secs + %(wait)s
+JOIN {st} d ON d.trip_id = c.trip_id AND d.stop_sequence > c.stop_sequence
+WHERE a.stop_id = %(start)s AND d.stop_id = %(end)s AND a.departure_secs >= %(depart)s
+    AND a.trip_id NOT IN (SELECT trip_id FROM {freq}) AND c.trip_id NOT IN (SELECT trip_id FROM {freq})
+UNION ALL
+SELECT a.id, b.id, c.id, d.id FROM {st} a
+JOIN {st} b ON b.trip_id = a.trip_id AND b.stop_sequence > a.stop_sequence
+JOIN {st} c ON c.stop_id = b.stop_id AND c.trip_id <> a.trip_id
+JOIN {st} d ON d.trip_id = c.trip_id AND d.stop_sequence > c.stop_sequence
+WHERE a.stop_id = %(start)s AND d.stop_id = %(end)s AND a.trip_id IN (SELECT trip_id FROM {freq})
+UNION ALL
+SELECT a.id, b.id, c.id, d.id FROM {st} a
+JOIN {st} b ON b.trip_id = a.trip_id AND b.stop_sequence > a.stop_sequence
+JOIN {st} c ON c.stop_id = b.stop_id AND c.trip_id <> a.trip_id
+JOIN {st} d ON d.trip_id = c.trip_id AND d.stop_sequence > c.stop_sequence
+WHERE a.stop_id = %(start)s AND d.stop_id = %(end)s AND a.departure_secs >= %(depart)s
+    AND a.trip_id NOT IN (SELECT trip_id FROM {freq}) AND c.trip_id IN (SELECT trip_id FROM {freq})
+"""
+
+def _candidate_rides(sql, start_stop_id, end_stop_id, services=None, depart_secs=0):
+    params = {"start": start_stop_id, "end": end_stop_id, "depart": depart_secs, "wait": MAX_TRANSFER_WAIT_SECS}
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(st=StopTime._meta.db_table, freq=Frequency._meta.db_table), params)
+        rides = cursor.fetchall()
+    stop_times = StopTime.objects.in_bulk({pk for ride in rides for pk in ride})
+    rides = [tuple(stop_times[pk] for pk in ride) for ride in rides]
+    if services is None:
+        return rides
+    running = set(
+        Trip.objects.filter(trip_id__in={stop_time.trip_id for ride in rides for stop_time in ride},
+                            service_id__in=services).values_list("trip_id", flat=True)
+    )
+    return [ride for ride in rides if all(stop_time.trip_id in running for stop_time in ride)]
+
+def _ride(windows, board, alight, ready):
+    """(arrival, shift) on the first vehicle from ``board`` to ``alight`` at or after ``ready``."""
+    shift = _earliest_shift(windows, board, ready)
+    return None if shift is None else (alight.arrival_secs + shift, shift)
+
+@response_cache.cached("path", ttl=lambda: cache_ttl("path"), normalize=to_minute("depart_at"))
+def calculate_path(gtfs_data, start_stop_id, end_stop_id, depart_at=None, max_transfers=2, strict_calendar=False):
+    """Fastest direct ride and, if it arrives earlier, the fastest ride with one change."""
+    if start_stop_id == end_stop_id:
+        return []
+    depart_at = depart_at or datetime.now()
+    depart_secs = depart_at.hour * 3600 + depart_at.minute * 60 + depart_at.second
+    services = gtfs_data.services_running(depart_at.date(), strict=strict_calendar)
+
+    direct = _candidate_rides(DIRECT_RIDES, start_stop_id, end_stop_id, services)
+    changes = (
+        _candidate_rides(CHANGE_RIDES, start_stop_id, end_stop_id, services, depart_secs) if max_transfers >= 1 else []
+    )
+    windows = _frequency_windows({stop_time.trip_id for ride in direct + changes for stop_time in ride})
+
+    best_direct = None
+    for board, alight in direct:
+        ride = _ride(windows, board, alight, depart_secs)
+        if ride and (best_direct is None or ride[0] < best_direct[0]):
+            best_direct = (ride[0], [(board, alight, ride[1])])
+    best_change = None
+    for board, alight, board2, alight2 in changes:
+        first = _ride(windows, board, alight, depart_secs)
+        second = first and _ride(windows, board2, alight2, first[0])
+        if second and (best_change is None or second[0] < best_change[0]):
+            best_change = (second[0], [(board, alight, first[1]), (board2, alight2, second[1])])
+
+    journeys = [best_direct] if best_direct else []
+    if best_change and (best_direct is None or best_change[0] < best_direct[0]):
+        journeys.append(best_change)
+    return [_format_itinerary(legs, depart_secs) for _, legs in journeys]
+
+def _format_itinerary(legs, depart_secs):
+    trips = Trip.objects.select_related("route").in_bulk({board.trip_id for board, _, _ in legs})
+    formatted = []
+    for board, alight, shift in legs:
+        trip = trips[board.trip_id]
+        stops = [
+            _trip_stop(stop_time, shift)
+            for stop_time in StopTime.objects.filter(
+                trip_id=board.trip_id, stop_sequence__range=(board.stop_sequence, alight.stop_sequence),
+            ).select_related("stop").order_by("stop_sequence")
+        ]
+        formatted.append({
+            "type": "transit",
+            "route_id": trip.route.route_id,
+            "route_short_name": trip.route.short_name or "",
+            "trip_id": trip.trip_id,
+            "headsign": trip.headsign or "",
+            "from_stop_id": stops[0]["stop_id"],
+            "to_stop_id": stops[-1]["stop_id"],
+            "departure_time": stops[0]["departure_time"],
+            "arrival_time": stops[-1]["arrival_time"],
+            "stops": stops,
+        })
+    return {
+        "departure_time": formatted[0]["departure_time"],
+        "arrival_time": formatted[-1]["arrival_time"],
+        "duration_secs": legs[-1][1].arrival_secs + legs[-1][2] - depart_secs,
+        "transfers": len(formatted) - 1,
+        "legs": formatted,
+    }
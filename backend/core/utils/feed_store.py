@@ -0,0 +1,147 @@
+"""Per-table and per-entity GTFS storage in Redis, namespaced by feed version.
+
+Layout for a feed version ``v``::
+
+    gtfs:current              -> v (the version new workers should use)
+    gtfs:v:meta               hash: published, tables
+    gtfs:v:table:<name>       zlib(JSON columns) of one raw GTFS table
+    gtfs:v:stops              hash stop_id  -> zlib(JSON stop record + route_ids)
+    gtfs:v:routes             hash route_id -> zlib(JSON route record)
+    gtfs:v:trips              hash trip_id  -> zlib(JSON trip record + ordered stops)
+
+Tables are fetched together with one MGET and entities with HMGET, so a
+worker never moves more than it needs in a single round trip. Old and new
+versions coexist until the old one is retired with a TTL.
+"""
+import json
+import logging
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+CURRENT_KEY = "gtfs:current"
+WRITE_CHUNK = 500
+
+
+def pack(obj):
+    return zlib.compress(json.dumps(obj, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def unpack(raw):
+    return json.loads(zlib.decompress(raw)) if raw is not None else None
+
+
+class RedisFeedStore:
+    def __init__(self, client, pointer_ttl=30):
+        self.client = client
+        # the current-version pointer is re-read at most every pointer_ttl seconds
+        self.pointer_ttl = pointer_ttl
+        self._current = (None, 0.0)
+
+    def key(self, version, name):
+        return f"gtfs:{version}:{name}"
+
+    def current_version(self):
+        if not self.client:
+            return None
+        version, expires = self._current
+        if time.monotonic() < expires:
+            return version
+        try:
+            version = self.client.get(CURRENT_KEY)
+        except Exception as e:
+            logger.error(f"Redis read error for {CURRENT_KEY}: {e}")
+            return None
+        version = version.decode() if isinstance(version, bytes) else version
+        self._current = (version, time.monotonic() + self.pointer_ttl)
+        return version
+
+    def has_version(self, version):
+        try:
+            return bool(self.client and self.client.exists(self.key(version, "meta")))
+        except Exception as e:
+            logger.error(f"Redis read error for feed {version}: {e}")
+            return False
+
+    # --- Writes ---
+    def publish(self, version, tables, stops, routes, trips, make_current=True):
+        """Store raw tables and entity hashes for ``version``.
+
+        ``tables`` is {name: {column: [values]}}; ``stops``, ``routes`` and
+        ``trips`` are {id: record} mappings.
+        """
+        if not self.client:
+            return False
+        lock = self.key(version, "publishing")
+        try:
+            if not self.client.set(lock, b"1", nx=True, ex=300):
+                return False  # another worker is publishing this version
+            pipe = self.client.pipeline(transaction=False, bulk=True)
+            for name, columns in tables.items():
+                pipe.set(self.key(version, f"table:{name}"), pack(columns))
+            for name, entities in (("stops", stops), ("routes", routes), ("trips", trips)):
+                items = list(entities.items())
+                for i in range(0, len(items), WRITE_CHUNK):
+                    pipe.hset(self.key(version, name), mapping={k: pack(v) for k, v in items[i:i + WRITE_CHUNK]})
+            pipe.hset(self.key(version, "meta"), mapping={
+                "published": str(int(time.time())),
+                "tables": ",".join(tables),
+            })
+            if make_current:
+                pipe.set(CURRENT_KEY, version)
+            pipe.delete(lock)
+            pipe.execute()
+            if make_current:
+                self._current = (version, time.monotonic() + self.pointer_ttl)
+            logger.info(f"Published GTFS feed {version} to Redis.")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to publish GTFS feed {version}: {e}")
+            return False
+
+    def retire(self, version, ttl=3600):
+        """Let an old version expire once workers have moved to the current one."""
+        if not self.client:
+            return
+        try:
+            names = ["meta", "stops", "routes", "trips"]
+            meta = self.client.hget(self.key(version, "meta"), "tables")
+            if meta:
+                names += [f"table:{name}" for name in (meta.decode() if isinstance(meta, bytes) else meta).split(",")]
+            pipe = self.client.pipeline(transaction=False)
+            for name in names:
+                pipe.expire(self.key(version, name), ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to retire GTFS feed {version}: {e}")
+
+    # --- Reads ---
+    def load_tables(self, version, names):
+        """{name: {column: [values]}} for every table present, in one MGET."""
+        if not self.client:
+            return None
+        try:
+            keys = [self.key(version, f"table:{name}") for name in names]
+            raw = self.client.call("mget", keys, bulk=True)
+        except Exception as e:
+            logger.error(f"Redis read error for feed {version} tables: {e}")
+            return None
+        return {name: unpack(value) for name, value in zip(names, raw) if value is not None}
+
+    def get_many(self, version, kind, ids):
+        """{id: record} for the ids found in one entity hash (HMGET), or None on error."""
+        ids = list(ids)
+        if not self.client:
+            return None
+        if not ids:
+            return {}
+        try:
+            raw = self.client.hmget(self.key(version, kind), ids)
+        except Exception as e:
+            logger.error(f"Redis read error for feed {version} {kind}: {e}")
+            return None
+        return {entity_id: unpack(value) for entity_id, value in zip(ids, raw) if value is not None}
+
+    def get(self, version, kind, entity_id):
+        return (self.get_many(version, kind, [entity_id]) or {}).get(entity_id)
@@ -0,0 +1,115 @@
+"""Walking transfers between nearby stops, stored as a CSR adjacency.
+
+Stop j's footpaths are targets/walk_secs/distance_m[offsets[j]:offsets[j + 1]],
+sorted by walking time. The arrays are saved next to the feed as an .npz keyed
+by a fingerprint of the stop coordinates and the walking parameters, so the
+graph is only recomputed when the stops or the settings change.
+"""
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from core.utils.frequencies import csr_offsets
+from core.utils.spatial import neighbour_pairs
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_RADIUS_M = float(os.getenv("GTFS_TRANSFER_RADIUS_M", 400))
+WALK_SPEED_MPS = float(os.getenv("GTFS_WALK_SPEED_MPS", 1.2))
+# Streets are not straight lines; scale crow-flies distance to approximate walking.
+WALK_DETOUR_FACTOR = 1.3
+
+
+class Footpaths:
+    ARRAY_FIELDS = ("offsets", "targets", "walk_secs", "distance_m")
+
+    def __init__(self, offsets, targets, walk_secs, distance_m, fingerprint):
+        self.offsets = offsets
+        self.targets = targets
+        self.walk_secs = walk_secs
+        self.distance_m = distance_m
+        self.fingerprint = fingerprint
+
+    def __len__(self):
+        return len(self.targets)
+
+    def from_stop(self, stop_idx):
+        """(targets, walk_secs, distance_m) slices for one stop."""
+        lo, hi = self.offsets[stop_idx], self.offsets[stop_idx + 1]
+        return self.targets[lo:hi], self.walk_secs[lo:hi], self.distance_m[lo:hi]
+
+    def adjacency(self):
+        """Plain-list adjacency {stop: [(target, walk_secs), ...]} for tight Python loops."""
+        offsets = self.offsets.tolist()
+        targets = self.targets.tolist()
+        walk_secs = self.walk_secs.tolist()
+        return {
+            j: list(zip(targets[offsets[j]:offsets[j + 1]], walk_secs[offsets[j]:offsets[j + 1]]))
+            for j in range(len(offsets) - 1)
+            if offsets[j + 1] > offsets[j]
+        }
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+
+    def save(self, path):
+        np.savez(
+            path,
+            offsets=self.offsets,
+            targets=self.targets,
+            walk_secs=self.walk_secs,
+            distance_m=self.distance_m,
+            fingerprint=np.array(self.fingerprint),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data["offsets"], data["targets"], data["walk_secs"], data["distance_m"],
+                str(data["fingerprint"]),
+            )
+
+
+def footpath_fingerprint(gtfs_data, radius_m, walk_speed):
+    digest = hashlib.sha1()
+    digest.update(gtfs_data.stop_lat.tobytes())
+    digest.update(gtfs_data.stop_lon.tobytes())
+    digest.update(f"{radius_m}:{walk_speed}:{WALK_DETOUR_FACTOR}".encode())
+    return digest.hexdigest()
+
+
+def compute_footpaths(gtfs_data, radius_m=TRANSFER_RADIUS_M, walk_speed=WALK_SPEED_MPS):
+    """Compute footpaths between every pair of stops within ``radius_m``."""
+    src, dst, distance = neighbour_pairs(gtfs_data.stop_lat, gtfs_data.stop_lon, radius_m)
+    walk_secs = np.ceil(distance * WALK_DETOUR_FACTOR / walk_speed).astype(np.int32)
+    order = np.lexsort((walk_secs, src))
+    return Footpaths(
+        csr_offsets(src[order], len(gtfs_data.stop_ids)),
+        dst[order].astype(np.int32),
+        walk_secs[order],
+        distance[order].astype(np.float32),
+        footpath_fingerprint(gtfs_data, radius_m, walk_speed),
+    )
+
+
+def load_footpaths(gtfs_data, path, radius_m=TRANSFER_RADIUS_M, walk_speed=WALK_SPEED_MPS):
+    """Load persisted footpaths if they match the feed, otherwise compute and persist them."""
+    fingerprint = footpath_fingerprint(gtfs_data, radius_m, walk_speed)
+    if os.path.exists(path):
+        try:
+            footpaths = Footpaths.load(path)
+            if footpaths.fingerprint == fingerprint:
+                return footpaths
+            logger.info(f"Footpaths at {path} are stale, recomputing.")
+        except Exception as e:
+            logger.error(f"Failed to read footpaths from {path}: {e}")
+
+    footpaths = compute_footpaths(gtfs_data, radius_m, walk_speed)
+    try:
+        footpaths.save(path)
+    except OSError as e:
+        logger.warning(f"Could not persist footpaths to {path}: {e}")
+    return footpaths
@@ -0,0 +1,103 @@
+"""Lazy expansion of frequency-based trips (frequencies.txt).
+
+A trip listed in frequencies.txt is a template: its stop_times are offsets
+from the trip's first arrival, and each (start_time, end_time, headway_secs)
+window runs one vehicle every headway from start_time up to, but not
+including, end_time. Rather than materialising every vehicle, each
+(stop_time row, window) pair is kept as an arithmetic progression of
+departures and only the part overlapping a query window is generated.
+"""
+import heapq
+from itertools import repeat
+
+import numpy as np
+
+
+def csr_offsets(sorted_keys, size):
+    """Offsets such that key k occupies [offsets[k], offsets[k + 1]) of a sorted array."""
+    counts = np.bincount(sorted_keys, minlength=size)
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+class FrequencyIndex:
+    """Headway windows per trip, and the departure progressions they induce per stop."""
+
+    ARRAY_FIELDS = (
+        "freq_trip", "freq_start", "freq_end", "freq_headway", "trip_freq_offsets",
+        "trip_is_frequency", "trip_base",
+        "prog_row", "prog_first", "prog_last", "prog_headway", "stop_prog_offsets",
+    )
+
+    def __init__(self, gtfs_data, trips, starts, ends, headways):
+        n_trips = len(gtfs_data.trip_ids)
+        order = np.lexsort((starts, trips))
+        self.freq_trip = np.asarray(trips, dtype=np.int32)[order]
+        self.freq_start = np.asarray(starts, dtype=np.int32)[order]
+        self.freq_end = np.asarray(ends, dtype=np.int32)[order]
+        self.freq_headway = np.asarray(headways, dtype=np.int32)[order]
+        # trip i's windows are freq_*[trip_freq_offsets[i]:trip_freq_offsets[i + 1]]
+        self.trip_freq_offsets = csr_offsets(self.freq_trip, n_trips)
+        window_counts = np.diff(self.trip_freq_offsets)
+        self.trip_is_frequency = window_counts > 0
+
+        # Template times are relative to the first arrival of the trip.
+        has_rows = np.diff(gtfs_data.trip_offsets) > 0
+        self.trip_base = np.zeros(n_trips, dtype=np.int32)
+        self.trip_base[has_rows] = gtfs_data.st_arrival[gtfs_data.trip_offsets[:-1][has_rows]]
+
+        rows = np.flatnonzero(self.trip_is_frequency[gtfs_data.st_trip])
+        row_trips = gtfs_data.st_trip[rows]
+        counts = window_counts[row_trips]
+        prog_row = np.repeat(rows, counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        window = np.repeat(self.trip_freq_offsets[:-1][row_trips], counts) + within
+
+        offset = gtfs_data.st_departure[prog_row] - self.trip_base[gtfs_data.st_trip[prog_row]]
+        first = self.freq_start[window] + offset
+        stop = gtfs_data.st_stop[prog_row]
+        order = np.lexsort((first, stop))
+        # progression p departs first, first + headway, ... while < last
+        self.prog_row = prog_row[order].astype(np.int32)
+        self.prog_first = first[order].astype(np.int32)
+        self.prog_last = (self.freq_end[window] + offset)[order].astype(np.int32)
+        self.prog_headway = self.freq_headway[window][order]
+        self.stop_prog_offsets = csr_offsets(stop[order], len(gtfs_data.stop_ids))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        for name in cls.ARRAY_FIELDS:
+            setattr(index, name, arrays[name])
+        return index
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+
+    def departures(self, stop_idx, start_secs, end_secs):
+        """Lazily yield (departure_secs, row) at a stop within [start_secs, end_secs], in order."""
+        lo, hi = self.stop_prog_offsets[stop_idx], self.stop_prog_offsets[stop_idx + 1]
+        if lo == hi:
+            return iter(())
+        first = self.prog_first[lo:hi].astype(np.int64)
+        headway = self.prog_headway[lo:hi].astype(np.int64)
+        skipped = np.maximum(0, _ceil_div(start_secs - first, headway))
+        begin = first + skipped * headway
+        stop = np.minimum(self.prog_last[lo:hi], end_secs + 1)
+        live = np.flatnonzero(begin < stop)
+        return heapq.merge(*(
+            zip(range(int(begin[p]), int(stop[p]), int(headway[p])), repeat(int(self.prog_row[lo + p])))
+            for p in live
+        ))
+
+    def trip_starts(self, trip_idx, start_secs, end_secs):
+        """Vehicle start times of a trip within [start_secs, end_secs]."""
+        for w in range(self.trip_freq_offsets[trip_idx], self.trip_freq_offsets[trip_idx + 1]):
+            start, end, headway = int(self.freq_start[w]), int(self.freq_end[w]), int(self.freq_headway[w])
+            first = start + max(0, _ceil_div(start_secs - start, headway)) * headway
+            yield from range(first, min(end, end_secs + 1), headway)
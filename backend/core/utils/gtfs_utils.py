@@ -1,17 +1,40 @@
 import os
 import json
+import heapq
+import hashlib
+import inspect
+import time
 import logging
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from functools import cached_property
+from collections import OrderedDict, defaultdict, deque
+from itertools import islice
 
+import numpy as np
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
-from rtree import index as rtree_index
 from dotenv import load_dotenv
-import redis
 from django.conf import settings
 
+from core.utils.frequencies import FrequencyIndex, csr_offsets
+from core.utils.isochrone import (
+    ACCESS_RADIUS_M, BUCKET_SECS, check_minutes, reach_polygon, walk_reach_m, walk_secs,
+)
+from core.utils.routing import TransitNetwork
+from core.utils.cache import TwoTierCache, to_minute
+from core.utils.feed_store import RedisFeedStore
+from core.utils.redis_client import ResilientRedis
+from core.utils.footpaths import TRANSFER_RADIUS_M, WALK_SPEED_MPS, Footpaths, footpath_fingerprint, load_footpaths
+from core.utils.patterns import StopPatterns
+from core.utils.service_calendar import WEEKDAYS, ServiceCalendar, on_service_date, parse_gtfs_date
+from core.utils.shapes import MAX_ZOOM, ShapeIndex, clamped_zoom, encode_polyline
+from core.utils.snapshot import open_snapshot, prune_snapshots, source_signature, write_snapshot
+from core.utils.spatial import StopGrid, haversine_m
+from core.utils.tiles import (
+    BUFFER, STOPS_MIN_ZOOM, TileCache, check_tile, encode_tile, line_features, stop_features, tile_bounds,
+)
+from core.utils.text_search import TextIndex
+from core.utils.travel_matrix import MATRIX_MAX_MINUTES, MatrixPool
+
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,35 +42,74 @@ load_dotenv()
 
 BASE_DIR = settings.BASE_DIR
 GTFS_DIR = os.path.join(BASE_DIR, "data", "gtfs")
+FOOTPATHS_PATH = os.path.join(GTFS_DIR, "footpaths.npz")
+SNAPSHOT_DIR = os.getenv("GTFS_SNAPSHOT_DIR", os.path.join(BASE_DIR, "data", "compiled"))
+TILE_DIR = os.getenv("GTFS_TILE_DIR", os.path.join(BASE_DIR, "data", "tiles"))
+USE_SNAPSHOT = os.getenv("GTFS_USE_SNAPSHOT", "1") != "0"
 FILES = ["stops", "routes", "trips", "stop_times"]
+OPTIONAL_FILES = ["frequencies", "shapes", "calendar", "calendar_dates"]
+SECONDS_PER_DAY = 24 * 3600
 
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.25))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.25))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+# Skip Redis for REDIS_BREAKER_COOLDOWN seconds after this many consecutive failures.
+REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", 3))
+REDIS_BREAKER_COOLDOWN = float(os.getenv("REDIS_BREAKER_COOLDOWN", 10))
+
+# Nearest-stop candidates are cached per fixed-size lat/lon cell, not per coordinate.
+NEAREST_CELL_DEG = float(os.getenv("NEAREST_STOPS_CELL_DEG", 0.0025))  # ~280m at the equator
+NEAREST_CACHE_TTL = int(os.getenv("NEAREST_STOPS_CACHE_TTL", 6 * 3600))
+NEAREST_CACHE_MAX_CELLS = int(os.getenv("NEAREST_STOPS_CACHE_MAX_CELLS", 4096))
+
+# Result cache TTLs per endpoint (seconds), overridable with CACHE_TTL_<NAME>.
+CACHE_TTLS = {
+    "route_search": 6 * 3600,
+    "routes_by_stop": 6 * 3600,
+    "route_stops": 6 * 3600,
+    "departure_board": 30,
+    "path": 120,
+    "trip_shape": 24 * 3600,
+    "route_shape": 24 * 3600,
+    "tile": 7 * 24 * 3600,
+    "isochrone": 600,
+}
+# Distance at which a stop-name match counts half as much as the same match next to the user.
+STOP_SEARCH_DISTANCE_SCALE_M = float(os.getenv("STOP_SEARCH_DISTANCE_SCALE_M", 5000))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+
+def cache_ttl(name):
+    return int(os.getenv(f"CACHE_TTL_{name.upper()}", CACHE_TTLS[name]))
 
 # --- Redis Setup ---
 def get_redis_client():
-    try:
-        client = redis.StrictRedis(
-            host=os.getenv("REDIS_HOST"),
-            port=REDIS_PORT,
-            username=os.getenv("REDIS_USERNAME"),
-            password=os.getenv("REDIS_PASSWORD"),
-            db=REDIS_DB,
-            decode_responses=True
-        )
-        client.ping()
-        return client
-    except redis.ConnectionError:
-        logger.warning("Redis unavailable, caching disabled.")
-        return None
+    """Pooled client that connects on first use; see core.utils.redis_client."""
+    return ResilientRedis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        username=os.getenv("REDIS_USERNAME"),
+        password=os.getenv("REDIS_PASSWORD"),
+        db=REDIS_DB,
+        connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        failure_threshold=REDIS_BREAKER_FAILURES,
+        cooldown=REDIS_BREAKER_COOLDOWN,
+    )
 
 redis_client = get_redis_client()
+feed_store = RedisFeedStore(redis_client)
+response_cache = TwoTierCache(lambda: redis_client, max_entries=CACHE_MAX_ENTRIES)
+tile_cache = TileCache(TILE_DIR, lambda: redis_client, ttl=cache_ttl("tile"))
+matrix_pool = MatrixPool()
 
-def cache_to_redis(key, data):
+def cache_to_redis(key, data, ttl=None):
     if redis_client:
         try:
-            redis_client.set(key, json.dumps(data))
+            redis_client.set(key, json.dumps(data), ex=ttl)
             logger.info(f"Cached {key} to Redis.")
         except Exception as e:
             logger.error(f"Failed to cache {key}: {e}")
@@ -63,143 +125,1062 @@ def load_from_redis(key):
             logger.error(f"Redis read error for {key}: {e}")
     return None
 
+# --- GTFS Dataset ---
+class GTFSDataset:
+    """GTFS feed held as typed column arrays with hash indexes built once at load.
+
+    Stop times are sorted by (trip, stop_sequence) and addressed through
+    CSR-style offset arrays, so a trip's stop times or a stop's visits are a
+    contiguous slice rather than a scan over the whole feed. The arrays named
+    in ARRAY_FIELDS are everything compile_gtfs persists; the dict indexes are
+    derived from them on first use.
+    """
+
+    ARRAY_FIELDS = (
+        "stop_ids", "stop_names", "stop_lat", "stop_lon",
+        "route_ids", "route_agency_ids", "route_short_names", "route_long_names", "route_types",
+        "trip_ids", "trip_route", "trip_service_ids", "trip_headsigns", "trip_direction", "trip_shape_ids",
+        "st_trip", "st_stop", "st_sequence", "st_arrival", "st_departure",
+        "trip_offsets", "stop_rows", "stop_offsets",
+        "timetabled_rows", "timetabled_offsets", "stop_departures", "trip_service",
+    )
+
+    def __init__(self, tables=None):
+        if tables is None:
+            return
+        self._build_stops(tables["stops"])
+        self._build_routes(tables["routes"])
+        self._build_trips(tables["trips"])
+        self._build_stop_times(tables["stop_times"])
+        self._build_frequencies(tables.get("frequencies"))
+        self._build_patterns()
+        self._build_shapes(tables.get("shapes"))
+        self._build_calendar(tables.get("calendar"), tables.get("calendar_dates"))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild a dataset from persisted arrays (e.g. read-only memmaps)."""
+        dataset = cls()
+        for name in cls.ARRAY_FIELDS:
+            setattr(dataset, name, arrays[name])
+        dataset.frequencies = FrequencyIndex.from_arrays(
+            {name: arrays[f"frequencies.{name}"] for name in FrequencyIndex.ARRAY_FIELDS}
+        )
+        dataset.patterns = StopPatterns.from_arrays(
+            {name: arrays[f"patterns.{name}"] for name in StopPatterns.ARRAY_FIELDS}
+        )
+        dataset.shapes = ShapeIndex.from_arrays({name: arrays[f"shapes.{name}"] for name in ShapeIndex.ARRAY_FIELDS})
+        dataset.calendar = ServiceCalendar.from_arrays(
+            {name: arrays[f"calendar.{name}"] for name in ServiceCalendar.ARRAY_FIELDS}
+        )
+        return dataset
+
+    def to_arrays(self):
+        arrays = {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+        arrays.update({f"frequencies.{name}": a for name, a in self.frequencies.to_arrays().items()})
+        arrays.update({f"patterns.{name}": a for name, a in self.patterns.to_arrays().items()})
+        arrays.update({f"shapes.{name}": a for name, a in self.shapes.to_arrays().items()})
+        arrays.update({f"calendar.{name}": a for name, a in self.calendar.to_arrays().items()})
+        return arrays
+
+    def _build_stops(self, df):
+        self.stop_ids = df["stop_id"].to_numpy(dtype=str)
+        self.stop_names = df["stop_name"].to_numpy(dtype=str)
+        self.stop_lat = pd.to_numeric(df["stop_lat"]).to_numpy(dtype=np.float64)
+        self.stop_lon = pd.to_numeric(df["stop_lon"]).to_numpy(dtype=np.float64)
+
+    def _build_routes(self, df):
+        blank = pd.Series([""] * len(df))
+        self.route_ids = df["route_id"].to_numpy(dtype=str)
+        self.route_agency_ids = df.get("agency_id", blank).to_numpy(dtype=str)
+        self.route_short_names = df.get("route_short_name", blank).to_numpy(dtype=str)
+        self.route_long_names = df.get("route_long_name", blank).to_numpy(dtype=str)
+        self.route_types = pd.to_numeric(df["route_type"], errors="coerce").fillna(3).to_numpy(dtype=np.int16)
+
+    def _build_trips(self, df):
+        blank = pd.Series([""] * len(df))
+        self.trip_ids = df["trip_id"].to_numpy(dtype=str)
+        self.trip_route = np.array(
+            [self.route_index.get(route_id, -1) for route_id in df["route_id"]], dtype=np.int32
+        )
+        self.trip_service_ids = df["service_id"].to_numpy(dtype=str)
+        self.trip_headsigns = df.get("trip_headsign", blank).to_numpy(dtype=str)
+        self.trip_direction = pd.to_numeric(
+            df.get("direction_id", blank), errors="coerce"
+        ).fillna(-1).to_numpy(dtype=np.int8)
+        self.trip_shape_ids = df.get("shape_id", blank).to_numpy(dtype=str)
+
+    def _build_stop_times(self, df):
+        trip = np.array([self.trip_index.get(t, -1) for t in df["trip_id"]], dtype=np.int32)
+        stop = np.array([self.stop_index.get(s, -1) for s in df["stop_id"]], dtype=np.int32)
+        sequence = pd.to_numeric(df["stop_sequence"]).to_numpy(dtype=np.int32)
+        known = (trip >= 0) & (stop >= 0)
+        if not known.all():
+            logger.warning(f"Dropping {int((~known).sum())} stop_times with unknown trip or stop.")
+
+        order = np.lexsort((sequence, trip))
+        order = order[known[order]]
+        self.st_trip = trip[order]
+        self.st_stop = stop[order]
+        self.st_sequence = sequence[order]
+        self.st_arrival = parse_gtfs_times(df["arrival_time"])[order]
+        self.st_departure = parse_gtfs_times(df["departure_time"])[order]
+
+        # trip i owns rows trip_offsets[i]:trip_offsets[i + 1]
+        self.trip_offsets = csr_offsets(self.st_trip, len(self.trip_ids))
+        # stop j's rows are stop_rows[stop_offsets[j]:stop_offsets[j + 1]], by departure
+        self.stop_rows = np.lexsort((self.st_departure, self.st_stop)).astype(np.int32)
+        self.stop_offsets = csr_offsets(self.st_stop[self.stop_rows], len(self.stop_ids))
+
+    def _build_frequencies(self, df):
+        if df is None or df.empty:
+            df = pd.DataFrame(columns=["trip_id", "start_time", "end_time", "headway_secs"])
+        trips = np.array([self.trip_index.get(t, -1) for t in df["trip_id"]], dtype=np.int32)
+        known = trips >= 0
+        self.frequencies = FrequencyIndex(
+            self,
+            trips[known],
+            parse_gtfs_times(df["start_time"])[known],
+            parse_gtfs_times(df["end_time"])[known],
+            pd.to_numeric(df["headway_secs"]).to_numpy(dtype=np.int32)[known],
+        )
+
+        # Timetabled (non-frequency) rows per stop, sorted by departure so that
+        # stop_departures over a stop's slice can be bisected.
+        timetabled = ~self.frequencies.trip_is_frequency[self.st_trip[self.stop_rows]]
+        self.timetabled_rows = self.stop_rows[timetabled]
+        self.timetabled_offsets = csr_offsets(self.st_stop[self.timetabled_rows], len(self.stop_ids))
+        self.stop_departures = self.st_departure[self.timetabled_rows]
+
+    def _build_patterns(self):
+        self.patterns = StopPatterns(self)
+        profiles = len(self.patterns.profile_offsets) - 1
+        logger.info(
+            f"Grouped {len(self.trip_ids)} trips into {len(self.patterns)} stop patterns "
+            f"and {profiles} time profiles."
+        )
+
+    def _build_shapes(self, df):
+        if df is None or df.empty:
+            df = pd.DataFrame(columns=["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"])
+        started = time.perf_counter()
+        self.shapes = ShapeIndex(
+            df["shape_id"].to_numpy(dtype=str),
+            pd.to_numeric(df["shape_pt_lat"]).to_numpy(dtype=np.float64),
+            pd.to_numeric(df["shape_pt_lon"]).to_numpy(dtype=np.float64),
+            pd.to_numeric(df["shape_pt_sequence"]).to_numpy(dtype=np.int64),
+        )
+        logger.info(f"Simplified {len(self.shapes)} shapes in {(time.perf_counter() - started) * 1000:.1f}ms.")
+
+    def _build_calendar(self, calendar, calendar_dates):
+        if calendar is None or calendar.empty:
+            calendar = pd.DataFrame(columns=["service_id", *WEEKDAYS, "start_date", "end_date"])
+        if calendar_dates is None or calendar_dates.empty:
+            calendar_dates = pd.DataFrame(columns=["service_id", "date", "exception_type"])
+        self.calendar = ServiceCalendar(
+            self.trip_service_ids,
+            calendar["service_id"].to_numpy(dtype=str),
+            np.column_stack([calendar[day].to_numpy(dtype=str) == "1" for day in WEEKDAYS]),
+            [parse_gtfs_date(value) for value in calendar["start_date"]],
+            [parse_gtfs_date(value) for value in calendar["end_date"]],
+            calendar_dates["service_id"].to_numpy(dtype=str),
+            [parse_gtfs_date(value) for value in calendar_dates["date"]],
+            pd.to_numeric(calendar_dates["exception_type"]).to_numpy(dtype=np.int8),
+        )
+        # trip i runs service calendar.service_ids[trip_service[i]]
+        self.trip_service = np.searchsorted(self.calendar.service_ids, self.trip_service_ids).astype(np.int32)
+        logger.info(
+            f"Service calendar: {len(self.calendar)} services from {self.calendar.start} to {self.calendar.end}."
+        )
+
+    # --- Derived indexes ---
+    @cached_property
+    def stop_index(self):
+        return {stop_id: i for i, stop_id in enumerate(self.stop_ids.tolist())}
+
+    @cached_property
+    def route_index(self):
+        return {route_id: i for i, route_id in enumerate(self.route_ids.tolist())}
+
+    @cached_property
+    def trip_index(self):
+        return {trip_id: i for i, trip_id in enumerate(self.trip_ids.tolist())}
+
+    @cached_property
+    def routes(self):
+        """route_id -> routes.txt record."""
+        return {
+            route_id: {
+                "route_id": route_id,
+                "agency_id": agency_id,
+                "route_short_name": short_name,
+                "route_long_name": long_name,
+                "route_type": route_type,
+            }
+            for route_id, agency_id, short_name, long_name, route_type in zip(
+                self.route_ids.tolist(), self.route_agency_ids.tolist(), self.route_short_names.tolist(),
+                self.route_long_names.tolist(), self.route_types.tolist(),
+            )
+        }
+
+    @cached_property
+    def route_trips(self):
+        """route_id -> trip indices."""
+        route_trips = defaultdict(list)
+        for i, route_idx in enumerate(self.trip_route.tolist()):
+            if route_idx >= 0:
+                route_trips[str(self.route_ids[route_idx])].append(i)
+        return {route_id: np.array(trips, dtype=np.int32) for route_id, trips in route_trips.items()}
+
+    @cached_property
+    def stop_visits(self):
+        """Stop times served at each stop, a proxy for how busy it is."""
+        return np.diff(self.stop_offsets)
+
+    @cached_property
+    def shape_routes(self):
+        """shape_id -> route_id of the first trip drawn with it."""
+        shape_routes = {}
+        for shape_id, route_idx in zip(self.trip_shape_ids.tolist(), self.trip_route.tolist()):
+            if shape_id and route_idx >= 0:
+                shape_routes.setdefault(shape_id, str(self.route_ids[route_idx]))
+        return shape_routes
+
+    @cached_property
+    def spatial_index(self):
+        return StopGrid(self.stop_lat, self.stop_lon)
+
+    @cached_property
+    def route_search_index(self):
+        """Name index over routes; a short-name hit ("107D") outranks a long-name hit."""
+        return TextIndex(
+            list(zip(self.route_short_names.tolist(), self.route_long_names.tolist())),
+            weights=(1.5, 1.0),
+        )
+
+    @cached_property
+    def stop_search_index(self):
+        return TextIndex([(name,) for name in self.stop_names.tolist()])
+
+    @cached_property
+    def footpaths(self):
+        """Walking transfers between nearby stops, loaded or computed on first use."""
+        return load_footpaths(self, FOOTPATHS_PATH)
+
+    @cached_property
+    def network(self):
+        """Route patterns for journey planning, built on first use."""
+        return TransitNetwork(self, self.footpaths)
+
+    # --- Lookups ---
+    def stop(self, stop_id):
+        i = self.stop_index.get(stop_id)
+        if i is None:
+            return None
+        return {
+            "stop_id": stop_id,
+            "stop_name": str(self.stop_names[i]),
+            "stop_lat": float(self.stop_lat[i]),
+            "stop_lon": float(self.stop_lon[i]),
+        }
+
+    def trip(self, trip_id):
+        i = self.trip_index.get(trip_id)
+        if i is None:
+            return None
+        route_idx = int(self.trip_route[i])
+        direction = int(self.trip_direction[i])
+        return {
+            "route_id": str(self.route_ids[route_idx]) if route_idx >= 0 else None,
+            "service_id": str(self.trip_service_ids[i]),
+            "trip_id": trip_id,
+            "trip_headsign": str(self.trip_headsigns[i]),
+            "direction_id": direction if direction >= 0 else None,
+            "shape_id": str(self.trip_shape_ids[i]),
+        }
+
+    def trip_route_id(self, trip_id):
+        i = self.trip_index.get(trip_id)
+        if i is None or self.trip_route[i] < 0:
+            return None
+        return str(self.route_ids[self.trip_route[i]])
+
+    def trip_rows(self, trip_id):
+        """Row indices of a trip's stop times, in stop_sequence order."""
+        i = self.trip_index.get(trip_id)
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return np.arange(self.trip_offsets[i], self.trip_offsets[i + 1])
+
+    def stop_time_rows(self, stop_id):
+        """Row indices of every stop time served at a stop, ordered by departure."""
+        j = self.stop_index.get(stop_id)
+        if j is None:
+            return np.empty(0, dtype=np.int32)
+        return self.stop_rows[self.stop_offsets[j]:self.stop_offsets[j + 1]]
+
+    def stop_departure_rows(self, stop_id, start_secs, end_secs):
+        """Timetabled rows departing a stop within [start_secs, end_secs], found by bisection."""
+        j = self.stop_index.get(stop_id)
+        if j is None:
+            return np.empty(0, dtype=np.int32)
+        lo, hi = self.timetabled_offsets[j], self.timetabled_offsets[j + 1]
+        departures = self.stop_departures[lo:hi]
+        first = lo + np.searchsorted(departures, start_secs, side="left")
+        last = lo + np.searchsorted(departures, end_secs, side="right")
+        return self.timetabled_rows[first:last]
+
+    def trips_running(self, day, strict=True):
+        """Bool mask of the trips whose service runs on ``day``, or None not to filter (see ServiceCalendar)."""
+        services = self.calendar.services_on(day, strict=strict)
+        return None if services is None else services[self.trip_service]
+
+    def iter_departures(self, stop_id, start_secs, end_secs, running=None):
+        """Lazily yield (departure_secs, row) within the window, timetabled and frequency-based merged.
+
+        ``running`` (a trips_running mask) drops the departures of trips not running that day.
+        """
+        j = self.stop_index.get(stop_id)
+        if j is None:
+            return iter(())
+        rows = self.stop_departure_rows(stop_id, start_secs, end_secs)
+        timetabled = zip(self.st_departure[rows].tolist(), rows.tolist())
+        departures = heapq.merge(timetabled, self.frequencies.departures(j, start_secs, end_secs))
+        if running is None:
+            return departures
+        return ((dep, row) for dep, row in departures if running[self.st_trip[row]])
+
+    def stop_trip_ids(self, stop_id):
+        return {str(self.trip_ids[t]) for t in self.st_trip[self.stop_time_rows(stop_id)].tolist()}
+
+    def stop_time(self, row, shift=0):
+        """Stop time record; ``shift`` moves a frequency template onto a concrete vehicle."""
+        return {
+            "trip_id": str(self.trip_ids[self.st_trip[row]]),
+            "arrival_time": format_gtfs_time(self.st_arrival[row] + shift),
+            "departure_time": format_gtfs_time(self.st_departure[row] + shift),
+            "stop_id": str(self.stop_ids[self.st_stop[row]]),
+            "stop_sequence": int(self.st_sequence[row]),
+        }
+
+
+def parse_gtfs_time(value):
+    """Parse an ``H:MM:SS`` GTFS time into seconds since service-day midnight."""
+    hours, minutes, seconds = (int(part) for part in str(value).strip().split(":"))
+    return hours * 3600 + minutes * 60 + seconds
+
+def parse_gtfs_times(values):
+    """Vectorised parse_gtfs_time; values past 24:00:00 are kept as-is."""
+    parts = pd.Series(values, dtype=str).str.strip().str.split(":", expand=True).astype(np.int32)
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy(dtype=np.int32)
+
+def format_gtfs_time(secs):
+    secs = int(secs)
+    return f"{secs // 3600:02d}:{secs % 3600 // 60:02d}:{secs % 60:02d}"
+
 # --- GTFS Data Load ---
-def load_gtfs_data():
-    """Load GTFS data from cache or local CSV files."""
-    cached_data = load_from_redis("gtfs_data")
-    if cached_data:
-        return cached_data
+def gtfs_source_paths():
+    return [os.path.join(GTFS_DIR, f"{file}.txt") for file in FILES + OPTIONAL_FILES]
+
+def feed_version():
+    """Content hash of the GTFS source files, used to version snapshots and caches."""
+    digest = hashlib.sha1()
+    for path in gtfs_source_paths():
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(os.path.basename(path).encode())
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+def read_gtfs_tables(use_cache=True):
+    """(tables, version) of the raw GTFS tables, from the current Redis feed version or local CSV files.
+
+    ``version`` is that of the tables actually read: the feed store's for
+    Redis, else the content hash of the CSV files.
+    """
+    version = feed_store.current_version() if use_cache else None
+    if version:
+        cached = feed_store.load_tables(version, FILES + OPTIONAL_FILES)
+        if cached and all(name in cached for name in FILES):
+            logger.info(f"Loaded GTFS tables for feed {version} from Redis.")
+            return {name: pd.DataFrame(columns) for name, columns in cached.items()}, version
 
     logger.info("Loading GTFS data from CSV files...")
-    gtfs_data = {}
+    version = feed_version()
+    tables = {}
 
-    for file in FILES:
+    for file in FILES + OPTIONAL_FILES:
         path = os.path.join(GTFS_DIR, f"{file}.txt")
         if not os.path.exists(path):
+            if file in OPTIONAL_FILES:
+                continue
             raise FileNotFoundError(f"Missing GTFS file: {path}")
-        df = pd.read_csv(path)
-        gtfs_data[file] = df.to_dict(orient="records")
+        tables[file] = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return tables, version
 
-    cache_to_redis("gtfs_data", gtfs_data)
-    return gtfs_data
+def feed_entities(gtfs_data):
+    """Per-entity records published to Redis: stops (with route ids), routes and trips (with stops)."""
+    stop_ids = gtfs_data.stop_ids.tolist()
+    routes_by_stop = get_routes_by_stops(gtfs_data, stop_ids)
+    stops = {}
+    for stop_id in stop_ids:
+        stop = gtfs_data.stop(stop_id)
+        stop["route_ids"] = [route["route_id"] for route in routes_by_stop[stop_id]]
+        stops[stop_id] = stop
+    trips = {}
+    for trip_id in gtfs_data.trip_ids.tolist():
+        trip = gtfs_data.trip(trip_id)
+        trip["stops"] = get_trip_stops(gtfs_data, trip_id)
+        trips[trip_id] = trip
+    return stops, dict(gtfs_data.routes), trips
 
-# --- Geo and Spatial Index ---
-def get_stops_gdf(gtfs_data):
-    """Convert stops into a GeoDataFrame."""
-    stops_df = pd.DataFrame(gtfs_data["stops"])
-    stops_df["geometry"] = stops_df.apply(
-        lambda row: Point(float(row["stop_lon"]), float(row["stop_lat"])), axis=1
+def publish_feed(gtfs_data, tables, make_current=True):
+    """Publish raw tables and per-entity hashes for ``gtfs_data.version`` to Redis."""
+    if not redis_client or feed_store.has_version(gtfs_data.version):
+        return False
+    started = time.perf_counter()
+    stops, routes, trips = feed_entities(gtfs_data)
+    published = feed_store.publish(
+        gtfs_data.version,
+        {name: df.to_dict(orient="list") for name, df in tables.items()},
+        stops, routes, trips,
+        make_current=make_current,
     )
-    return gpd.GeoDataFrame(stops_df, geometry="geometry", crs="EPSG:4326")
+    if published:
+        logger.info(f"Feed {gtfs_data.version} published in {time.perf_counter() - started:.2f}s.")
+    return published
 
-def build_spatial_index(stops_gdf):
-    """Build an R-tree index for spatial search."""
-    idx = rtree_index.Index()
-    for i, row in stops_gdf.iterrows():
-        idx.insert(i, row.geometry.bounds)
+def compile_gtfs_snapshot(gtfs_data, version, keep=3):
+    """Persist the dataset plus its prebuilt spatial index and footpaths as a snapshot."""
+    arrays = gtfs_data.to_arrays()
+    grid = gtfs_data.spatial_index
+    arrays.update({f"spatial_index.{name}": a for name, a in grid.to_arrays().items()})
+    arrays.update({f"footpaths.{name}": a for name, a in gtfs_data.footpaths.to_arrays().items()})
+    attrs = {
+        "spatial_index": {"cell_m": grid.cell_m, "cell_lat": grid.cell_lat, "cell_lon": grid.cell_lon},
+        "footpaths": {"fingerprint": gtfs_data.footpaths.fingerprint},
+    }
+    path = write_snapshot(SNAPSHOT_DIR, version, arrays, attrs, sources=gtfs_source_paths())
+    prune_snapshots(SNAPSHOT_DIR, keep=keep)
+    return path
+
+def load_compiled_gtfs():
+    """Open the current compiled snapshot via mmap, or None if missing or stale."""
+    try:
+        opened = open_snapshot(SNAPSHOT_DIR)
+    except Exception as e:
+        logger.error(f"Failed to open GTFS snapshot in {SNAPSHOT_DIR}: {e}")
+        return None
+    if opened is None:
+        return None
+    manifest, arrays = opened
+    if manifest["sources"] != source_signature(gtfs_source_paths()):
+        logger.warning(f"GTFS snapshot {manifest['version']} is stale; run compile_gtfs.")
+        return None
+
+    dataset = GTFSDataset.from_arrays(arrays)
+    grid = manifest["attrs"]["spatial_index"]
+    dataset.__dict__["spatial_index"] = StopGrid.from_arrays(
+        dataset.stop_lat, dataset.stop_lon,
+        {name: arrays[f"spatial_index.{name}"] for name in StopGrid.ARRAY_FIELDS},
+        grid["cell_m"], grid["cell_lat"], grid["cell_lon"],
+    )
+    fingerprint = manifest["attrs"]["footpaths"]["fingerprint"]
+    if fingerprint == footpath_fingerprint(dataset, TRANSFER_RADIUS_M, WALK_SPEED_MPS):
+        dataset.__dict__["footpaths"] = Footpaths(
+            *(arrays[f"footpaths.{name}"] for name in Footpaths.ARRAY_FIELDS), fingerprint,
+        )
+    else:
+        # left to the footpaths property, which loads or rebuilds them for the current settings
+        logger.warning(f"Footpaths in GTFS snapshot {manifest['version']} predate the walking settings; rebuilding.")
+    dataset.version = manifest["version"]
+    logger.info(f"Opened GTFS snapshot {dataset.version}.")
+    return dataset
+
+def compiled_version():
+    """Version of the snapshot load_gtfs_data would open, or None if snapshots are off, missing or stale."""
+    if not USE_SNAPSHOT:
+        return None
+    try:
+        opened = open_snapshot(SNAPSHOT_DIR)
+    except Exception as e:
+        logger.error(f"Failed to open GTFS snapshot in {SNAPSHOT_DIR}: {e}")
+        return None
+    if opened is None or opened[0]["sources"] != source_signature(gtfs_source_paths()):
+        return None
+    return opened[0]["version"]
+
+def load_gtfs_data():
+    """Load the GTFS feed: the compiled snapshot if present, else cache or CSV."""
+    if USE_SNAPSHOT:
+        dataset = load_compiled_gtfs()
+        if dataset is not None:
+            return dataset
+    tables, version = read_gtfs_tables()
+    dataset = GTFSDataset(tables)
+    dataset.version = version
+    # a no-op when the tables came from the feed store
+    publish_feed(dataset, tables)
+    return dataset
+
+# --- Geo and Spatial Index ---
+def build_spatial_index(gtfs_data):
+    """Bulk-load (or take from the compiled snapshot) a grid index over the stops."""
+    started = time.perf_counter()
+    idx = gtfs_data.spatial_index
+    logger.info(f"Spatial index over {len(idx)} stops ready in {(time.perf_counter() - started) * 1000:.1f}ms.")
     return idx
 
-def find_nearest_stops(user_location, stops_gdf, spatial_idx, radius_km=1.0):
-    """Find nearby stops within a radius (km) of a lat/lon point."""
-    lat, lon = user_location
-    cache_key = f"nearest_stops:{lat:.5f}_{lon:.5f}_{radius_km:.1f}"
+class NearestStopsCache:
+    """Candidate stops per quantised cell, so nearby GPS fixes share one cache entry.
 
-    cached_result = load_from_redis(cache_key)
-    if cached_result:
-        return cached_result
+    A cell's entry holds every stop within ``radius`` of any point in the cell
+    (the radius plus the cell's half-diagonal around its centre); requests then
+    filter it by exact distance from their own coordinate. Entries live in a
+    bounded in-process LRU backed by Redis with a TTL.
+    """
 
-    user_point = Point(lon, lat)
-    buffer_radius_deg = radius_km / 111  # Rough conversion
-    bounds = user_point.buffer(buffer_radius_deg).bounds
-    matches = list(spatial_idx.intersection(bounds))
+    def __init__(self, cell_deg=NEAREST_CELL_DEG, ttl=NEAREST_CACHE_TTL, max_cells=NEAREST_CACHE_MAX_CELLS):
+        self.cell_deg = cell_deg
+        self.ttl = ttl
+        self.max_cells = max_cells
+        self._local = OrderedDict()
+        self.hits = {"local": 0, "redis": 0}
+        self.misses = 0
 
-    nearby_stops = stops_gdf.iloc[matches].copy()
-    nearby_stops = nearby_stops[nearby_stops["geometry"].within(user_point.buffer(buffer_radius_deg))]
+    def cell(self, lat, lon):
+        return int(np.floor(lat / self.cell_deg)), int(np.floor(lon / self.cell_deg))
 
-    result = nearby_stops[["stop_id", "stop_name", "stop_lat", "stop_lon"]].to_dict(orient="records")
-    cache_to_redis(cache_key, result)
-    return result
+    def candidates(self, gtfs_data, spatial_idx, lat, lon, radius_m):
+        row, col = self.cell(lat, lon)
+        version = getattr(gtfs_data, "version", "local")
+        key = f"gtfs:{version}:nearest_cell:{self.cell_deg}:{row}_{col}:{int(radius_m)}"
+
+        stop_ids = self._local.get(key)
+        if stop_ids is not None:
+            self._local.move_to_end(key)
+            self.hits["local"] += 1
+        else:
+            stop_ids = load_from_redis(key)
+            if stop_ids is not None:
+                self.hits["redis"] += 1
+            else:
+                self.misses += 1
+                stop_ids = self._compute(gtfs_data, spatial_idx, row, col, radius_m)
+                cache_to_redis(key, stop_ids, ttl=self.ttl)
+            self._local[key] = stop_ids
+            if len(self._local) > self.max_cells:
+                self._local.popitem(last=False)
+        return np.array([gtfs_data.stop_index[s] for s in stop_ids if s in gtfs_data.stop_index], dtype=np.int64)
+
+    def _compute(self, gtfs_data, spatial_idx, row, col, radius_m):
+        south, west = row * self.cell_deg, col * self.cell_deg
+        centre_lat, centre_lon = south + self.cell_deg / 2, west + self.cell_deg / 2
+        half_diagonal = float(max(
+            haversine_m(centre_lat, centre_lon, south, west),
+            haversine_m(centre_lat, centre_lon, south + self.cell_deg, west),
+        ))
+        found, _ = spatial_idx.within(centre_lat, centre_lon, radius_m + half_diagonal)
+        return [str(gtfs_data.stop_ids[i]) for i in found.tolist()]
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else None,
+            "cells": len(self._local),
+        }
+
+nearest_stops_cache = NearestStopsCache()
+
+def find_nearest_stops(user_location, gtfs_data, spatial_idx, radius_km=1.0, k=None, limit=None):
+    """Stops near a lat/lon point, nearest first, with their distance in metres.
+
+    With ``k`` the k nearest stops within ``radius_km`` are returned, otherwise
+    every stop within ``radius_km``; ``limit`` caps either result. Not in the
+    result cache: GPS fixes rarely repeat exactly, so candidates are shared
+    per cell through nearest_stops_cache instead.
+    """
+    lat, lon = user_location
+    radius_m = radius_km * 1000
+    candidates = nearest_stops_cache.candidates(gtfs_data, spatial_idx, lat, lon, radius_m)
+    distance = haversine_m(lat, lon, gtfs_data.stop_lat[candidates], gtfs_data.stop_lon[candidates])
+    keep = distance <= radius_m
+    candidates, distance = candidates[keep], distance[keep]
+    order = np.argsort(distance, kind="stable")
+    cap = min(n for n in (k, limit, len(order)) if n is not None)
+    found, distance = candidates[order[:cap]], distance[order[:cap]]
+
+    return [
+        {
+            "stop_id": str(gtfs_data.stop_ids[i]),
+            "stop_name": str(gtfs_data.stop_names[i]),
+            "stop_lat": float(gtfs_data.stop_lat[i]),
+            "stop_lon": float(gtfs_data.stop_lon[i]),
+            "distance_m": round(float(d), 1),
+        }
+        for i, d in zip(found.tolist(), distance.tolist())
+    ]
 
 # --- Trip & Route Utilities ---
 def get_route_trips(gtfs_data, route_id):
-    return [trip for trip in gtfs_data["trips"] if trip["route_id"] == route_id]
+    trips = gtfs_data.route_trips.get(route_id, [])
+    return [gtfs_data.trip(str(gtfs_data.trip_ids[t])) for t in trips]
 
 def get_trip_stop_times(gtfs_data, trip_id):
-    stop_times = [st for st in gtfs_data["stop_times"] if st["trip_id"] == trip_id]
-    return sorted(stop_times, key=lambda x: int(x["stop_sequence"]))
-
-def search_routes_by_name(gtfs_data, route_name):
-    routes = pd.DataFrame(gtfs_data["routes"])
-    matched = routes[routes["route_long_name"].str.contains(route_name, case=False, na=False)]
-    return matched[["route_id", "route_long_name", "route_type"]].to_dict(orient="records")
-
-def get_next_trips(gtfs_data, stop_id, time_window=30):
-    """Get the next 5 trips departing from a stop."""
-    now = datetime.now().strftime("%H:%M:%S")
-    candidates = [
-        st for st in gtfs_data["stop_times"]
-        if st["stop_id"] == stop_id and st.get("departure_time") > now
+    return [gtfs_data.stop_time(row) for row in gtfs_data.trip_rows(trip_id)]
+
+@response_cache.cached("route_search", ttl=lambda: cache_ttl("route_search"))
+def search_routes_by_name(gtfs_data, route_name, limit=20):
+    """Routes whose short or long name matches the query, best match first."""
+    routes = gtfs_data.routes
+    found = gtfs_data.route_search_index.search(route_name, limit=limit)
+    return [
+        {
+            "route_id": route_id,
+            "route_short_name": routes[route_id]["route_short_name"],
+            "route_long_name": routes[route_id]["route_long_name"],
+            "route_type": routes[route_id]["route_type"],
+            "score": round(score, 3),
+        }
+        for route_id, score in ((str(gtfs_data.route_ids[doc]), score) for doc, score in found)
+    ]
+
+def search_stops(gtfs_data, query, near=None, limit=10):
+    """Stops whose name matches the query, best match first, tolerating typos.
+
+    With ``near`` as (lat, lon), name scores are discounted by distance so that
+    equally good matches close to the user come first.
+    """
+    index = gtfs_data.stop_search_index
+    found = index.search(query, limit=None if near else limit)
+    if not found:
+        return []
+    docs = np.fromiter((doc for doc, _ in found), dtype=np.int64, count=len(found))
+    scores = np.fromiter((score for _, score in found), dtype=np.float64, count=len(found))
+    distance = None
+    if near is not None:
+        distance = haversine_m(near[0], near[1], gtfs_data.stop_lat[docs], gtfs_data.stop_lon[docs])
+        scores = scores / (1.0 + distance / STOP_SEARCH_DISTANCE_SCALE_M)
+        order = np.argsort(-scores, kind="stable")[:limit]
+        docs, scores, distance = docs[order], scores[order], distance[order]
+
+    return [
+        {
+            "stop_id": str(gtfs_data.stop_ids[i]),
+            "stop_name": str(gtfs_data.stop_names[i]),
+            "stop_lat": float(gtfs_data.stop_lat[i]),
+            "stop_lon": float(gtfs_data.stop_lon[i]),
+            "score": round(float(scores[n]), 3),
+            **({"distance_m": round(float(distance[n]), 1)} if distance is not None else {}),
+        }
+        for n, i in enumerate(docs.tolist())
     ]
-    upcoming = sorted(candidates, key=lambda x: x["departure_time"])
-    return upcoming[:5]
+
+def get_next_trips(gtfs_data, stop_id, time_window=None, at=None, limit=5, strict_calendar=False):
+    """Get the next trips departing from a stop, looking a full day ahead by default."""
+    return get_departure_board(
+        gtfs_data, stop_id, time_window=time_window, at=at, limit=limit, strict_calendar=strict_calendar,
+    )
 
 def get_trip_stops(gtfs_data, trip_id):
     """Get ordered list of stops for a given trip."""
-    stop_times = get_trip_stop_times(gtfs_data, trip_id)
-    stops = []
-    for st in stop_times:
-        stop = next((s for s in gtfs_data["stops"] if s["stop_id"] == st["stop_id"]), None)
-        if stop:
-            stops.append({
-                "stop_id": stop["stop_id"],
-                "stop_name": stop.get("stop_name"),
-                "lat": float(stop["stop_lat"]),
-                "lon": float(stop["stop_lon"]),
-                "arrival_time": st.get("arrival_time"),
-                "departure_time": st.get("departure_time"),
-                "sequence": st.get("stop_sequence"),
-            })
-    return stops
+    return [get_trip_stop(gtfs_data, row) for row in gtfs_data.trip_rows(trip_id)]
+
+def get_trip_stop(gtfs_data, row, shift=0):
+    stop_idx = gtfs_data.st_stop[row]
+    return {
+        "stop_id": str(gtfs_data.stop_ids[stop_idx]),
+        "stop_name": str(gtfs_data.stop_names[stop_idx]),
+        "lat": float(gtfs_data.stop_lat[stop_idx]),
+        "lon": float(gtfs_data.stop_lon[stop_idx]),
+        "arrival_time": format_gtfs_time(gtfs_data.st_arrival[row] + shift),
+        "departure_time": format_gtfs_time(gtfs_data.st_departure[row] + shift),
+        "sequence": int(gtfs_data.st_sequence[row]),
+    }
 
+@response_cache.cached("routes_by_stop", ttl=lambda: cache_ttl("routes_by_stop"))
 def get_routes_by_stop(gtfs_data, stop_id):
     """Return all routes passing through a given stop."""
-    trip_ids = {st["trip_id"] for st in gtfs_data["stop_times"] if st["stop_id"] == stop_id}
-    route_ids = {
-        trip["route_id"] for trip in gtfs_data["trips"] if trip["trip_id"] in trip_ids
-    }
-    return [route for route in gtfs_data["routes"] if route["route_id"] in route_ids]
+    j = gtfs_data.stop_index.get(stop_id)
+    if j is None:
+        return []
+    patterns = gtfs_data.patterns
+    route_idxs = sorted(set(patterns.pattern_route[patterns.stop_patterns(j)[0]].tolist()) - {-1})
+    return [gtfs_data.routes[str(gtfs_data.route_ids[r])] for r in route_idxs]
+
+@response_cache.cached("route_stops", ttl=lambda: cache_ttl("route_stops"))
+def get_route_stops(gtfs_data, route_id, direction=None):
+    """The route's distinct stop patterns, each with its ordered stops; None for an unknown route."""
+    route_idx = gtfs_data.route_index.get(route_id)
+    if route_idx is None:
+        return None
+    patterns = gtfs_data.patterns
+    found = []
+    for p in patterns.route_patterns(route_idx).tolist():
+        direction_id = int(patterns.pattern_direction[p])
+        if direction is not None and direction_id != direction:
+            continue
+        found.append({
+            "pattern_id": p,
+            "direction_id": direction_id if direction_id >= 0 else None,
+            "trips": int(patterns.pattern_trip_offsets[p + 1] - patterns.pattern_trip_offsets[p]),
+            "stops": [
+                {
+                    "stop_id": str(gtfs_data.stop_ids[j]),
+                    "stop_name": str(gtfs_data.stop_names[j]),
+                    "lat": float(gtfs_data.stop_lat[j]),
+                    "lon": float(gtfs_data.stop_lon[j]),
+                }
+                for j in patterns.stops(p).tolist()
+            ],
+        })
+    return {"route_id": route_id, "patterns": found}
 
 def get_stop_coordinates(gtfs_data, stop_id):
-    for stop in gtfs_data["stops"]:
-        if stop["stop_id"] == stop_id:
-            return {
-                "lat": float(stop["stop_lat"]),
-                "lon": float(stop["stop_lon"]),
-                "stop_name": stop.get("stop_name"),
-            }
-    return {}
+    stop = gtfs_data.stop(stop_id)
+    if stop is None:
+        return {}
+    return {
+        "lat": stop["stop_lat"],
+        "lon": stop["stop_lon"],
+        "stop_name": stop["stop_name"],
+    }
 
-def get_departure_board(gtfs_data, stop_id, time_window=30):
-    """Upcoming departures at a stop."""
-    now = datetime.now()
-    end_time = (now + timedelta(minutes=time_window)).strftime("%H:%M:%S")
+# --- Batch lookups: many ids resolved in one pass, keyed by id ---
+def get_stops_coordinates(gtfs_data, stop_ids):
+    return {stop_id: get_stop_coordinates(gtfs_data, stop_id) for stop_id in stop_ids}
 
-    departures = [
-        st for st in gtfs_data["stop_times"]
-        if st["stop_id"] == stop_id and now.strftime("%H:%M:%S") <= st["departure_time"] <= end_time
+def get_routes_by_stops(gtfs_data, stop_ids):
+    """stop_id -> routes through it, from one gather over every stop's patterns."""
+    result = {stop_id: [] for stop_id in stop_ids}
+    known = [(stop_id, gtfs_data.stop_index[stop_id]) for stop_id in result if stop_id in gtfs_data.stop_index]
+    if not known:
+        return result
+    patterns = gtfs_data.patterns
+    stops = np.array([j for _, j in known], dtype=np.int64)
+    lo, hi = patterns.stop_pattern_offsets[stops], patterns.stop_pattern_offsets[stops + 1]
+    counts = hi - lo
+    owner = np.repeat(np.arange(len(stops)), counts)
+    at = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+    routes = patterns.pattern_route[patterns.stop_pattern_ids[at]].astype(np.int64)
+    n_routes = len(gtfs_data.route_ids)
+    pairs = np.unique(owner[routes >= 0] * n_routes + routes[routes >= 0])
+    for k, route_idx in zip((pairs // n_routes).tolist(), (pairs % n_routes).tolist()):
+        result[known[k][0]].append(gtfs_data.routes[str(gtfs_data.route_ids[route_idx])])
+    return result
+
+def get_trips_stops(gtfs_data, trip_ids):
+    return {trip_id: get_trip_stops(gtfs_data, trip_id) for trip_id in trip_ids}
+
+def get_departure_boards(gtfs_data, stop_ids, time_window=30, at=None, limit=10, strict_calendar=False):
+    """stop_id -> departure board, all for the same moment."""
+    at = at or datetime.now()
+    return {
+        stop_id: get_departure_board(
+            gtfs_data, stop_id, time_window=time_window, at=at, limit=limit, strict_calendar=strict_calendar,
+        )
+        for stop_id in stop_ids
+    }
+
+# --- Entity lookups straight from Redis, keyed by id ---
+# Each returns None when Redis cannot answer (no published feed or an error),
+# so callers fall back to the in-memory dataset. Every call is one HMGET per hash.
+def _coordinates_from(stops, stop_ids):
+    return {
+        stop_id: {"lat": stop["stop_lat"], "lon": stop["stop_lon"], "stop_name": stop["stop_name"]} if stop else {}
+        for stop_id, stop in ((stop_id, stops.get(stop_id)) for stop_id in stop_ids)
+    }
+
+def _route_ids_of(stops):
+    return list(dict.fromkeys(r for stop in stops.values() for r in stop["route_ids"]))
+
+def _routes_from(stops, routes, stop_ids):
+    return {
+        stop_id: [routes[r] for r in stops[stop_id]["route_ids"] if r in routes] if stop_id in stops else []
+        for stop_id in stop_ids
+    }
+
+def _trip_stops_from(trips, trip_ids):
+    return {trip_id: trips[trip_id]["stops"] if trip_id in trips else [] for trip_id in trip_ids}
+
+def redis_stops_coordinates(stop_ids):
+    version = feed_store.current_version()
+    found = feed_store.get_many(version, "stops", stop_ids) if version else None
+    return None if found is None else _coordinates_from(found, stop_ids)
+
+def redis_routes_by_stops(stop_ids):
+    version = feed_store.current_version()
+    stops = feed_store.get_many(version, "stops", stop_ids) if version else None
+    routes = feed_store.get_many(version, "routes", _route_ids_of(stops)) if stops is not None else None
+    return None if routes is None else _routes_from(stops, routes, stop_ids)
+
+def redis_trips_stops(trip_ids):
+    version = feed_store.current_version()
+    found = feed_store.get_many(version, "trips", trip_ids) if version else None
+    return None if found is None else _trip_stops_from(found, trip_ids)
+
+def get_stop_transfers(gtfs_data, stop_id):
+    """Stops within walking distance of a stop, nearest first; None for an unknown stop."""
+    j = gtfs_data.stop_index.get(stop_id)
+    if j is None:
+        return None
+    targets, walk_secs, distance_m = gtfs_data.footpaths.from_stop(j)
+    return [
+        {
+            "stop_id": str(gtfs_data.stop_ids[target]),
+            "stop_name": str(gtfs_data.stop_names[target]),
+            "walk_secs": int(secs),
+            "distance_m": round(float(distance), 1),
+        }
+        for target, secs, distance in zip(targets.tolist(), walk_secs.tolist(), distance_m.tolist())
+    ]
+
+# --- Shapes ---
+@response_cache.cached("trip_shape", ttl=lambda: cache_ttl("trip_shape"), normalize=clamped_zoom)
+def get_trip_shape(gtfs_data, trip_id, zoom=MAX_ZOOM):
+    """A trip's path simplified for ``zoom`` as an encoded polyline; stop to stop if it has no shape."""
+    i = gtfs_data.trip_index.get(trip_id)
+    if i is None:
+        return None
+    shape_id = str(gtfs_data.trip_shape_ids[i])
+    if shape_id in gtfs_data.shapes:
+        return {"trip_id": trip_id, "zoom": zoom, **gtfs_data.shapes.encoded(shape_id, zoom)}
+    stops = gtfs_data.st_stop[gtfs_data.trip_rows(trip_id)]
+    return {
+        "trip_id": trip_id,
+        "zoom": zoom,
+        "shape_id": None,
+        "points": len(stops),
+        "polyline": encode_polyline(gtfs_data.stop_lat[stops], gtfs_data.stop_lon[stops]),
+    }
+
+@response_cache.cached("route_shape", ttl=lambda: cache_ttl("route_shape"), normalize=clamped_zoom)
+def get_route_shapes(gtfs_data, route_id, zoom=MAX_ZOOM):
+    """Every distinct shape the route's trips follow, simplified for ``zoom``."""
+    if route_id not in gtfs_data.route_index:
+        return None
+    trips = gtfs_data.route_trips.get(route_id, [])
+    shape_ids = dict.fromkeys(
+        shape_id for shape_id in gtfs_data.trip_shape_ids[trips].tolist() if shape_id in gtfs_data.shapes
+    )
+    return {"route_id": route_id, "zoom": zoom, "shapes": [gtfs_data.shapes.encoded(s, zoom) for s in shape_ids]}
+
+# --- Vector tiles ---
+def render_vector_tile(gtfs_data, z, x, y):
+    west, south, east, north = tile_bounds(z, x, y, buffer=BUFFER)
+    stops = np.empty(0, dtype=np.int64)
+    if z >= STOPS_MIN_ZOOM:
+        # the circle through the corners of the (buffered) tile
+        lat, lon = (south + north) / 2, (west + east) / 2
+        radius = float(haversine_m(lat, lon, north, east))
+        stops, _ = gtfs_data.spatial_index.within(lat, lon, radius)
+    lines = []
+    for shape_id in gtfs_data.shapes.in_box(west, south, east, north):
+        route = gtfs_data.routes.get(gtfs_data.shape_routes.get(shape_id), {})
+        lines.append((*gtfs_data.shapes.simplified(shape_id, z), {
+            "shape_id": shape_id,
+            "route_id": route.get("route_id", ""),
+            "route_short_name": route.get("route_short_name", ""),
+            "route_type": route.get("route_type", 3),
+        }))
+    properties = [
+        {"stop_id": str(gtfs_data.stop_ids[i]), "stop_name": str(gtfs_data.stop_names[i])} for i in stops.tolist()
     ]
-    return sorted(departures, key=lambda x: x["departure_time"])[:10]
+    return encode_tile({
+        "stops": stop_features(
+            z, x, y, gtfs_data.stop_lat[stops], gtfs_data.stop_lon[stops], gtfs_data.stop_visits[stops], properties,
+        ),
+        "routes": line_features(z, x, y, lines),
+    })
+
+def get_vector_tile(gtfs_data, z, x, y):
+    """MVT bytes of tile z/x/y, from the tile cache or rendered."""
+    check_tile(z, x, y)
+    return tile_cache.get_or_render(gtfs_data.version, z, x, y, lambda: render_vector_tile(gtfs_data, z, x, y))
+
+@response_cache.cached("departure_board", ttl=lambda: cache_ttl("departure_board"), normalize=to_minute("at"))
+def get_departure_board(gtfs_data, stop_id, time_window=30, at=None, limit=10, strict_calendar=False):
+    """Upcoming departures at a stop within ``time_window`` minutes of ``at``.
+
+    Trips running past midnight are stored as times beyond 24:00:00 on the
+    previous service day, so that day's schedule is searched with a +24h shift;
+    windows reaching past midnight also search the next service day. Each
+    service day keeps only the trips whose service runs that day;
+    ``strict_calendar`` marks ``at`` as a date the caller asked for rather
+    than today (see ServiceCalendar.services_on).
+    """
+    at = at or datetime.now()
+    start_secs = at.hour * 3600 + at.minute * 60 + at.second
+    end_secs = start_secs + (time_window * 60 if time_window is not None else SECONDS_PER_DAY)
+
+    streams = []
+    for days_back in range(1, -(end_secs // SECONDS_PER_DAY) - 1, -1):
+        shift = days_back * SECONDS_PER_DAY
+        service_date = (at - timedelta(days=days_back)).date()
+        running = gtfs_data.trips_running(service_date, strict=strict_calendar)
+        departures = gtfs_data.iter_departures(stop_id, start_secs + shift, end_secs + shift, running=running)
+        streams.append(on_service_date(departures, shift, service_date))
 
-def calculate_path(gtfs_data, start_stop_id, end_stop_id):
-    """Returns direct path between stops if they share a trip."""
-    trips_with_start = {
-        st["trip_id"] for st in gtfs_data["stop_times"] if st["stop_id"] == start_stop_id
+    board = []
+    for _, dep, row, service_date in islice(heapq.merge(*streams, key=lambda item: item[0]), limit):
+        entry = gtfs_data.stop_time(row, shift=dep - int(gtfs_data.st_departure[row]))
+        entry["service_date"] = service_date.isoformat()
+        board.append(entry)
+    return board
+
+@response_cache.cached("path", ttl=lambda: cache_ttl("path"), normalize=to_minute("depart_at"))
+def calculate_path(gtfs_data, start_stop_id, end_stop_id, depart_at=None, max_transfers=2, strict_calendar=False):
+    """Pareto-optimal itineraries between two stops, allowing up to ``max_transfers`` changes.
+
+    Only trips running on ``depart_at``'s service day are boarded.
+    """
+    source = gtfs_data.stop_index.get(start_stop_id)
+    target = gtfs_data.stop_index.get(end_stop_id)
+    if source is None or target is None:
+        return []
+    depart_at = depart_at or datetime.now()
+    depart_secs = depart_at.hour * 3600 + depart_at.minute * 60 + depart_at.second
+    network = gtfs_data.network
+    running = gtfs_data.trips_running(depart_at.date(), strict=strict_calendar)
+    trips = None if running is None else network.running_trips(depart_at.date(), running)
+    journeys = network.route(source, target, depart_secs, max_transfers=max_transfers, pattern_trips=trips)
+    return [_format_itinerary(gtfs_data, legs, depart_secs) for legs in journeys]
+
+def _format_itinerary(gtfs_data, legs, depart_secs):
+    network = gtfs_data.network
+    formatted = []
+    for leg in legs:
+        if leg[0] == "walk":
+            _, from_stop, to_stop, ready, walk_secs = leg
+            formatted.append({
+                "type": "walk",
+                "from_stop_id": str(gtfs_data.stop_ids[from_stop]),
+                "to_stop_id": str(gtfs_data.stop_ids[to_stop]),
+                "departure_time": format_gtfs_time(ready),
+                "arrival_time": format_gtfs_time(ready + walk_secs),
+                "duration_secs": int(walk_secs),
+            })
+            continue
+        _, p, trip, shift, board_pos, alight_pos = leg
+        route = gtfs_data.routes[str(gtfs_data.route_ids[network.pattern_route[p]])]
+        first = int(gtfs_data.trip_offsets[trip.trip_idx])
+        stops = [get_trip_stop(gtfs_data, first + pos, shift) for pos in range(board_pos, alight_pos + 1)]
+        formatted.append({
+            "type": "transit",
+            "route_id": route["route_id"],
+            "route_short_name": route["route_short_name"],
+            "trip_id": str(gtfs_data.trip_ids[trip.trip_idx]),
+            "headsign": str(gtfs_data.trip_headsigns[trip.trip_idx]),
+            "from_stop_id": stops[0]["stop_id"],
+            "to_stop_id": stops[-1]["stop_id"],
+            "departure_time": stops[0]["departure_time"],
+            "arrival_time": stops[-1]["arrival_time"],
+            "stops": stops,
+        })
+    rides = sum(1 for leg in formatted if leg["type"] == "transit")
+    return {
+        "departure_time": formatted[0]["departure_time"],
+        "arrival_time": formatted[-1]["arrival_time"],
+        "duration_secs": parse_gtfs_time(formatted[-1]["arrival_time"]) - depart_secs,
+        "transfers": max(0, rides - 1),
+        "legs": formatted,
     }
-    trips_with_end = {
-        st["trip_id"] for st in gtfs_data["stop_times"] if st["stop_id"] == end_stop_id
+
+# --- Isochrones ---
+def _isochrone_key(args, kwargs):
+    """Key isochrones by origin (points to ~10 m) and the ISOCHRONE_BUCKET_SECS bucket of departure."""
+    call = inspect.signature(get_isochrone).bind(*args, **kwargs).arguments
+    gtfs_data = call.pop("gtfs_data")
+    at = call.get("depart_at") or datetime.now()
+    secs = at.hour * 3600 + at.minute * 60 + at.second
+    bucket = at.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(seconds=secs - secs % BUCKET_SECS)
+    origin = call["origin"]
+    if not isinstance(origin, str):
+        origin = (round(float(origin[0]), 4), round(float(origin[1]), 4))
+    return (gtfs_data,), {**call, "origin": origin, "depart_at": bucket}
+
+@response_cache.cached("isochrone", ttl=lambda: cache_ttl("isochrone"), normalize=_isochrone_key)
+def get_isochrone(gtfs_data, origin, minutes=30, depart_at=None, polygon=False, max_transfers=2,
+                  strict_calendar=False):
+    """Stops reachable within ``minutes`` of ``depart_at`` from a stop_id or a (lat, lon) origin.
+
+    None for an unknown stop. With ``polygon`` the reachable area is added as a GeoJSON geometry.
+    """
+    check_minutes(minutes)
+    depart_at = depart_at or datetime.now()
+    depart_secs = depart_at.hour * 3600 + depart_at.minute * 60 + depart_at.second
+    deadline = depart_secs + minutes * 60
+    if isinstance(origin, str):
+        j = gtfs_data.stop_index.get(origin)
+        if j is None:
+            return None
+        sources = {j: depart_secs}
+        where = {"stop_id": origin}
+    else:
+        lat, lon = float(origin[0]), float(origin[1])
+        stops, distance = gtfs_data.spatial_index.within(lat, lon, ACCESS_RADIUS_M)
+        sources = dict(zip(stops.tolist(), (depart_secs + walk_secs(distance)).tolist()))
+        where = {"lat": lat, "lon": lon}
+
+    network = gtfs_data.network
+    running = gtfs_data.trips_running(depart_at.date(), strict=strict_calendar)
+    trips = None if running is None else network.running_trips(depart_at.date(), running)
+    reached = network.reach(sources, deadline, max_transfers=max_transfers, pattern_trips=trips)
+
+    stops = np.array(sorted(reached, key=lambda j: (reached[j][0], j)), dtype=np.int64)
+    arrivals = np.array([reached[j][0] for j in stops.tolist()], dtype=np.int64)
+    vehicles = [reached[j][1] for j in stops.tolist()]
+    result = {
+        "origin": where,
+        "depart_at": depart_at.isoformat(),
+        "minutes": minutes,
+        "stops": [
+            {
+                "stop_id": str(gtfs_data.stop_ids[j]),
+                "stop_name": str(gtfs_data.stop_names[j]),
+                "lat": float(gtfs_data.stop_lat[j]),
+                "lon": float(gtfs_data.stop_lon[j]),
+                "travel_secs": int(arr - depart_secs),
+                "arrival_time": format_gtfs_time(arr),
+                "vehicles": n,
+            }
+            for j, arr, n in zip(stops.tolist(), arrivals.tolist(), vehicles)
+        ],
+    }
+    if polygon:
+        lat, lon = gtfs_data.stop_lat[stops], gtfs_data.stop_lon[stops]
+        radius = walk_reach_m(deadline - arrivals)
+        if "lat" in where:
+            lat, lon = np.append(lat, where["lat"]), np.append(lon, where["lon"])
+            radius = np.append(radius, walk_reach_m(minutes * 60))
+        result["polygon"] = reach_polygon(lat, lon, radius)
+    return result
+
+# --- Travel-time matrices ---
+# Not result-cached: a matrix grows with origins x destinations and is rarely asked for twice.
+def get_travel_matrix(gtfs_data, origin_ids, destination_ids, depart_at=None, max_minutes=MATRIX_MAX_MINUTES,
+                      max_transfers=2, strict_calendar=False):
+    """Travel seconds from every origin to every destination stop; None where not reached within ``max_minutes``."""
+    unknown = [stop_id for stop_id in [*origin_ids, *destination_ids] if stop_id not in gtfs_data.stop_index]
+    if unknown:
+        raise ValueError(f"Unknown stops: {', '.join(unknown[:10])}")
+    if not 0 < max_minutes <= MATRIX_MAX_MINUTES:
+        raise ValueError(f"max_minutes must be between 1 and {MATRIX_MAX_MINUTES}")
+    depart_at = depart_at or datetime.now()
+    depart_secs = depart_at.hour * 3600 + depart_at.minute * 60 + depart_at.second
+    rows = matrix_pool.rows(
+        gtfs_data,
+        [gtfs_data.stop_index[stop_id] for stop_id in origin_ids],
+        [gtfs_data.stop_index[stop_id] for stop_id in destination_ids],
+        depart_secs, depart_secs + max_minutes * 60, max_transfers, depart_at.date(), strict_calendar,
+    )
+    return {
+        "origins": list(origin_ids),
+        "destinations": list(destination_ids),
+        "depart_at": depart_at.isoformat(),
+        "max_minutes": max_minutes,
+        "travel_secs": np.where(rows >= 0, rows, None).tolist(),
     }
-    common_trips = trips_with_start & trips_with_end
-    if common_trips:
-        trip_id = list(common_trips)[0]
-        return get_trip_stops(gtfs_data, trip_id)
-    return []
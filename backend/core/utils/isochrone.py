@@ -0,0 +1,55 @@
+"""Isochrones: every stop reachable from an origin within a travel-time budget.
+
+A single one-to-all RAPTOR search (TransitNetwork.reach) from the origin's
+stops gives the earliest arrival at every stop by the deadline, instead of
+one journey search per destination. A point origin first walks to the stops
+within ACCESS_RADIUS_M. The optional polygon is the union of the walking
+discs around every reached stop (and a point origin), each sized by the time
+left on arrival and capped at ACCESS_RADIUS_M.
+"""
+import math
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping
+
+from core.utils.footpaths import WALK_DETOUR_FACTOR, WALK_SPEED_MPS
+from core.utils.spatial import METRES_PER_DEG_LAT, METRES_PER_DEG_LON_EQUATOR
+
+MAX_MINUTES = int(os.getenv("ISOCHRONE_MAX_MINUTES", 120))
+# Departures within one bucket share a cached isochrone computed at the bucket start.
+BUCKET_SECS = int(os.getenv("ISOCHRONE_BUCKET_SECS", 300))
+ACCESS_RADIUS_M = float(os.getenv("ISOCHRONE_ACCESS_RADIUS_M", 800))
+POLYGON_TOLERANCE_M = 25.0
+
+
+def check_minutes(minutes):
+    if not 0 < minutes <= MAX_MINUTES:
+        raise ValueError(f"minutes must be between 1 and {MAX_MINUTES}")
+
+
+def walk_secs(distance_m):
+    """Walking time over crow-flies distances, with the footpath detour factor."""
+    return np.ceil(np.asarray(distance_m, dtype=np.float64) * WALK_DETOUR_FACTOR / WALK_SPEED_MPS).astype(np.int64)
+
+
+def walk_reach_m(secs):
+    """Crow-flies distance walked in ``secs``, capped at ACCESS_RADIUS_M."""
+    return np.minimum(np.asarray(secs, dtype=np.float64) * WALK_SPEED_MPS / WALK_DETOUR_FACTOR, ACCESS_RADIUS_M)
+
+
+def reach_polygon(lat, lon, radius_m, tolerance_m=POLYGON_TOLERANCE_M):
+    """GeoJSON geometry of the union of ``radius_m`` discs around the points, or None if there are none."""
+    lat, lon, radius_m = (np.asarray(v, dtype=np.float64) for v in (lat, lon, radius_m))
+    keep = radius_m > 0
+    if not keep.any():
+        return None
+    # local equirectangular metres around the points' mean latitude
+    x_scale = METRES_PER_DEG_LON_EQUATOR * math.cos(math.radians(float(lat[keep].mean())))
+    discs = shapely.buffer(
+        shapely.points(lon[keep] * x_scale, lat[keep] * METRES_PER_DEG_LAT), radius_m[keep], quad_segs=4,
+    )
+    area = shapely.simplify(shapely.union_all(discs), tolerance_m)
+    area = shapely.transform(area, lambda xy: xy / [x_scale, METRES_PER_DEG_LAT])
+    return mapping(shapely.set_precision(area, 1e-6))
@@ -0,0 +1,127 @@
+"""Trips grouped into unique stop patterns, built once at load.
+
+A stop pattern is the ordered stop list shared by the trips of one route and
+direction. Each pattern is stored once; each trip keeps only its pattern, its
+start time and a time profile (arrival/departure offsets from that start)
+that is itself shared by every trip running the same timings. The per-stop
+index lists the (pattern, position) pairs serving a stop, so route-by-stop
+lookups, "stops on this route" and routing read patterns instead of walking
+stop times trip by trip.
+"""
+import numpy as np
+
+from core.utils.frequencies import csr_offsets
+
+
+def _flatten(sequences, dtype):
+    """(values, CSR offsets) of a list of sequences."""
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in sequences], out=offsets[1:])
+    values = np.fromiter((v for s in sequences for v in s), dtype=dtype, count=int(offsets[-1]))
+    return values, offsets
+
+
+class StopPatterns:
+    """Unique stop patterns with per-trip time profiles and stop -> (pattern, position) lookups."""
+
+    ARRAY_FIELDS = (
+        "pattern_route", "pattern_direction", "pattern_stops", "pattern_stop_offsets",
+        "pattern_trips", "pattern_trip_offsets",
+        "trip_pattern", "trip_start", "trip_profile",
+        "profile_arrival", "profile_departure", "profile_offsets",
+        "stop_pattern_ids", "stop_pattern_positions", "stop_pattern_offsets",
+    )
+
+    def __init__(self, gtfs_data):
+        n_trips = len(gtfs_data.trip_ids)
+        st_stop = gtfs_data.st_stop.tolist()
+        st_arrival = gtfs_data.st_arrival.tolist()
+        st_departure = gtfs_data.st_departure.tolist()
+        trip_offsets = gtfs_data.trip_offsets.tolist()
+        trip_route = gtfs_data.trip_route.tolist()
+        trip_direction = gtfs_data.trip_direction.tolist()
+
+        patterns, profiles = {}, {}
+        self.trip_pattern = np.full(n_trips, -1, dtype=np.int32)
+        self.trip_start = np.zeros(n_trips, dtype=np.int32)
+        self.trip_profile = np.full(n_trips, -1, dtype=np.int32)
+        for trip_idx in range(n_trips):
+            lo, hi = trip_offsets[trip_idx], trip_offsets[trip_idx + 1]
+            if lo == hi:
+                continue
+            key = (trip_route[trip_idx], trip_direction[trip_idx], tuple(st_stop[lo:hi]))
+            p = patterns.setdefault(key, len(patterns))
+            # times relative to the first arrival, as frequency templates are
+            start = st_arrival[lo]
+            timing = (
+                p,
+                tuple(a - start for a in st_arrival[lo:hi]),
+                tuple(d - start for d in st_departure[lo:hi]),
+            )
+            self.trip_pattern[trip_idx] = p
+            self.trip_start[trip_idx] = start
+            self.trip_profile[trip_idx] = profiles.setdefault(timing, len(profiles))
+
+        keys = list(patterns)
+        self.pattern_route = np.array([key[0] for key in keys], dtype=np.int32)
+        self.pattern_direction = np.array([key[1] for key in keys], dtype=np.int8)
+        self.pattern_stops, self.pattern_stop_offsets = _flatten([key[2] for key in keys], np.int32)
+        timings = list(profiles)
+        self.profile_arrival, self.profile_offsets = _flatten([t[1] for t in timings], np.int32)
+        self.profile_departure, _ = _flatten([t[2] for t in timings], np.int32)
+
+        # pattern p runs pattern_trips[pattern_trip_offsets[p]:pattern_trip_offsets[p + 1]], by start time
+        order = np.lexsort((self.trip_start, self.trip_pattern))
+        order = order[self.trip_pattern[order] >= 0]
+        self.pattern_trips = order.astype(np.int32)
+        self.pattern_trip_offsets = csr_offsets(self.trip_pattern[order], len(keys))
+
+        # stop j is served at stop_pattern_ids/positions[stop_pattern_offsets[j]:stop_pattern_offsets[j + 1]]
+        lengths = np.diff(self.pattern_stop_offsets)
+        ids = np.repeat(np.arange(len(keys), dtype=np.int32), lengths)
+        positions = np.arange(len(self.pattern_stops)) - np.repeat(self.pattern_stop_offsets[:-1], lengths)
+        order = np.argsort(self.pattern_stops, kind="stable")
+        self.stop_pattern_ids = ids[order]
+        self.stop_pattern_positions = positions[order].astype(np.int32)
+        self.stop_pattern_offsets = csr_offsets(self.pattern_stops[order], len(gtfs_data.stop_ids))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        for name in cls.ARRAY_FIELDS:
+            setattr(index, name, arrays[name])
+        return index
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+
+    def __len__(self):
+        return len(self.pattern_route)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAY_FIELDS)
+
+    def stops(self, pattern):
+        """Stop indices of a pattern, in order."""
+        return self.pattern_stops[self.pattern_stop_offsets[pattern]:self.pattern_stop_offsets[pattern + 1]]
+
+    def trips(self, pattern):
+        """Trip indices running a pattern, by start time."""
+        return self.pattern_trips[self.pattern_trip_offsets[pattern]:self.pattern_trip_offsets[pattern + 1]]
+
+    def profile(self, profile):
+        """(arrival, departure) offsets of a time profile from its trip's start."""
+        lo, hi = self.profile_offsets[profile], self.profile_offsets[profile + 1]
+        return self.profile_arrival[lo:hi], self.profile_departure[lo:hi]
+
+    def stop_patterns(self, stop):
+        """(pattern ids, positions) serving a stop index; a loop pattern can appear twice."""
+        lo, hi = self.stop_pattern_offsets[stop], self.stop_pattern_offsets[stop + 1]
+        return self.stop_pattern_ids[lo:hi], self.stop_pattern_positions[lo:hi]
+
+    def route_patterns(self, route):
+        """Pattern ids of a route index, by direction then most trips first."""
+        found = np.flatnonzero(self.pattern_route == route)
+        trips = np.diff(self.pattern_trip_offsets)[found]
+        return found[np.lexsort((-trips, self.pattern_direction[found]))]
@@ -0,0 +1,185 @@
+"""Lazily connected, pooled Redis client guarded by a circuit breaker.
+
+Nothing touches the network at import. The connection pool is created on the
+first command, with tight connect/read timeouts so a slow Redis costs a
+request milliseconds rather than seconds. After ``failure_threshold``
+consecutive errors the breaker opens: the client then reports itself falsy, so
+every ``if redis_client:`` guard skips Redis, and a background thread re-probes
+with PING every ``cooldown`` seconds until it answers again and the breaker
+closes.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import redis
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN = "closed", "open"
+LATENCY_SAMPLES = 1000
+
+
+class RedisUnavailable(redis.RedisError):
+    """Raised for commands issued while the circuit breaker is open."""
+
+
+class ResilientRedis:
+    def __init__(
+        self, host=None, port=6379, db=0, username=None, password=None,
+        connect_timeout=0.25, socket_timeout=0.25, bulk_timeout=10.0, max_connections=50,
+        failure_threshold=3, cooldown=10.0,
+    ):
+        self.connection_kwargs = {
+            "host": host or "localhost",
+            "port": port,
+            "db": db,
+            "username": username,
+            "password": password,
+            "socket_connect_timeout": connect_timeout,
+            "socket_keepalive": True,
+            "health_check_interval": 30,
+        }
+        self.socket_timeout = socket_timeout
+        self.bulk_timeout = bulk_timeout
+        self.max_connections = max_connections
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.calls = 0
+        self.errors = 0
+        self.short_circuited = 0
+        self.latency_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+        self._client = None
+        self._bulk_client = None
+        self._prober = None
+
+    # --- connection ---
+    def _make_client(self, socket_timeout):
+        pool = redis.ConnectionPool(
+            max_connections=self.max_connections, socket_timeout=socket_timeout, **self.connection_kwargs,
+        )
+        return redis.Redis(connection_pool=pool)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._make_client(self.socket_timeout)
+        return self._client
+
+    @property
+    def bulk_client(self):
+        """Client with a long read timeout for large pipelines such as feed publishing."""
+        if self._bulk_client is None:
+            with self._lock:
+                if self._bulk_client is None:
+                    self._bulk_client = self._make_client(self.bulk_timeout)
+        return self._bulk_client
+
+    def __bool__(self):
+        return self.state == CLOSED
+
+    # --- breaker ---
+    def _record_success(self, started):
+        self.latency_ms.append((time.perf_counter() - started) * 1000)
+        self.consecutive_failures = 0
+
+    def _record_failure(self, error):
+        self.errors += 1
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.time()
+                logger.warning(f"Redis circuit opened after {self.consecutive_failures} failures: {error}")
+                self._start_prober()
+
+    def _start_prober(self):
+        if self._prober is None or not self._prober.is_alive():
+            self._prober = threading.Thread(target=self._probe, name="redis-breaker-probe", daemon=True)
+            self._prober.start()
+
+    def _probe(self):
+        while self.state == OPEN:
+            time.sleep(self.cooldown)
+            try:
+                self.client.ping()
+            except redis.RedisError as e:
+                logger.debug(f"Redis still unavailable: {e}")
+                continue
+            with self._lock:
+                self.state = CLOSED
+                self.consecutive_failures = 0
+                self.opened_at = None
+            logger.info("Redis circuit closed, caching re-enabled.")
+
+    def call(self, method, *args, bulk=False, **kwargs):
+        if self.state == OPEN:
+            self.short_circuited += 1
+            raise RedisUnavailable("Redis circuit is open")
+        self.calls += 1
+        started = time.perf_counter()
+        try:
+            result = getattr(self.bulk_client if bulk else self.client, method)(*args, **kwargs)
+        except redis.RedisError as e:
+            self._record_failure(e)
+            raise
+        self._record_success(started)
+        return result
+
+    def __getattr__(self, method):
+        # only reached for names not defined here, i.e. Redis commands
+        if method.startswith("_"):
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self.call(method, *args, **kwargs)
+
+    def pipeline(self, transaction=True, bulk=False):
+        if self.state == OPEN:
+            self.short_circuited += 1
+            raise RedisUnavailable("Redis circuit is open")
+        return GuardedPipeline(self, (self.bulk_client if bulk else self.client).pipeline(transaction=transaction))
+
+    def stats(self):
+        samples = np.fromiter(self.latency_ms, dtype=np.float64) if self.latency_ms else None
+        return {
+            "state": self.state,
+            "opened_at": self.opened_at,
+            "calls": self.calls,
+            "errors": self.errors,
+            "short_circuited": self.short_circuited,
+            "latency_ms": {
+                "p50": round(float(np.percentile(samples, 50)), 3),
+                "p95": round(float(np.percentile(samples, 95)), 3),
+            } if samples is not None else None,
+        }
+
+
+class GuardedPipeline:
+    """Pipeline whose execute() counts towards the owner's breaker and metrics."""
+
+    def __init__(self, owner, pipeline):
+        self.owner = owner
+        self.pipeline = pipeline
+
+    def __getattr__(self, method):
+        return getattr(self.pipeline, method)
+
+    def execute(self):
+        self.owner.calls += 1
+        started = time.perf_counter()
+        try:
+            result = self.pipeline.execute()
+        except redis.RedisError as e:
+            self.owner._record_failure(e)
+            raise
+        self.owner._record_success(started)
+        return result
+
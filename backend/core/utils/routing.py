@@ -0,0 +1,212 @@
+"""Round-based public transit routing (RAPTOR) over the in-memory GTFS dataset.
+
+Trips are grouped into route patterns (trips of a route visiting the same
+ordered stops, see core.utils.patterns). Round k scans every pattern touching
+a stop improved in round k - 1, then relaxes walking footpaths from the stops
+it improved, so after round k each stop holds its earliest arrival using at
+most k vehicles.
+Frequency-based trips are boarded via their headway windows without expanding
+them. reach() runs the same rounds one-to-all, bounded by a deadline instead
+of a target, for isochrones and travel-time matrices.
+"""
+INF = float("inf")
+MAX_RUNNING_DAYS = 8
+
+
+class PatternTrip:
+    """One trip (or frequency template) running along a pattern.
+
+    ``arrivals`` and ``departures`` are the trip's time profile, offsets from
+    ``start`` shared with every trip of the pattern that runs the same timings.
+    """
+
+    __slots__ = ("trip_idx", "start", "arrivals", "departures", "windows")
+
+    def __init__(self, trip_idx, start, arrivals, departures, windows):
+        self.trip_idx = trip_idx
+        self.start = start
+        self.arrivals = arrivals
+        self.departures = departures
+        self.windows = windows
+
+    def earliest_departure(self, pos, after_secs):
+        """(departure_secs, origin) of the first vehicle leaving ``pos`` at or after ``after_secs``.
+
+        ``origin`` is the absolute time the profile offsets count from.
+        """
+        offset = self.departures[pos]
+        if not self.windows:
+            return (self.start + offset, self.start) if self.start + offset >= after_secs else None
+        for start, end, headway in self.windows:
+            vehicle = start + max(0, -(-(after_secs - offset - start) // headway)) * headway
+            if vehicle < end:
+                return vehicle + offset, vehicle
+        return None
+
+
+class TransitNetwork:
+    """Route patterns and per-stop pattern lists for routing, read from the dataset's StopPatterns."""
+
+    def __init__(self, gtfs_data, footpaths=None):
+        self.gtfs_data = gtfs_data
+        # stop -> [(stop, walk_secs)]
+        self.footpaths = footpaths.adjacency() if footpaths is not None else {}
+        freq = gtfs_data.frequencies
+        patterns = gtfs_data.patterns
+        self.pattern_route = patterns.pattern_route.tolist()
+        self.pattern_stops = [patterns.stops(p).tolist() for p in range(len(patterns))]
+
+        # one pair of lists per time profile, shared by the trips that run it
+        profiles = [
+            tuple(a.tolist() for a in patterns.profile(q)) for q in range(len(patterns.profile_offsets) - 1)
+        ]
+        trip_start = patterns.trip_start.tolist()
+        trip_profile = patterns.trip_profile.tolist()
+        self.pattern_trips = []
+        for p in range(len(patterns)):
+            trips = []
+            for trip_idx in patterns.trips(p).tolist():
+                windows = [
+                    (int(freq.freq_start[w]), int(freq.freq_end[w]), int(freq.freq_headway[w]))
+                    for w in range(freq.trip_freq_offsets[trip_idx], freq.trip_freq_offsets[trip_idx + 1])
+                ]
+                trips.append(PatternTrip(trip_idx, trip_start[trip_idx], *profiles[trip_profile[trip_idx]], windows))
+            self.pattern_trips.append(trips)
+
+        # stop -> [(pattern, position)], the per-stop route lists scanned each round
+        self.stop_patterns = {}
+        offsets = patterns.stop_pattern_offsets.tolist()
+        ids, positions = patterns.stop_pattern_ids.tolist(), patterns.stop_pattern_positions.tolist()
+        for stop in range(len(offsets) - 1):
+            lo, hi = offsets[stop], offsets[stop + 1]
+            if lo < hi:
+                self.stop_patterns[stop] = list(zip(ids[lo:hi], positions[lo:hi]))
+        self._running = {}
+
+    def running_trips(self, day, running):
+        """Per-pattern trip lists keeping the trips of a ``running`` mask, built once per ``day``."""
+        found = self._running.get(day)
+        if found is None:
+            if len(self._running) >= MAX_RUNNING_DAYS:
+                self._running.clear()
+            found = [[trip for trip in trips if running[trip.trip_idx]] for trips in self.pattern_trips]
+            self._running[day] = found
+        return found
+
+    def earliest_trip(self, pattern, pos, after_secs, pattern_trips=None):
+        best = None
+        for trip in (self.pattern_trips if pattern_trips is None else pattern_trips)[pattern]:
+            found = trip.earliest_departure(pos, after_secs)
+            if found is not None and (best is None or found[0] < best[1]):
+                best = (trip, found[0], found[1])
+        return best
+
+    def route(self, source, target, depart_secs, max_transfers=2, pattern_trips=None):
+        """Pareto-optimal (arrival, vehicles) journeys from stop index ``source`` to ``target``.
+
+        Returns a list of journeys, fewest vehicles first. Each journey is a list
+        of legs, either ("transit", pattern, trip, shift, board_pos, alight_pos)
+        or ("walk", from_stop, to_stop, depart_secs, walk_secs); ``shift`` moves
+        the trip's stop times onto the vehicle taken (0 unless frequency-based).
+        ``pattern_trips`` (see running_trips) limits boarding to the trips running that day.
+        """
+        if source == target:
+            return []
+        best = {source: depart_secs}
+        best_round = {source: 0}
+        # per round: stop -> label, kept apart so walks always start from a ride's arrival
+        rides, walks = [{}], [{}]
+        marked = {source} | self._relax_footpaths({source: depart_secs}, best, best_round, walks[0], 0, target)
+        journeys = []
+        if target in walks[0]:
+            journeys.append(self._backtrack(rides, walks, 0, target))
+
+        for k in range(1, max_transfers + 2):
+            ride = self._scan_patterns(marked, best, best_round, k, target, INF, pattern_trips)
+            walk = {}
+            arrivals = {stop: label[0] for stop, label in ride.items()}
+            marked = set(ride) | self._relax_footpaths(arrivals, best, best_round, walk, k, target)
+            rides.append(ride)
+            walks.append(walk)
+            if target in ride or target in walk:
+                journeys.append(self._backtrack(rides, walks, k, target))
+            if not marked:
+                break
+        return journeys
+
+    def reach(self, sources, deadline, max_transfers=2, pattern_trips=None):
+        """Earliest arrival at every stop reachable by ``deadline`` from ``sources`` ({stop: ready_secs}).
+
+        One-to-all search: the same rounds as route() with no target to stop
+        at, pruned by ``deadline`` instead. Returns {stop: (arrival_secs, vehicles)}.
+        """
+        best = {stop: ready for stop, ready in sources.items() if ready <= deadline}
+        best_round = dict.fromkeys(best, 0)
+        marked = set(best) | self._relax_footpaths(dict(best), best, best_round, {}, 0, None, deadline)
+        for k in range(1, max_transfers + 2):
+            ride = self._scan_patterns(marked, best, best_round, k, None, deadline, pattern_trips)
+            arrivals = {stop: label[0] for stop, label in ride.items()}
+            marked = set(ride) | self._relax_footpaths(arrivals, best, best_round, {}, k, None, deadline)
+            if not marked:
+                break
+        return {stop: (arr, best_round[stop]) for stop, arr in best.items()}
+
+    def _scan_patterns(self, marked, best, best_round, k, target, deadline, pattern_trips):
+        """Round ``k``: ride every pattern through a marked stop; returns the improved stops' ride labels."""
+        queue = {}
+        for stop in marked:
+            for p, pos in self.stop_patterns.get(stop, ()):
+                if pos < queue.get(p, INF):
+                    queue[p] = pos
+
+        # labels reachable with at most k - 1 vehicles
+        prev, prev_round = dict(best), dict(best_round)
+        ride = {}
+        for p, start_pos in queue.items():
+            stops = self.pattern_stops[p]
+            trip = None
+            for pos in range(start_pos, len(stops)):
+                stop = stops[pos]
+                if trip is not None:
+                    arr = trip.arrivals[pos] + shift
+                    if arr < best.get(stop, INF) and arr < best.get(target, INF) and arr <= deadline:
+                        best[stop] = arr
+                        best_round[stop] = k
+                        ride[stop] = (arr, p, trip, shift, board_pos, pos, board_round)
+                ready = prev.get(stop)
+                if ready is not None and (trip is None or ready <= trip.departures[pos] + shift):
+                    found = self.earliest_trip(p, pos, ready, pattern_trips)
+                    if found is not None and (trip is None or found[1] < trip.departures[pos] + shift):
+                        trip, _, shift = found
+                        board_pos, board_round = pos, prev_round[stop]
+        return ride
+
+    def _relax_footpaths(self, arrivals, best, best_round, walk, k, target, deadline=INF):
+        walked = set()
+        for stop, ready in arrivals.items():
+            for other, walk_secs in self.footpaths.get(stop, ()):
+                arr = ready + walk_secs
+                if arr < best.get(other, INF) and arr < best.get(target, INF) and arr <= deadline:
+                    best[other] = arr
+                    best_round[other] = k
+                    walk[other] = (arr, stop, ready, walk_secs)
+                    walked.add(other)
+        return walked
+
+    def _backtrack(self, rides, walks, k, target):
+        legs = []
+        stop = target
+        while True:
+            walk, ride = walks[k].get(stop), rides[k].get(stop)
+            if walk is not None and (ride is None or walk[0] < ride[0]):
+                _, from_stop, ready, walk_secs = walk
+                legs.append(("walk", from_stop, stop, ready, walk_secs))
+                stop = from_stop
+                ride = rides[k].get(stop)
+            if k == 0:
+                break
+            _, p, trip, shift, board_pos, alight_pos, board_round = ride
+            legs.append(("transit", p, trip, shift - trip.start, board_pos, alight_pos))
+            stop = self.pattern_stops[p][board_pos]
+            k = board_round
+        return legs[::-1]
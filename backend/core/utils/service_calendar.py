@@ -0,0 +1,135 @@
+"""Service calendars (calendar.txt, calendar_dates.txt) as per-service day bitsets.
+
+Every service_id gets one bit per day of the feed period, the span of all
+calendar ranges and exception dates: its weekly pattern between start_date
+and end_date, with calendar_dates exceptions applied (1 adds the day, 2
+removes it). Whether a service runs on a day is a single bit test, and the
+services running on a day are one bit column, memoised per day, so filtering
+trips by date is an array lookup per trip.
+
+A feed with neither file has no period and nothing is filtered.
+"""
+import logging
+from datetime import date, datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+MAX_MEMO_DAYS = 64
+
+
+def parse_gtfs_date(value):
+    """Ordinal of a ``YYYYMMDD`` GTFS date."""
+    return datetime.strptime(str(value).strip(), "%Y%m%d").date().toordinal()
+
+
+def on_service_date(departures, shift, service_date):
+    """(seconds, row) departures of the service day ``shift`` seconds back, as
+    (seconds since the query date's midnight, seconds on their own day, row, service_date)."""
+    for dep, row in departures:
+        yield dep - shift, dep, row, service_date
+
+
+class ServiceCalendar:
+    """Active days of every service over the feed period, one bit per (service, day)."""
+
+    ARRAY_FIELDS = ("service_ids", "period", "bits")
+
+    def __init__(self, service_ids, calendar_services, weekly, starts, ends,
+                 exception_services, exception_days, exception_types):
+        """Build from parsed rows; days are date ordinals, ``weekly`` a (rows, 7) bool matrix Monday first.
+
+        ``service_ids`` are extra ids to index, e.g. those trips refer to,
+        whether or not the calendar files mention them.
+        """
+        self.service_ids = np.unique(np.concatenate([
+            np.asarray(service_ids, dtype=str), np.asarray(calendar_services, dtype=str),
+            np.asarray(exception_services, dtype=str),
+        ]))
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        exception_days = np.asarray(exception_days, dtype=np.int64)
+        bounds = np.concatenate([starts, ends, exception_days])
+        first = int(bounds.min()) if len(bounds) else 0
+        n_days = int(bounds.max()) - first + 1 if len(bounds) else 0
+        # [first day ordinal, number of days]
+        self.period = np.array([first, n_days], dtype=np.int64)
+
+        days = np.arange(first, first + n_days)
+        weekday = (days + 6) % 7  # date.fromordinal(1) is a Monday
+        active = np.zeros((len(self.service_ids), n_days), dtype=bool)
+        rows = np.searchsorted(self.service_ids, np.asarray(calendar_services, dtype=str))
+        weekly = np.asarray(weekly, dtype=bool).reshape(-1, 7)
+        for s, pattern, start, end in zip(rows.tolist(), weekly, starts.tolist(), ends.tolist()):
+            active[s] |= pattern[weekday] & (days >= start) & (days <= end)
+        services = np.searchsorted(self.service_ids, np.asarray(exception_services, dtype=str))
+        active[services, exception_days - first] = np.asarray(exception_types, dtype=np.int64) == 1
+        self.bits = np.packbits(active, axis=1)
+        self._reset()
+
+    def _reset(self):
+        self._active = {}
+        self._warned = set()
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        for name in cls.ARRAY_FIELDS:
+            setattr(index, name, arrays[name])
+        index._reset()
+        return index
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+
+    def __len__(self):
+        return len(self.service_ids)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAY_FIELDS)
+
+    @property
+    def start(self):
+        return date.fromordinal(int(self.period[0])) if self.period[1] else None
+
+    @property
+    def end(self):
+        return date.fromordinal(int(self.period.sum()) - 1) if self.period[1] else None
+
+    def covers(self, day):
+        return 0 <= day.toordinal() - int(self.period[0]) < int(self.period[1])
+
+    def active(self, day):
+        """Bool array over service_ids of the services running on ``day``, memoised."""
+        found = self._active.get(day)
+        if found is None:
+            d = day.toordinal() - int(self.period[0])
+            if 0 <= d < int(self.period[1]):
+                found = (self.bits[:, d >> 3] >> (7 - (d & 7)) & 1).astype(bool)
+            else:
+                found = np.zeros(len(self.service_ids), dtype=bool)
+            if len(self._active) >= MAX_MEMO_DAYS:
+                self._active.clear()
+            self._active[day] = found
+        return found
+
+    def services_on(self, day, strict=True):
+        """Bool array of the services running on ``day``, or None to leave trips unfiltered.
+
+        Without a calendar nothing is filtered. Outside the feed period a
+        ``strict`` query (a date the caller asked for) gets no services; a
+        default "today" is left unfiltered instead, so an expired feed keeps
+        answering, and that is logged once per day.
+        """
+        if not self.period[1]:
+            return None
+        if not strict and not self.covers(day):
+            if day not in self._warned:
+                self._warned.add(day)
+                logger.warning(
+                    f"{day} is outside the feed calendar ({self.start} to {self.end}); not filtering trips by date."
+                )
+            return None
+        return self.active(day)
@@ -0,0 +1,178 @@
+"""Route geometry from shapes.txt, simplified per map zoom level.
+
+Douglas-Peucker is run once per shape at load, recording for every point the
+tolerance up to which it survives (its "importance"). Simplifying a shape for
+a zoom level is then a mask over that array: keep the points whose importance
+exceeds one screen pixel at that zoom. Results go out as Google encoded
+polylines, which are several times smaller than coordinate lists, and the
+encoding of each (shape, zoom) is memoised.
+"""
+import math
+from functools import cached_property
+
+import numpy as np
+
+from core.utils.frequencies import csr_offsets
+from core.utils.spatial import METRES_PER_DEG_LAT, METRES_PER_DEG_LON_EQUATOR
+
+MIN_ZOOM = 0
+MAX_ZOOM = 20
+# Web Mercator ground resolution of a 256px tile at the equator, zoom 0.
+EQUATOR_METRES_PER_PIXEL = 156543.03392
+TOLERANCE_PX = 1.0
+
+
+def clamp_zoom(zoom):
+    return min(MAX_ZOOM, max(MIN_ZOOM, int(zoom)))
+
+
+def clamped_zoom(args, kwargs):
+    """Cache ``normalize`` keying the ``zoom`` argument by its clamped value."""
+    return args, {**kwargs, "zoom": clamp_zoom(kwargs.get("zoom", MAX_ZOOM))}
+
+
+def tolerance_m(zoom, pixels=TOLERANCE_PX):
+    """Simplification tolerance at ``zoom``, in metres at the equator."""
+    return pixels * EQUATOR_METRES_PER_PIXEL / 2 ** zoom
+
+
+def _segment_distance(x, y, x0, y0, x1, y1):
+    """Distance from points (x, y) to the segments (x0, y0)-(x1, y1), elementwise."""
+    dx, dy = x1 - x0, y1 - y0
+    length2 = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(length2 > 0, ((x - x0) * dx + (y - y0) * dy) / length2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(x - (x0 + t * dx), y - (y0 + t * dy))
+
+
+def dp_importance(lat, lon, offsets):
+    """Per-point Douglas-Peucker tolerance (equatorial metres) above which the point is dropped.
+
+    ``offsets`` delimit the shapes as in a CSR array. A point is kept at
+    tolerance ``tol`` exactly when standard Douglas-Peucker with ``tol`` keeps
+    it, i.e. ``importance > tol``; endpoints are always kept. Every pending
+    split of every shape is processed together, one tree level per pass.
+    """
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    importance = np.zeros(len(lat), dtype=np.float64)
+    nonempty = np.diff(offsets) > 0
+    first, last = offsets[:-1][nonempty], offsets[1:][nonempty] - 1
+    importance[first] = importance[last] = np.inf
+    if not len(first):
+        return importance
+    # Local equirectangular projection per shape, scaled back to metres at the
+    # equator so that one set of per-zoom tolerances fits shapes at any latitude.
+    counts = last - first + 1
+    mean_lat = np.add.reduceat(lat, first) / counts
+    scale = np.repeat(np.maximum(np.cos(np.radians(mean_lat)), 0.01), counts)
+    x = lon * METRES_PER_DEG_LON_EQUATOR
+    y = lat * METRES_PER_DEG_LAT / scale
+
+    ceiling = np.full(len(first), np.inf)
+    while True:
+        open_ = last - first >= 2
+        first, last, ceiling = first[open_], last[open_], ceiling[open_]
+        if not len(first):
+            return importance
+        inner = last - first - 1
+        starts = np.cumsum(inner) - inner
+        owner = np.repeat(np.arange(len(first)), inner)
+        points = np.arange(inner.sum()) - starts[owner] + first[owner] + 1
+        distance = _segment_distance(
+            x[points], y[points], x[first][owner], y[first][owner], x[last][owner], y[last][owner],
+        )
+        farthest = np.maximum.reduceat(distance, starts)
+        _, at = np.unique(owner[distance == farthest[owner]], return_index=True)
+        k = points[np.flatnonzero(distance == farthest[owner])[at]]
+        # a point cannot outlive the split that exposed it
+        split = np.minimum(farthest, ceiling)
+        importance[k] = split
+        first, last = np.concatenate((first, k)), np.concatenate((k, last))
+        ceiling = np.concatenate((split, split))
+
+
+def encode_polyline(lat, lon, precision=5):
+    """Google encoded polyline of the points."""
+    scaled = np.round(np.column_stack((lat, lon)) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    chunks = []
+    for value in ((deltas << 1) ^ (deltas >> 63)).tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+class ShapeIndex:
+    """Shape points as CSR column arrays with their precomputed Douglas-Peucker importance."""
+
+    ARRAY_FIELDS = ("shape_ids", "shape_offsets", "lat", "lon", "importance")
+
+    def __init__(self, shape_ids, lat, lon, sequence):
+        shape_ids = np.asarray(shape_ids, dtype=str)
+        self.shape_ids, codes = np.unique(shape_ids, return_inverse=True)
+        order = np.lexsort((np.asarray(sequence, dtype=np.int64), codes))
+        self.lat = np.asarray(lat, dtype=np.float64)[order]
+        self.lon = np.asarray(lon, dtype=np.float64)[order]
+        # shape i's points are lat/lon[shape_offsets[i]:shape_offsets[i + 1]], in sequence order
+        self.shape_offsets = csr_offsets(codes[order], len(self.shape_ids))
+        self.importance = dp_importance(self.lat, self.lon, self.shape_offsets)
+        self._encoded = {}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        for name in cls.ARRAY_FIELDS:
+            setattr(index, name, arrays[name])
+        index._encoded = {}
+        return index
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+
+    def __len__(self):
+        return len(self.shape_ids)
+
+    def __contains__(self, shape_id):
+        return shape_id in self.shape_index
+
+    @cached_property
+    def shape_index(self):
+        return {shape_id: i for i, shape_id in enumerate(self.shape_ids.tolist())}
+
+    @cached_property
+    def bounds(self):
+        """(south, west, north, east) arrays with one entry per shape."""
+        if not len(self.shape_ids):
+            return tuple(np.empty(0) for _ in range(4))
+        starts = self.shape_offsets[:-1]
+        return (
+            np.minimum.reduceat(self.lat, starts), np.minimum.reduceat(self.lon, starts),
+            np.maximum.reduceat(self.lat, starts), np.maximum.reduceat(self.lon, starts),
+        )
+
+    def in_box(self, west, south, east, north):
+        """Ids of the shapes whose bounding box meets the given one."""
+        shape_south, shape_west, shape_north, shape_east = self.bounds
+        hit = (shape_south <= north) & (shape_north >= south) & (shape_west <= east) & (shape_east >= west)
+        return self.shape_ids[hit].tolist()
+
+    def simplified(self, shape_id, zoom):
+        """(lat, lon) arrays of the shape as drawn at ``zoom``."""
+        i = self.shape_index[shape_id]
+        lo, hi = self.shape_offsets[i], self.shape_offsets[i + 1]
+        keep = self.importance[lo:hi] > tolerance_m(clamp_zoom(zoom))
+        return self.lat[lo:hi][keep], self.lon[lo:hi][keep]
+
+    def encoded(self, shape_id, zoom):
+        """{"shape_id", "points", "polyline"} for the shape at ``zoom``, memoised."""
+        key = (shape_id, clamp_zoom(zoom))
+        found = self._encoded.get(key)
+        if found is None:
+            lat, lon = self.simplified(*key)
+            found = {"shape_id": shape_id, "points": len(lat), "polyline": encode_polyline(lat, lon)}
+            self._encoded[key] = found
+        return found
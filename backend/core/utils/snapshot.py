@@ -0,0 +1,98 @@
+"""Versioned on-disk bundles of NumPy arrays, opened with mmap.
+
+A snapshot is a directory holding one uncompressed ``.npy`` file per array and
+a ``manifest.json`` describing them. Opening it maps every array read-only, so
+start-up does no parsing and all worker processes share the same page-cache
+pages. ``CURRENT`` in the snapshot root names the active version and is
+replaced atomically when a new snapshot is published.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 1
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+
+def source_signature(paths):
+    """Cheap (size, mtime) signature of the source files a snapshot was compiled from."""
+    return {
+        os.path.basename(path): [os.path.getsize(path), os.stat(path).st_mtime_ns]
+        for path in paths
+        if os.path.exists(path)
+    }
+
+
+def write_snapshot(root, version, arrays, attrs=None, sources=None):
+    """Write ``arrays`` ({name: ndarray}) as snapshot ``version`` and make it current."""
+    os.makedirs(root, exist_ok=True)
+    final_dir = os.path.join(root, version)
+    staging_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=root)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(staging_dir, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "version": version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "arrays": sorted(arrays),
+            "attrs": attrs or {},
+            "sources": source_signature(sources or []),
+        }
+        with open(os.path.join(staging_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(final_dir):
+            shutil.rmtree(final_dir)
+        os.replace(staging_dir, final_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(root, f".{CURRENT_FILE}.tmp")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+    return final_dir
+
+
+def current_version(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def open_snapshot(root, version=None):
+    """(manifest, {name: read-only memmap}) of a snapshot, or None if there is none."""
+    version = version or current_version(root)
+    if not version:
+        return None
+    directory = os.path.join(root, version)
+    with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    arrays = {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+        for name in manifest["arrays"]
+    }
+    return manifest, arrays
+
+
+def prune_snapshots(root, keep=3):
+    """Remove all but the ``keep`` newest snapshot versions, never the current one."""
+    current = current_version(root)
+    versions = [
+        entry for entry in os.listdir(root)
+        if not entry.startswith(".") and os.path.isdir(os.path.join(root, entry))
+    ]
+    versions.sort(key=lambda entry: os.path.getmtime(os.path.join(root, entry)), reverse=True)
+    for entry in versions[keep:]:
+        if entry != current:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
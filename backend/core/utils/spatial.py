@@ -0,0 +1,151 @@
+"""Vectorised geodesic helpers over stop coordinate arrays."""
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+# Shortest metres-per-degree of latitude on the ellipsoid, so cells are never too small.
+METRES_PER_DEG_LAT = 110574.0
+METRES_PER_DEG_LON_EQUATOR = 111320.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; arguments broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def grid_cells(lat, lon, cell_m):
+    """Integer (row, col) cells at least ``cell_m`` metres wide for every point."""
+    max_abs_lat = min(float(np.abs(lat).max()) if len(lat) else 0.0, 89.0)
+    cell_lat = cell_m / METRES_PER_DEG_LAT
+    cell_lon = cell_m / (METRES_PER_DEG_LON_EQUATOR * np.cos(np.radians(max_abs_lat)))
+    return (
+        np.floor(np.asarray(lat) / cell_lat).astype(np.int64),
+        np.floor(np.asarray(lon) / cell_lon).astype(np.int64),
+    )
+
+
+def _cell_keys(rows, cols):
+    # Cells stay well inside +/- 2**31 for any radius above a few centimetres.
+    return (rows << 32) + (cols & 0xFFFFFFFF)
+
+
+def neighbour_pairs(lat, lon, radius_m):
+    """Every ordered pair (i, j), i != j, within ``radius_m`` metres, with its distance.
+
+    Points are bucketed into radius-sized grid cells and each point is compared
+    only against the 3x3 block of cells around it, so the work is proportional
+    to the number of nearby pairs rather than to n ** 2.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    rows, cols = grid_cells(lat, lon, radius_m)
+    keys = _cell_keys(rows, cols)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    sources, targets = [], []
+    for d_row in (-1, 0, 1):
+        for d_col in (-1, 0, 1):
+            wanted = _cell_keys(rows + d_row, cols + d_col)
+            lo = np.searchsorted(sorted_keys, wanted, side="left")
+            hi = np.searchsorted(sorted_keys, wanted, side="right")
+            counts = hi - lo
+            total = int(counts.sum())
+            if not total:
+                continue
+            src = np.repeat(np.arange(len(lat)), counts)
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            sources.append(src)
+            targets.append(order[starts + np.arange(total)])
+
+    if not sources:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float64)
+    src = np.concatenate(sources)
+    dst = np.concatenate(targets)
+    keep = src != dst
+    src, dst = src[keep], dst[keep]
+    distance = haversine_m(lat[src], lon[src], lat[dst], lon[dst])
+    within = distance <= radius_m
+    return src[within], dst[within], distance[within]
+
+
+class StopGrid:
+    """Bulk-loaded uniform grid over stop coordinates for radius and k-nearest queries.
+
+    Points are sorted by cell key once; a query gathers the cells overlapping
+    its bounding box by bisection, then ranks candidates by exact haversine.
+    """
+
+    ARRAY_FIELDS = ("order", "cell_keys", "cell_starts")
+
+    def __init__(self, lat, lon, cell_m=250.0):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell_m = cell_m
+        max_abs_lat = min(float(np.abs(self.lat).max()) if len(self.lat) else 0.0, 89.0)
+        self.cell_lat = cell_m / METRES_PER_DEG_LAT
+        self.cell_lon = cell_m / (METRES_PER_DEG_LON_EQUATOR * np.cos(np.radians(max_abs_lat)))
+        rows = np.floor(self.lat / self.cell_lat).astype(np.int64)
+        cols = np.floor(self.lon / self.cell_lon).astype(np.int64)
+        keys = _cell_keys(rows, cols)
+        self.order = np.argsort(keys, kind="stable").astype(np.int32)
+        sorted_keys = keys[self.order]
+        self.cell_keys, starts = np.unique(sorted_keys, return_index=True)
+        self.cell_starts = np.append(starts, len(sorted_keys))
+
+    @classmethod
+    def from_arrays(cls, lat, lon, arrays, cell_m, cell_lat, cell_lon):
+        grid = cls.__new__(cls)
+        grid.lat, grid.lon = lat, lon
+        grid.cell_m, grid.cell_lat, grid.cell_lon = cell_m, cell_lat, cell_lon
+        for name in cls.ARRAY_FIELDS:
+            setattr(grid, name, arrays[name])
+        return grid
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _candidates(self, lat, lon, radius_m):
+        d_lat = radius_m / METRES_PER_DEG_LAT
+        edge_lat = min(abs(lat) + d_lat, 89.0)
+        d_lon = min(radius_m / (METRES_PER_DEG_LON_EQUATOR * np.cos(np.radians(edge_lat))), 180.0)
+        rows = np.arange(np.floor((lat - d_lat) / self.cell_lat), np.floor((lat + d_lat) / self.cell_lat) + 1)
+        cols = np.arange(np.floor((lon - d_lon) / self.cell_lon), np.floor((lon + d_lon) / self.cell_lon) + 1)
+        if len(rows) * len(cols) >= len(self.cell_keys):
+            # the box spans more cells than are occupied; every point is a candidate
+            return np.arange(len(self), dtype=np.int32)
+        wanted = _cell_keys(rows.astype(np.int64)[:, None], cols.astype(np.int64)[None, :]).ravel()
+        pos = np.searchsorted(self.cell_keys, wanted)
+        hit = pos < len(self.cell_keys)
+        hit[hit] = self.cell_keys[pos[hit]] == wanted[hit]
+        pos = pos[hit]
+        starts, ends = self.cell_starts[pos], self.cell_starts[pos + 1]
+        counts = ends - starts
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self.order[offsets + np.arange(int(counts.sum()))]
+
+    def within(self, lat, lon, radius_m):
+        """(indices, distances_m) of points within ``radius_m``, nearest first."""
+        candidates = self._candidates(lat, lon, radius_m)
+        distance = haversine_m(lat, lon, self.lat[candidates], self.lon[candidates])
+        keep = distance <= radius_m
+        candidates, distance = candidates[keep], distance[keep]
+        order = np.argsort(distance, kind="stable")
+        return candidates[order], distance[order]
+
+    def nearest(self, lat, lon, k, max_radius_m=None):
+        """(indices, distances_m) of the ``k`` nearest points, optionally capped at ``max_radius_m``."""
+        k = min(k, len(self))
+        radius = self.cell_m
+        limit = max_radius_m if max_radius_m is not None else 2 * np.pi * EARTH_RADIUS_M
+        while True:
+            radius = min(radius, limit)
+            found, distance = self.within(lat, lon, radius)
+            if len(found) >= k or radius >= limit:
+                return found[:k], distance[:k]
+            radius *= 2
@@ -0,0 +1,157 @@
+"""In-memory name search with prefix and trigram postings, for per-keystroke lookups.
+
+Names are normalised (case-folded, accents stripped, punctuation split) into
+tokens. Every distinct token gets an id in a sorted vocabulary, so all tokens
+starting with a prefix are one contiguous bisected range, and the vocabulary
+is also indexed by padded trigrams for typo-tolerant matching. Each query
+token is matched exactly, as a prefix, or fuzzily (trigram Jaccard); a
+document must match every query token and is ranked by the summed scores plus
+bonuses for whole-field and leading matches.
+"""
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+FUZZY_SCORE = 1.5
+MIN_SIMILARITY = 0.3
+MAX_FUZZY_TOKENS = 20
+# Prefixes this short match a large part of the vocabulary; their scores are memoised.
+MEMO_PREFIX_LEN = 2
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def tokenize(text):
+    return normalize(text).split()
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TextIndex:
+    """Search over documents made of one or more named fields.
+
+    ``documents`` is a sequence of tuples of field strings, all the same
+    length; ``weights`` scales matches per field position.
+    """
+
+    def __init__(self, documents, weights=None):
+        self.fields = [tuple(normalize(value) for value in doc) for doc in documents]
+        self.lengths = [sum(map(len, fields)) for fields in self.fields]
+        self.token_counts = [max(1, sum(len(value.split()) for value in fields)) for fields in self.fields]
+        self._memo = {}
+        n_fields = len(self.fields[0]) if self.fields else 0
+        self.weights = tuple(weights) if weights else (1.0,) * n_fields
+
+        postings = defaultdict(dict)  # token -> {doc: best field weight}
+        for doc, fields in enumerate(self.fields):
+            for field, value in enumerate(fields):
+                for token in value.split():
+                    weight = self.weights[field]
+                    if postings[token].get(doc, 0.0) < weight:
+                        postings[token][doc] = weight
+        self.vocabulary = sorted(postings)
+        self.postings = [postings[token] for token in self.vocabulary]
+
+        self.trigram_postings = defaultdict(list)
+        self.trigram_counts = []
+        for token_id, token in enumerate(self.vocabulary):
+            grams = trigrams(token)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.trigram_postings[gram].append(token_id)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def _prefix_range(self, prefix):
+        lo = bisect_left(self.vocabulary, prefix)
+        hi = bisect_left(self.vocabulary, prefix + "\x7f", lo)
+        return lo, hi
+
+    def _fuzzy(self, token):
+        """(token_id, similarity) of vocabulary tokens similar to ``token``, best first."""
+        grams = trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for token_id in self.trigram_postings.get(gram, ()):
+                shared[token_id] += 1
+        scored = []
+        for token_id, common in shared.items():
+            similarity = common / (len(grams) + self.trigram_counts[token_id] - common)
+            if similarity >= MIN_SIMILARITY:
+                scored.append((token_id, similarity))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:MAX_FUZZY_TOKENS]
+
+    def _token_scores(self, token):
+        """{doc: score} for one query token."""
+        if len(token) <= MEMO_PREFIX_LEN:
+            scores = self._memo.get(token)
+            if scores is None:
+                scores = self._memo[token] = self._match(token)
+            return scores
+        return self._match(token)
+
+    def _match(self, token):
+        scores = {}
+        lo, hi = self._prefix_range(token)
+        for token_id in range(lo, hi):
+            vocab_token = self.vocabulary[token_id]
+            base = EXACT_SCORE if vocab_token == token else PREFIX_SCORE * (0.5 + 0.5 * len(token) / len(vocab_token))
+            for doc, weight in self.postings[token_id].items():
+                score = base * weight
+                if score > scores.get(doc, 0.0):
+                    scores[doc] = score
+        if not scores and len(token) >= 3:
+            for token_id, similarity in self._fuzzy(token):
+                for doc, weight in self.postings[token_id].items():
+                    score = FUZZY_SCORE * similarity * weight
+                    if score > scores.get(doc, 0.0):
+                        scores[doc] = score
+        return scores
+
+    def search(self, query, limit=10):
+        """[(doc, score), ...] best first; every query token must match."""
+        query = normalize(query)
+        tokens = query.split()
+        if not tokens:
+            return []
+        totals = None
+        # rarest tokens first keeps the running intersection small
+        for scores in sorted((self._token_scores(token) for token in dict.fromkeys(tokens)), key=len):
+            if totals is None:
+                totals = scores
+            else:
+                totals = {doc: total + scores[doc] for doc, total in totals.items() if doc in scores}
+            if not totals:
+                return []
+
+        ranked = []
+        coverage = len(tokens)
+        for doc, score in totals.items():
+            # prefer names the query covers fully: "railways" over "kahawa railways roundabout"
+            score += min(1.0, coverage / self.token_counts[doc])
+            for field, value in enumerate(self.fields[doc]):
+                if value == query:
+                    score += 2 * EXACT_SCORE * self.weights[field]
+                elif value.startswith(query):
+                    score += EXACT_SCORE * self.weights[field]
+            ranked.append((doc, score))
+        # ties go to shorter names, then to the original document order
+        rank = lambda item: (-item[1], self.lengths[item[0]], item[0])
+        if limit is not None:
+            return heapq.nsmallest(limit, ranked, key=rank)
+        ranked.sort(key=rank)
+        return ranked
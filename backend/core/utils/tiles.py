@@ -0,0 +1,218 @@
+"""Mapbox vector tiles (MVT) of stops and route shapes.
+
+Tiles use the XYZ Web Mercator scheme. Each tile holds a ``stops`` layer and
+a ``routes`` layer, thinned by zoom so that low zooms stay small:
+
+- stops appear from STOPS_MIN_ZOOM; below STOPS_FULL_ZOOM only the busiest
+  stop in each grid cell is kept, the grid halving with every zoom step;
+- shapes appear from SHAPES_MIN_ZOOM, simplified to one pixel at the tile's
+  zoom; below ROUTE_DETAIL_ZOOM only one shape per route is drawn.
+
+Rendered tiles are stored by feed version, on local disk (served without
+touching Redis) and in Redis (shared by every host). A new feed version
+starts a fresh cache, so tiles can be served with long browser/CDN lifetimes.
+"""
+import logging
+import math
+import os
+import tempfile
+
+import numpy as np
+from shapely import clip_by_rect
+from shapely.geometry import LineString, Point
+
+from core.utils.snapshot import prune_snapshots
+
+logger = logging.getLogger(__name__)
+
+EXTENT = 4096
+BUFFER = 64  # tile units drawn past each edge, so lines and markers join up across tiles
+MAX_TILE_ZOOM = 20
+MAX_LAT = 85.0511287798
+STOPS_MIN_ZOOM = int(os.getenv("TILE_STOPS_MIN_ZOOM", 11))
+STOPS_FULL_ZOOM = int(os.getenv("TILE_STOPS_FULL_ZOOM", 15))
+SHAPES_MIN_ZOOM = int(os.getenv("TILE_SHAPES_MIN_ZOOM", 8))
+ROUTE_DETAIL_ZOOM = int(os.getenv("TILE_ROUTE_DETAIL_ZOOM", 12))
+
+
+def check_tile(z, x, y):
+    if not 0 <= z <= MAX_TILE_ZOOM:
+        raise ValueError(f"Zoom must be between 0 and {MAX_TILE_ZOOM}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"Tile {x}/{y} is outside zoom {z}")
+
+
+def tiles_covering(west, south, east, north, z):
+    """(x, y) of every tile at zoom ``z`` meeting the box."""
+    n = 2 ** z
+
+    def column(lon):
+        return min(n - 1, max(0, int((lon + 180) / 360 * n)))
+
+    def row(lat):
+        lat = math.radians(min(MAX_LAT, max(-MAX_LAT, lat)))
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    for x in range(column(west), column(east) + 1):
+        for y in range(row(north), row(south) + 1):
+            yield x, y
+
+
+def tile_bounds(z, x, y, buffer=0):
+    """(west, south, east, north) in degrees, widened by ``buffer`` tile units."""
+    n = 2 ** z
+    pad = buffer / EXTENT
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x - pad) / n * 360 - 180, lat(y + 1 + pad), (x + 1 + pad) / n * 360 - 180, lat(y - pad)
+
+
+def project(lat, lon, z, x, y):
+    """Tile-local coordinates (0..EXTENT, y down) of lat/lon arrays."""
+    n = 2 ** z
+    lat = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MAX_LAT, MAX_LAT))
+    tx = ((np.asarray(lon, dtype=np.float64) + 180) / 360 * n - x) * EXTENT
+    ty = ((1 - np.arcsinh(np.tan(lat)) / np.pi) / 2 * n - y) * EXTENT
+    return tx, ty
+
+
+def stop_cell(z):
+    """Thinning grid cell in tile units at zoom ``z`` (0: keep every stop)."""
+    return 0 if z >= STOPS_FULL_ZOOM else EXTENT >> max(0, z - STOPS_MIN_ZOOM + 4)
+
+
+def thin_points(tx, ty, weight, cell):
+    """Indices of the heaviest point in each ``cell``-sized square, in input order."""
+    order = np.argsort(-np.asarray(weight), kind="stable")
+    rows = np.floor(ty[order] / cell).astype(np.int64)
+    cols = np.floor(tx[order] / cell).astype(np.int64)
+    _, first = np.unique(rows * (2 * EXTENT) + cols, return_index=True)
+    return np.sort(order[first])
+
+
+def stop_features(z, x, y, lat, lon, weight, properties):
+    if z < STOPS_MIN_ZOOM or not len(lat):
+        return []
+    tx, ty = project(lat, lon, z, x, y)
+    inside = (tx >= -BUFFER) & (tx <= EXTENT + BUFFER) & (ty >= -BUFFER) & (ty <= EXTENT + BUFFER)
+    keep = np.flatnonzero(inside)
+    cell = stop_cell(z)
+    if cell:
+        keep = keep[thin_points(tx[keep], ty[keep], np.asarray(weight)[keep], cell)]
+    return [
+        {"geometry": Point(round(tx[i]), round(ty[i])), "properties": properties[i]}
+        for i in keep.tolist()
+    ]
+
+
+def line_features(z, x, y, lines):
+    """Features for (lat, lon, properties) lines already simplified for ``z``, clipped to the tile."""
+    if z < SHAPES_MIN_ZOOM:
+        return []
+    if z < ROUTE_DETAIL_ZOOM:
+        # one shape per route, the most detailed
+        by_route = {}
+        for line in sorted(lines, key=lambda line: -len(line[0])):
+            by_route.setdefault(line[2].get("route_id"), line)
+        lines = list(by_route.values())
+    features = []
+    for lat, lon, properties in lines:
+        if len(lat) < 2:
+            continue
+        tx, ty = project(lat, lon, z, x, y)
+        clipped = clip_by_rect(LineString(np.column_stack((np.rint(tx), np.rint(ty)))),
+                               -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+        if not clipped.is_empty and clipped.length > 0:
+            features.append({"geometry": clipped, "properties": properties})
+    return features
+
+
+class TileEncoderUnavailable(RuntimeError):
+    """mapbox_vector_tile is not installed, so tiles cannot be rendered."""
+
+
+def encode_tile(layers):
+    """MVT bytes for {layer name: features}; empty layers are left out."""
+    try:
+        import mapbox_vector_tile  # only the tile endpoints and render_tiles need it
+    except ImportError as e:
+        raise TileEncoderUnavailable(f"Vector tiles need the mapbox-vector-tile package: {e}") from e
+
+    layers = [{"name": name, "features": features} for name, features in layers.items() if features]
+    if not layers:
+        return b""
+    return mapbox_vector_tile.encode(layers, default_options={"extents": EXTENT, "y_coord_down": True})
+
+
+class TileCache:
+    """Rendered tiles under ``root/<version>/<z>/<x>/<y>.mvt``, mirrored in Redis."""
+
+    def __init__(self, root, get_client, ttl, keep=3):
+        self.root = root
+        self.get_client = get_client
+        self.ttl = ttl
+        self.keep = keep
+        self.disk_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def path(self, version, z, x, y):
+        return os.path.join(self.root, version, str(z), str(x), f"{y}.mvt")
+
+    def key(self, version, z, x, y):
+        return f"tiles:{version}:{z}/{x}/{y}"
+
+    def get(self, version, z, x, y):
+        try:
+            with open(self.path(version, z, x, y), "rb") as f:
+                self.disk_hits += 1
+                return f.read()
+        except FileNotFoundError:
+            pass
+        client = self.get_client()
+        if client:
+            try:
+                data = client.get(self.key(version, z, x, y))
+            except Exception as e:
+                logger.error(f"Tile read error for {self.key(version, z, x, y)}: {e}")
+                data = None
+            if data is not None:
+                self.redis_hits += 1
+                self.write(version, z, x, y, data)
+                return data
+        self.misses += 1
+        return None
+
+    def put(self, version, z, x, y, data, shared=True):
+        self.write(version, z, x, y, data)
+        client = self.get_client() if shared else None
+        if client:
+            try:
+                client.set(self.key(version, z, x, y), data, ex=self.ttl)
+            except Exception as e:
+                logger.error(f"Failed to cache tile {self.key(version, z, x, y)}: {e}")
+
+    def write(self, version, z, x, y, data):
+        path = self.path(version, z, x, y)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(os.path.join(self.root, version)):
+            os.makedirs(directory, exist_ok=True)
+            prune_snapshots(self.root, keep=self.keep)
+        os.makedirs(directory, exist_ok=True)
+        # atomic, so a concurrent reader never sees half a tile
+        fd, staging = tempfile.mkstemp(prefix=".tile-", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(staging, path)
+
+    def get_or_render(self, version, z, x, y, render):
+        data = self.get(version, z, x, y)
+        if data is None:
+            data = render()
+            self.put(version, z, x, y, data)
+        return data
+
+    def stats(self):
+        return {"disk_hits": self.disk_hits, "redis_hits": self.redis_hits, "misses": self.misses}
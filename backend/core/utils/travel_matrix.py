@@ -0,0 +1,146 @@
+"""Many-to-many travel times: one one-to-all RAPTOR search per origin, spread over processes.
+
+Each row of the matrix is an independent TransitNetwork.reach() from one
+origin, so rows are computed in chunks on a process pool and scale with the
+number of cores. Pool workers load the feed once, through load_gtfs_data,
+from the current compiled snapshot, which maps its arrays read-only, so the
+feed's pages are shared by every worker and only the RAPTOR network's lists
+are built per process. Tasks carry stop indices in and an int32 block out.
+
+The pool is only used when that snapshot holds the caller's feed version;
+without one (or with a stale one) matrices are computed in the calling
+process, as they are when the pool breaks.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MATRIX_WORKERS = int(os.getenv("GTFS_MATRIX_WORKERS", os.cpu_count() or 1))
+# Below this many origins a matrix is computed in the calling process.
+MATRIX_PARALLEL_MIN_ORIGINS = int(os.getenv("GTFS_MATRIX_PARALLEL_MIN_ORIGINS", 16))
+MATRIX_MAX_MINUTES = int(os.getenv("GTFS_MATRIX_MAX_MINUTES", 180))
+CHUNKS_PER_WORKER = 4
+UNREACHABLE = -1
+
+_worker_feed = None
+
+
+def matrix_rows(gtfs_data, origins, destinations, depart_secs, deadline, max_transfers=2, pattern_trips=None):
+    """(origins, destinations) int32 travel seconds between stop indices; UNREACHABLE past ``deadline``."""
+    network = gtfs_data.network
+    destinations = np.asarray(destinations, dtype=np.int64)
+    rows = np.full((len(origins), len(destinations)), UNREACHABLE, dtype=np.int32)
+    times = np.full(len(gtfs_data.stop_ids), UNREACHABLE, dtype=np.int32)
+    for i, origin in enumerate(origins):
+        reached = network.reach(
+            {origin: depart_secs}, deadline, max_transfers=max_transfers, pattern_trips=pattern_trips,
+        )
+        stops = np.fromiter(reached, dtype=np.int64, count=len(reached))
+        times[stops] = np.fromiter((label[0] for label in reached.values()), dtype=np.int64, count=len(reached))
+        rows[i] = times[destinations]
+        rows[i][rows[i] >= 0] -= depart_secs
+        times[stops] = UNREACHABLE
+    return rows
+
+
+def running_pattern_trips(gtfs_data, day, strict_calendar):
+    running = gtfs_data.trips_running(day, strict=strict_calendar)
+    return None if running is None else gtfs_data.network.running_trips(day, running)
+
+
+def _init_worker(version):
+    import django
+
+    django.setup()
+    from core.utils.gtfs_utils import load_gtfs_data
+
+    global _worker_feed
+    _worker_feed = load_gtfs_data()
+    if _worker_feed.version != version:
+        raise RuntimeError(f"Matrix worker loaded feed {_worker_feed.version}, expected {version}; run compile_gtfs")
+    _worker_feed.network
+
+
+def _rows_task(origins, destinations, depart_secs, deadline, max_transfers, day, strict_calendar):
+    trips = running_pattern_trips(_worker_feed, day, strict_calendar)
+    return matrix_rows(_worker_feed, origins, destinations, depart_secs, deadline, max_transfers, trips)
+
+
+class MatrixPool:
+    """Process pool whose workers hold one feed version; replaced when the version changes."""
+
+    def __init__(self, workers=MATRIX_WORKERS):
+        self.workers = workers
+        self.version = None
+        self.pool = None
+        self._unpooled = None
+        self._lock = threading.Lock()
+
+    def executor(self, version):
+        """The pool for feed ``version``, or None when the compiled snapshot workers would open is another."""
+        from core.utils.gtfs_utils import compiled_version
+
+        with self._lock:
+            if self.pool is None or self.version != version:
+                compiled = compiled_version()
+                if compiled != version:
+                    if self._unpooled != version:
+                        self._unpooled = version
+                        logger.warning(
+                            f"Compiled snapshot is {compiled}, not feed {version}; "
+                            f"computing matrices in process. Run compile_gtfs."
+                        )
+                    return None
+                if self.pool is not None:
+                    self.pool.shutdown(wait=False, cancel_futures=True)
+                # spawn, not fork: the serving process may be running threads
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(version,),
+                )
+                self.version = version
+                logger.info(f"Starting a matrix pool of {self.workers} workers for feed {version}.")
+            return self.pool
+
+    def discard(self, pool):
+        """Drop a broken pool so the next call starts a new one."""
+        with self._lock:
+            if self.pool is pool:
+                self.pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def rows(self, gtfs_data, origins, destinations, depart_secs, deadline, max_transfers, day, strict_calendar):
+        """matrix_rows on the pool, in chunks of origins; small matrices stay in this process."""
+        pool = None
+        if self.workers > 1 and len(origins) >= MATRIX_PARALLEL_MIN_ORIGINS:
+            pool = self.executor(gtfs_data.version)
+        if pool is not None:
+            size = max(1, math.ceil(len(origins) / (self.workers * CHUNKS_PER_WORKER)))
+            try:
+                futures = [
+                    pool.submit(
+                        _rows_task, origins[lo:lo + size], destinations, depart_secs, deadline, max_transfers,
+                        day, strict_calendar,
+                    )
+                    for lo in range(0, len(origins), size)
+                ]
+                return np.vstack([future.result() for future in futures])
+            except BrokenProcessPool as e:
+                logger.error(f"Matrix pool for feed {gtfs_data.version} broke ({e}); computing in process.")
+                self.discard(pool)
+        trips = running_pattern_trips(gtfs_data, day, strict_calendar)
+        return matrix_rows(gtfs_data, origins, destinations, depart_secs, deadline, max_transfers, trips)
+
+    def shutdown(self):
+        with self._lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
@@ -1,27 +1,208 @@
-from django.http import JsonResponse
-from django.views.decorators.http import require_GET
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
 import json
+import os
+import threading
+from datetime import datetime
 
 from core.utils.gtfs_utils import (
     load_gtfs_data,
-    get_stops_gdf,
     build_spatial_index,
     find_nearest_stops,
     search_routes_by_name,
-    get_trip_stops,
-    get_routes_by_stop,
-    get_departure_board,
+    search_stops,
+    get_trips_stops,
+    get_routes_by_stops,
+    get_departure_boards,
     calculate_path,
-    get_stop_coordinates,
+    get_stops_coordinates,
+    get_stop_transfers,
+    get_trip_shape,
+    get_route_shapes,
+    get_route_stops,
+    get_vector_tile,
+    get_isochrone,
+    get_travel_matrix,
+    nearest_stops_cache,
+    redis_client,
+    response_cache,
+    tile_cache,
+    redis_stops_coordinates,
+    redis_routes_by_stops,
+    redis_trips_stops,
 )
+from core.utils.shapes import MAX_ZOOM
+from core.utils.tiles import TileEncoderUnavailable
 
-# Load GTFS data once when server starts
-gtfs_data = load_gtfs_data()
-stops_gdf = get_stops_gdf(gtfs_data)
-spatial_idx = build_spatial_index(stops_gdf)
+# GTFS_BACKEND=db answers the transit endpoints from the feed tables (see
+# core/utils/db_queries.py) instead of holding the feed in every worker.
+GTFS_BACKEND = os.getenv("GTFS_BACKEND", "memory")
+if GTFS_BACKEND == "db":
+    from core.utils.db_queries import (
+        DatabaseFeed,
+        find_nearest_stops,
+        search_routes_by_name,
+        search_stops,
+        get_trips_stops,
+        get_routes_by_stops,
+        get_departure_boards,
+        calculate_path,
+        get_stops_coordinates,
+        get_stop_transfers,
+        get_trip_shape,
+        get_route_shapes,
+        get_route_stops,
+        get_vector_tile,
+    )
+
+# Load GTFS data once when server starts, unless GTFS_PRELOAD=0: then stop- and
+# trip-level lookups are served from Redis and the feed loads on first real need.
+PRELOAD_FEED = os.getenv("GTFS_PRELOAD", "1") != "0"
+gtfs_data = None
+spatial_idx = None
+_feed_lock = threading.Lock()
+
+def get_gtfs_data():
+    global gtfs_data, spatial_idx
+    if gtfs_data is None:
+        with _feed_lock:
+            if gtfs_data is None and GTFS_BACKEND == "db":
+                gtfs_data = DatabaseFeed()
+            elif gtfs_data is None:
+                dataset = load_gtfs_data()
+                spatial_idx = build_spatial_index(dataset)
+                dataset.route_search_index
+                dataset.stop_search_index
+                gtfs_data = dataset
+    return gtfs_data
+
+if PRELOAD_FEED or GTFS_BACKEND == "db":
+    get_gtfs_data()
+
+def parse_request_datetime(date_str, time_str):
+    """Combine optional ``YYYY-MM-DD`` date and ``HH:MM[:SS]`` time params with now."""
+    now = datetime.now()
+    day = datetime.strptime(date_str, "%Y-%m-%d").date() if date_str else now.date()
+    if time_str:
+        fmt = "%H:%M:%S" if time_str.count(":") == 2 else "%H:%M"
+        clock = datetime.strptime(time_str, fmt).time()
+    else:
+        clock = now.time().replace(microsecond=0)
+    return datetime.combine(day, clock)
+
+MAX_BATCH_IDS = int(os.getenv("API_MAX_BATCH_IDS", 100))
+MAX_MATRIX_IDS = int(os.getenv("API_MAX_MATRIX_IDS", 1000))
+
+def parse_id_list(value, limit=MAX_BATCH_IDS):
+    """Split a comma-separated id list (or take a JSON list), dropping blanks and duplicates."""
+    ids = value.split(",") if isinstance(value, str) else list(value or [])
+    ids = list(dict.fromkeys(str(i).strip() for i in ids if str(i).strip()))
+    if len(ids) > limit:
+        raise ValueError(f"At most {limit} ids per request")
+    return ids
+
+# batch lookup -> the key holding its ids
+BATCH_LOOKUPS = {
+    "departure_board": "stop_ids",
+    "routes_by_stop": "stop_ids",
+    "stop_coordinates": "stop_ids",
+    "trip_stops": "trip_ids",
+}
+
+def parse_batch_body(request):
+    """{lookup: (ids, params)} from a batch request body, checking the shape of every section."""
+    body = json.loads(request.body or "{}")
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    unknown = set(body) - set(BATCH_LOOKUPS)
+    if unknown:
+        raise ValueError(f"Unknown lookups: {', '.join(sorted(unknown))}")
+    sections = {}
+    for name, params in body.items():
+        if not isinstance(params, dict):
+            raise ValueError(f"{name} must be an object")
+        key = BATCH_LOOKUPS[name]
+        if not isinstance(params.get(key, []), (list, str)):
+            raise ValueError(f"{name}.{key} must be a list of ids")
+        for field in ("date", "time"):
+            if not isinstance(params.get(field, ""), str):
+                raise ValueError(f"{name}.{field} must be a string")
+        sections[name] = parse_id_list(params.get(key)), params
+    return sections
+
+def parse_matrix_request(request):
+    """Travel matrix params from a JSON body (POST) or the query string (GET)."""
+    params = json.loads(request.body or "{}") if request.method == "POST" else request.GET
+    if request.method == "POST" and not isinstance(params, dict):
+        raise ValueError("Request body must be a JSON object")
+    origins = parse_id_list(params.get("origins"), limit=MAX_MATRIX_IDS)
+    destinations = parse_id_list(params.get("destinations"), limit=MAX_MATRIX_IDS)
+    if not origins or not destinations:
+        raise ValueError("origins and destinations required")
+    kwargs = {
+        "depart_at": parse_depart_at(params.get("depart_at"), params.get("date")),
+        "max_transfers": int(params.get("max_transfers", 2)),
+        "strict_calendar": has_service_date(params, "depart_at"),
+    }
+    if "max_minutes" in params:
+        kwargs["max_minutes"] = int(params["max_minutes"])
+        if kwargs["max_minutes"] <= 0:
+            raise ValueError("max_minutes must be positive")
+    return origins, destinations, kwargs
+
+def lookup_entities(redis_lookup, local_lookup, ids):
+    """id -> result, from Redis while the feed is not loaded in this process, else in memory."""
+    found = redis_lookup(ids) if gtfs_data is None else None
+    return found if found is not None else local_lookup(get_gtfs_data(), ids)
+
+def parse_depart_at(value, date_str=None):
+    """Accept an ISO datetime or a bare ``HH:MM[:SS]`` time on ``date_str`` (default today)."""
+    if not value:
+        return parse_request_datetime(date_str, None) if date_str else None
+    if "T" in value or "-" in value:
+        return datetime.fromisoformat(value)
+    return parse_request_datetime(date_str, value)
+
+def parse_positive_int(params, key, default):
+    """An optional integer param that must be at least 1; ``default`` when missing or blank."""
+    value = params.get(key)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = 0
+    if value <= 0:
+        raise ValueError(f"{key} must be a positive integer")
+    return value
+
+def has_service_date(params, key="date"):
+    """Whether the request names its service date, rather than meaning today.
+
+    Dated queries are filtered by the feed calendar even outside its period;
+    undated ones fall back to every trip when today is past the feed's end.
+    """
+    value = params.get(key) or ""
+    return bool(params.get("date")) or "T" in value or "-" in value
+
+def parse_isochrone_origin(params):
+    """A ``stop_id``, or a (lat, lon) point from ``lat`` and ``lon``."""
+    if params.get("stop_id"):
+        return params["stop_id"]
+    if params.get("lat") and params.get("lon"):
+        return float(params["lat"]), float(params["lon"])
+    raise ValueError("stop_id or lat and lon required")
+
+def parse_direction(value):
+    """Optional GTFS ``direction_id`` (0 or 1)."""
+    if value in (None, ""):
+        return None
+    if value not in ("0", "1"):
+        raise ValueError("direction_id must be 0 or 1")
+    return int(value)
 
 @require_GET
 def get_nearby_stops(request):
@@ -29,7 +210,9 @@ def get_nearby_stops(request):
         lat = float(request.GET.get("lat"))
         lon = float(request.GET.get("lon"))
         radius = float(request.GET.get("radius", 1.0))
-        nearby = find_nearest_stops((lat, lon), stops_gdf, spatial_idx, radius_km=radius)
+        k = parse_positive_int(request.GET, "k", None)
+        limit = parse_positive_int(request.GET, "limit", None)
+        nearby = find_nearest_stops((lat, lon), get_gtfs_data(), spatial_idx, radius_km=radius, k=k, limit=limit)
         return JsonResponse({"stops": nearby})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
@@ -40,52 +223,251 @@ def route_search(request):
         query = request.GET.get("q", "")
         if not query:
             return JsonResponse({"error": "Missing query string"}, status=400)
-        matches = search_routes_by_name(gtfs_data, query)
+        limit = parse_positive_int(request.GET, "limit", 20)
+        matches = search_routes_by_name(get_gtfs_data(), query, limit=limit)
         return JsonResponse({"routes": matches})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@require_GET
+def stop_search(request):
+    try:
+        query = request.GET.get("q", "")
+        if not query:
+            return JsonResponse({"error": "Missing query string"}, status=400)
+        limit = parse_positive_int(request.GET, "limit", 10)
+        near = None
+        if request.GET.get("lat") and request.GET.get("lon"):
+            near = (float(request.GET["lat"]), float(request.GET["lon"]))
+        stops = search_stops(get_gtfs_data(), query, near=near, limit=limit)
+        return JsonResponse({"stops": stops})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 @require_GET
 def trip_stops(request):
     try:
+        trip_ids = parse_id_list(request.GET.get("trip_ids", ""))
+        if trip_ids:
+            return JsonResponse({"stops_by_trip": lookup_entities(redis_trips_stops, get_trips_stops, trip_ids)})
         trip_id = request.GET.get("trip_id")
         if not trip_id:
             return JsonResponse({"error": "trip_id required"}, status=400)
-        stops = get_trip_stops(gtfs_data, trip_id)
+        stops = lookup_entities(redis_trips_stops, get_trips_stops, [trip_id])[trip_id]
         return JsonResponse({"stops": stops})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 @require_GET
 def stop_routes(request):
     try:
+        stop_ids = parse_id_list(request.GET.get("stop_ids", ""))
+        if stop_ids:
+            return JsonResponse({"routes_by_stop": lookup_entities(redis_routes_by_stops, get_routes_by_stops, stop_ids)})
         stop_id = request.GET.get("stop_id")
         if not stop_id:
             return JsonResponse({"error": "stop_id required"}, status=400)
-        routes = get_routes_by_stop(gtfs_data, stop_id)
+        routes = lookup_entities(redis_routes_by_stops, get_routes_by_stops, [stop_id])[stop_id]
         return JsonResponse({"routes": routes})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+def departure_boards(stop_ids, params):
+    at = parse_request_datetime(params.get("date"), params.get("time"))
+    window = parse_positive_int(params, "window", 30)
+    limit = parse_positive_int(params, "limit", 10)
+    return get_departure_boards(
+        get_gtfs_data(), stop_ids, time_window=window, at=at, limit=limit, strict_calendar=has_service_date(params),
+    )
+
 @require_GET
 def stop_board(request):
     try:
+        stop_ids = parse_id_list(request.GET.get("stop_ids", ""))
+        if stop_ids:
+            return JsonResponse({"departures_by_stop": departure_boards(stop_ids, request.GET)})
         stop_id = request.GET.get("stop_id")
         if not stop_id:
             return JsonResponse({"error": "stop_id required"}, status=400)
-        board = get_departure_board(gtfs_data, stop_id)
-        return JsonResponse({"departures": board})
+        return JsonResponse({"departures": departure_boards([stop_id], request.GET)[stop_id]})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 @require_GET
 def stop_coordinates(request):
     try:
+        stop_ids = parse_id_list(request.GET.get("stop_ids", ""))
+        if stop_ids:
+            return JsonResponse({"stops": lookup_entities(redis_stops_coordinates, get_stops_coordinates, stop_ids)})
         stop_id = request.GET.get("stop_id")
         if not stop_id:
             return JsonResponse({"error": "stop_id required"}, status=400)
-        coords = get_stop_coordinates(gtfs_data, stop_id)
+        coords = lookup_entities(redis_stops_coordinates, get_stops_coordinates, [stop_id])[stop_id]
         return JsonResponse({"stop": coords})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@csrf_exempt
+@require_POST
+def batch(request):
+    """Several lookups in one round trip.
+
+    Body: {"departure_board": {"stop_ids": [...], "time": ..., "window": ...},
+    "routes_by_stop": {"stop_ids": [...]}, "stop_coordinates": {"stop_ids": [...]},
+    "trip_stops": {"trip_ids": [...]}}; any subset. Each answer is keyed by id.
+    """
+    try:
+        sections = parse_batch_body(request)
+        results = {}
+        if "departure_board" in sections:
+            stop_ids, params = sections["departure_board"]
+            results["departure_board"] = departure_boards(stop_ids, params)
+        if "routes_by_stop" in sections:
+            stop_ids, _ = sections["routes_by_stop"]
+            results["routes_by_stop"] = lookup_entities(redis_routes_by_stops, get_routes_by_stops, stop_ids)
+        if "stop_coordinates" in sections:
+            stop_ids, _ = sections["stop_coordinates"]
+            results["stop_coordinates"] = lookup_entities(redis_stops_coordinates, get_stops_coordinates, stop_ids)
+        if "trip_stops" in sections:
+            trip_ids, _ = sections["trip_stops"]
+            results["trip_stops"] = lookup_entities(redis_trips_stops, get_trips_stops, trip_ids)
+        return JsonResponse(results)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@require_GET
+def stop_transfers(request):
+    try:
+        stop_id = request.GET.get("stop_id")
+        if not stop_id:
+            return JsonResponse({"error": "stop_id required"}, status=400)
+        transfers = get_stop_transfers(get_gtfs_data(), stop_id)
+        if transfers is None:
+            return JsonResponse({"error": f"Unknown stop {stop_id}"}, status=404)
+        return JsonResponse({"transfers": transfers})
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@require_GET
+def trip_shape(request):
+    try:
+        trip_id = request.GET.get("trip_id")
+        if not trip_id:
+            return JsonResponse({"error": "trip_id required"}, status=400)
+        shape = get_trip_shape(get_gtfs_data(), trip_id, zoom=int(request.GET.get("zoom", MAX_ZOOM)))
+        if shape is None:
+            return JsonResponse({"error": f"Unknown trip {trip_id}"}, status=404)
+        return JsonResponse(shape)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@require_GET
+def route_shape(request):
+    try:
+        route_id = request.GET.get("route_id")
+        if not route_id:
+            return JsonResponse({"error": "route_id required"}, status=400)
+        shapes = get_route_shapes(get_gtfs_data(), route_id, zoom=int(request.GET.get("zoom", MAX_ZOOM)))
+        if shapes is None:
+            return JsonResponse({"error": f"Unknown route {route_id}"}, status=404)
+        return JsonResponse(shapes)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@require_GET
+def route_stops(request):
+    try:
+        route_id = request.GET.get("route_id")
+        if not route_id:
+            return JsonResponse({"error": "route_id required"}, status=400)
+        found = get_route_stops(get_gtfs_data(), route_id, direction=parse_direction(request.GET.get("direction_id")))
+        if found is None:
+            return JsonResponse({"error": f"Unknown route {route_id}"}, status=404)
+        return JsonResponse(found)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+# Tiles are keyed by feed version in their ETag, so browsers and CDNs can keep them.
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", 24 * 3600))
+
+@require_GET
+def vector_tile(request, z, x, y):
+    try:
+        gtfs_data = get_gtfs_data()
+        etag = f'"{gtfs_data.version}-{z}-{x}-{y}"'
+        if request.headers.get("If-None-Match") == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(get_vector_tile(gtfs_data, z, x, y), content_type=MVT_CONTENT_TYPE)
+        response["ETag"] = etag
+        response["Cache-Control"] = f"public, max-age={TILE_MAX_AGE}"
+        return response
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except TileEncoderUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=501)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@require_GET
+def isochrone(request):
+    try:
+        if GTFS_BACKEND != "memory":
+            return JsonResponse({"error": "isochrone needs GTFS_BACKEND=memory"}, status=501)
+        origin = parse_isochrone_origin(request.GET)
+        found = get_isochrone(
+            get_gtfs_data(),
+            origin=origin,
+            minutes=int(request.GET.get("minutes", 30)),
+            depart_at=parse_depart_at(request.GET.get("depart_at"), request.GET.get("date")),
+            polygon=request.GET.get("polygon", "0") == "1",
+            max_transfers=int(request.GET.get("max_transfers", 2)),
+            strict_calendar=has_service_date(request.GET, "depart_at"),
+        )
+        if found is None:
+            return JsonResponse({"error": f"Unknown stop {origin}"}, status=404)
+        return JsonResponse(found)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def travel_matrix(request):
+    """Travel seconds between every origin and destination stop.
+
+    GET ?origins=a,b&destinations=c,d or a POST JSON body with lists, plus
+    optional depart_at, date, max_minutes and max_transfers.
+    """
+    try:
+        if GTFS_BACKEND != "memory":
+            return JsonResponse({"error": "travel_matrix needs GTFS_BACKEND=memory"}, status=501)
+        origins, destinations, kwargs = parse_matrix_request(request)
+        return JsonResponse(get_travel_matrix(get_gtfs_data(), origins, destinations, **kwargs))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -96,11 +478,29 @@ def find_path(request):
         end = request.GET.get("end_stop")
         if not start or not end:
             return JsonResponse({"error": "start_stop and end_stop required"}, status=400)
-        path = calculate_path(gtfs_data, start, end)
-        return JsonResponse({"path": path})
+        depart_at = parse_depart_at(request.GET.get("depart_at"), request.GET.get("date"))
+        max_transfers = int(request.GET.get("max_transfers", 2))
+        itineraries = calculate_path(
+            get_gtfs_data(), start, end, depart_at=depart_at, max_transfers=max_transfers,
+            strict_calendar=has_service_date(request.GET, "depart_at"),
+        )
+        # "path" keeps the old flat stop list, taken from the fastest itinerary
+        path = [stop for leg in itineraries[-1]["legs"] for stop in leg.get("stops", [])] if itineraries else []
+        return JsonResponse({"itineraries": itineraries, "path": path})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
     
+@require_GET
+def cache_stats(request):
+    return JsonResponse({
+        "nearest_stops": nearest_stops_cache.stats(),
+        "responses": response_cache.stats(),
+        "redis": redis_client.stats(),
+        "tiles": tile_cache.stats(),
+    })
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -1,51 +1,108 @@
 # generate_gtfs_sql_insert_script.py
+#
+# Writes a SQL load script for the GTFS feed, one table per .txt file. Rows
+# are streamed straight from each CSV to the output, so memory stays flat
+# whatever the feed size. Two output formats:
+#   copy    PostgreSQL COPY ... FROM STDIN blocks (load with psql)
+#   insert  multi-row INSERT statements of --batch-size rows (any client)
+# The script runs in a single transaction, with tables in dependency order.
 
+import argparse
 import csv
+import gzip
 import os
+import time
 
 DATA_DIR = "./backend/data/gtfs"
 OUTPUT_FILE = "gtfs_insert_statements.sql.txt"
 
+# Parents before the tables that reference them; files not listed follow alphabetically.
+TABLE_ORDER = [
+    "agency", "stops", "routes", "trips", "stop_times",
+    "calendar", "calendar_dates", "frequencies", "shapes", "feed_info",
+]
+
+def is_null(value):
+    return value is None or value == "" or value.upper() == "NULL"
+
 def escape_value(value):
-    if value == "":
-        return "NULL"
-    if value.upper() == "NULL":
+    if is_null(value):
         return "NULL"
     escaped = value.replace("'", "''")
     # Escape single quotes for SQL
     return f"'{escaped}'"
 
-def process_file(file_path, table_name):
-    inserts = []
-    with open(file_path, newline='', encoding='utf-8') as f:
+def escape_copy_value(value):
+    if is_null(value):
+        return "\\N"
+    # COPY text format: backslash, tab and line breaks must be escaped
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def ordered_tables(data_dir):
+    names = [os.path.splitext(f)[0] for f in os.listdir(data_dir) if f.endswith(".txt")]
+    rank = {name: i for i, name in enumerate(TABLE_ORDER)}
+    return sorted(names, key=lambda name: (rank.get(name, len(TABLE_ORDER)), name))
+
+def write_copy(reader, table_name, out):
+    out.write(f"COPY {table_name} ({', '.join(reader.fieldnames)}) FROM STDIN;\n")
+    rows = 0
+    for row in reader:
+        out.write("\t".join(escape_copy_value(value) for value in row.values()) + "\n")
+        rows += 1
+    out.write("\\.\n\n")
+    return rows
+
+def write_inserts(reader, table_name, out, batch_size):
+    head = f"INSERT INTO {table_name} ({', '.join(reader.fieldnames)}) VALUES\n"
+    rows = 0
+    for row in reader:
+        values = ", ".join(escape_value(value) for value in row.values())
+        out.write((head if rows % batch_size == 0 else ",\n") + f"({values})")
+        rows += 1
+        if rows % batch_size == 0:
+            out.write(";\n")
+    if rows % batch_size:
+        out.write(";\n")
+    out.write("\n")
+    return rows
+
+def process_file(file_path, table_name, out, fmt, batch_size):
+    with open(file_path, newline='', encoding='utf-8-sig') as f:
         reader = csv.DictReader(f)
-        for row in reader:
-            columns = ', '.join(row.keys())
-            values = ', '.join(escape_value(value) for value in row.values())
-            insert_stmt = f"INSERT INTO {table_name} ({columns}) VALUES ({values});"
-            inserts.append(insert_stmt)
-    return inserts
+        if not reader.fieldnames:
+            return 0
+        if fmt == "copy":
+            return write_copy(reader, table_name, out)
+        return write_inserts(reader, table_name, out, batch_size)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a SQL load script from the GTFS .txt files.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Output path; a .gz suffix implies --gzip")
+    parser.add_argument("--format", choices=["insert", "copy"], default="insert")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT statement")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    return parser.parse_args()
 
 def main():
-    all_inserts = []
-
-    for filename in os.listdir(DATA_DIR):
-        if filename.endswith(".txt"):
-            table_name = os.path.splitext(filename)[0]  # e.g. routes.txt → routes
-            file_path = os.path.join(DATA_DIR, filename)
-            print(f"Processing {filename} → table {table_name}")
-            try:
-                inserts = process_file(file_path, table_name)
-                all_inserts.extend(inserts)
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    # Write all insert statements to a .sql.txt file
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out_file:
-        for stmt in all_inserts:
-            out_file.write(stmt + "\n")
-
-    print(f"\n✅ Done. SQL statements written to: {OUTPUT_FILE}")
+    args = parse_args()
+    output = args.output
+    if args.gzip and not output.endswith(".gz"):
+        output += ".gz"
+    opener = gzip.open if output.endswith(".gz") else open
+
+    started = time.perf_counter()
+    total = 0
+    with opener(output, "wt", encoding="utf-8", newline="\n") as out_file:
+        out_file.write("BEGIN;\n\n")
+        for table_name in ordered_tables(args.data_dir):
+            file_path = os.path.join(args.data_dir, f"{table_name}.txt")
+            rows = process_file(file_path, table_name, out_file, args.format, args.batch_size)
+            total += rows
+            print(f"Processing {table_name}.txt → table {table_name}: {rows} rows")
+        out_file.write("COMMIT;\n")
+
+    print(f"\n✅ Done. {total} rows ({args.format}) written to: {output} in {time.perf_counter() - started:.2f}s")
 
 if __name__ == "__main__":
     main()